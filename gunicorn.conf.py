@@ -0,0 +1,9 @@
+# gunicorn.conf.py
+# Read by gunicorn from the working directory
+
+
+def post_worker_init(worker):
+    """Parse the plan workbook once the worker has loaded Django, before its first request"""
+    from sales_app.plans import warm_plan_store
+
+    warm_plan_store()
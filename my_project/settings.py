@@ -351,17 +351,24 @@ if IS_RENDER:
     DASHBOARD_MAX_CATEGORIES = 8
     DASHBOARD_USE_APPROXIMATION = True
     DASHBOARD_SAMPLE_SIZE = 0.1  # Use 10% sample for estimates
+    DASHBOARD_QUERY_WORKERS = 2  # Parallel dashboard queries per page load (DB connections)
 else:
     DASHBOARD_MAX_PRODUCTS = 100
     DASHBOARD_MAX_CATEGORIES = 10
     DASHBOARD_USE_APPROXIMATION = False
     DASHBOARD_SAMPLE_SIZE = 1.0
+    DASHBOARD_QUERY_WORKERS = 4
 
 # Cache timeout settings
 CACHE_TIMEOUT_SHORT = 900      # 15 minutes
 CACHE_TIMEOUT_MEDIUM = 1800    # 30 minutes
 CACHE_TIMEOUT_LONG = 3600      # 1 hour
 
+# SQL query console limits
+QUERY_CONSOLE_PAGE_SIZE = 500                # Preview rows per page (100/500/1000/5000 offered)
+QUERY_CONSOLE_TIMEOUT_MS = 60000             # statement_timeout of a preview (PostgreSQL)
+QUERY_CONSOLE_EXPORT_TIMEOUT_MS = 300000     # statement_timeout of each export fetch
+
 if ENVIRONMENT == "production" or IS_RENDER:
     REDIS_URL = os.environ.get("REDIS_URL")
     
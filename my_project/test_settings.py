@@ -0,0 +1,13 @@
+"""
+Settings for the test suite:
+
+    python manage.py test sales_app --settings=my_project.test_settings
+
+The sales_app migrations are not run: 0002/0003 build indexes on the
+unmanaged sales_main_web table, which a test database doesn't have. The
+test database gets the managed tables straight from the models instead,
+and the tests create sales_main_web themselves.
+"""
+from my_project.settings import *  # noqa: F401,F403
+
+MIGRATION_MODULES = {'sales_app': None}
@@ -18,10 +18,11 @@ from django.contrib import admin
 from django.urls import path, include
 from sales_app.views import dashboard  # Make sure this import is here!
 from sales_app import views
-from sales_app.admin_upload_view import admin_upload  # ADD THIS LINE - Import the admin_upload view
+from sales_app.admin_upload_view import admin_upload, admin_plan_upload  # ADD THIS LINE - Import the admin_upload view
 
 urlpatterns = [
     path('admin/upload/', admin_upload, name='admin_upload'),  # Custom route - check first
+    path('admin/upload/plan/', admin_plan_upload, name='admin_plan_upload'),
     path('admin/', admin.site.urls),  # Django admin - catches everything else  
     path('i18n/', include('django.conf.urls.i18n')),
     # Authentication
@@ -34,7 +35,10 @@ urlpatterns = [
     path('another/', views.plan_workflow, name='another'),
     path('employees/', views.employee_analytics, name='employee_analytics'),
     path('query/', views.query, name='query'),
+    path('query/cancel/', views.query_cancel, name='query_cancel'),
     path('export/csv/', views.export_location_csv, name='export_location_csv'),
+    path('export/jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('export/jobs/<int:job_id>/download/', views.job_download, name='job_download'),
     path('insights/', views.insights, name='insights'),
     path('hypothesis_testing_me_/', views.stat_main, name='stat_main'),
     path('api/filter-options/', views.get_filter_options, name='get_filter_options'),
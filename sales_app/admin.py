@@ -42,4 +42,36 @@ class UserProfileAdmin(admin.ModelAdmin):
         if len(obj.allowed_locations) <= 3:
             return ", ".join(obj.allowed_locations)
         return f"{', '.join(obj.allowed_locations[:3])}... (+{len(obj.allowed_locations)-3} more)"
-    locations_preview.short_description = 'Assigned Locations'
\ No newline at end of file
+    locations_preview.short_description = 'Assigned Locations'
+
+from .models import BackgroundJob
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'created_by', 'created_at', 'finished_at', 'attempts', 'result_name']
+    list_filter = ['status', 'kind']
+    exclude = ['result']
+    readonly_fields = ['created_at', 'started_at', 'heartbeat_at', 'finished_at', 'attempts', 'error', 'result_name', 'result_content_type']
+    
+    def get_queryset(self, request):
+        # Finished files can be large - never load them for the admin pages
+        return super().get_queryset(request).defer('result')
+
+
+from .models import PlanVersion
+from .plans import activate_plan_version
+
+@admin.register(PlanVersion)
+class PlanVersionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'file_name', 'is_active', 'row_count', 'uploaded_by', 'uploaded_at']
+    readonly_fields = ['file_name', 'sha1', 'row_count', 'is_active', 'uploaded_by', 'uploaded_at']
+    actions = ['make_active']
+    
+    @admin.action(description='Make the selected version the active plan')
+    def make_active(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one plan version.", level='error')
+            return
+        version = queryset.get()
+        activate_plan_version(version)
+        self.message_user(request, f"Plan version {version.id} is now active.")
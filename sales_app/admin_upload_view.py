@@ -4,10 +4,16 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden, JsonResponse
 from django.contrib import messages
-from django.db import transaction, connection
-from django.utils import timezone
+from django.db import connection
 from datetime import datetime, date
-from sales_app.models import Sales
+from sales_app.models import Sales, PlanVersion
+from sales_app.loaders import normalize_sales_frame, replace_sales_range
+from sales_app.rollups import refresh_rollups
+from sales_app.decorators import invalidate_fragments
+from sales_app.facets import invalidate_facets
+from sales_app.insight_report import invalidate_insights
+from sales_app.jobs import enqueue_job_once, INSIGHTS_JOB
+from sales_app.plans import create_plan_version
 from django.db.models import Max, Min, Count
 
 @login_required
@@ -119,94 +125,48 @@ def admin_upload(request):
                             'is_admin': user_profile.is_admin,
                         })
                     
-                    # DEDUPLICATION: Remove existing records in this date range
-                    with transaction.atomic():
-                        # Delete existing records in date range
-                        deleted_count = Sales.objects.filter(
-                            cd__gte=timezone.make_aware(datetime.combine(start_date, datetime.min.time())),
-                            cd__lte=timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
-                        ).delete()[0]
-                        
-                        # Prepare data for bulk insert
-                        records_to_insert = []
-                        
-                        for _, row in date_filtered_df.iterrows():
-                            # Ensure IdReal1 is the primary key
-                            if 'IdReal1' not in row and 'idreal1' not in row:
-                                error_message = "PKL file must contain 'IdReal1' or 'idreal1' column as primary key"
-                                raise ValueError(error_message)
-                            
-                            # Normalize column names to match model
-                            record_data = {}
-                            for col in df.columns:
-                                col_lower = col.lower()
-                                if col_lower == 'idreal1':
-                                    record_data['idreal1'] = row[col]
-                                elif col_lower == 'zedd':
-                                    record_data['zedd'] = row[col]
-                                elif col_lower == 'cd':
-                                    # Make timezone-aware
-                                    cd_value = row[col]
-                                    if pd.notna(cd_value):
-                                        if isinstance(cd_value, pd.Timestamp):
-                                            cd_value = cd_value.to_pydatetime()
-                                        if timezone.is_naive(cd_value):
-                                            cd_value = timezone.make_aware(cd_value)
-                                    record_data['cd'] = cd_value
-                                elif col_lower == 'un':
-                                    record_data['un'] = row[col]
-                                elif col_lower == 'idtanam':
-                                    record_data['idtanam'] = row[col] if pd.notna(row[col]) else None
-                                elif col_lower == 'idprod':
-                                    record_data['idprod'] = row[col]
-                                elif col_lower == 'idactions':
-                                    record_data['idactions'] = row[col]
-                                elif col_lower == 'raod':
-                                    record_data['raod'] = float(row[col]) if pd.notna(row[col]) else None
-                                elif col_lower == 'discount_price':
-                                    record_data['discount_price'] = float(row[col]) if pd.notna(row[col]) else None
-                                elif col_lower == 'sachuqari':
-                                    record_data['sachuqari'] = float(row[col]) if pd.notna(row[col]) else None
-                                elif col_lower == 'std_price':
-                                    record_data['std_price'] = float(row[col]) if pd.notna(row[col]) else None
-                                elif col_lower == 'tanxa':
-                                    record_data['tanxa'] = float(row[col]) if pd.notna(row[col]) else None
-                                elif col_lower == 'prod':
-                                    record_data['prod'] = row[col]
-                                elif col_lower == 'idprodt':
-                                    record_data['idprodt'] = row[col] if pd.notna(row[col]) else None
-                                elif col_lower == 'idprodg':
-                                    record_data['idprodg'] = row[col] if pd.notna(row[col]) else None
-                                elif col_lower == 'desc1':
-                                    record_data['desc1'] = row[col]
-                                elif col_lower == 'prodt':
-                                    record_data['prodt'] = row[col]
-                                elif col_lower == 'prodg':
-                                    record_data['prodg'] = row[col]
-                                elif col_lower == 'actions':
-                                    record_data['actions'] = row[col]
-                                elif col_lower == 'tanam':
-                                    record_data['tanam'] = row[col]
-                            
-                            records_to_insert.append(Sales(**record_data))
-                        
-                        # Bulk insert
-                        Sales.objects.bulk_create(records_to_insert, batch_size=1000)
-                        
-                        inserted_count = len(records_to_insert)
-                        
-                        upload_stats = {
-                            'total_in_file': total_rows,
-                            'date_range_records': len(date_filtered_df),
-                            'deleted_existing': deleted_count,
-                            'inserted_new': inserted_count,
-                            'start_date': start_date.strftime('%Y-%m-%d'),
-                            'end_date': end_date.strftime('%Y-%m-%d'),
-                            'success': True
-                        }
-                        
-                        messages.success(request, 
-                            f"Successfully uploaded! Deleted {deleted_count} existing records, inserted {inserted_count} new records for {start_date} to {end_date}.")
+                    # Normalize columns up front (vectorized) so a bad file fails before the delete
+                    records = normalize_sales_frame(date_filtered_df)
+                    
+                    # DEDUPLICATION: Replace existing records in this date range.
+                    # The file is loaded into a staging table first; only the final
+                    # clear (DELETE, or TRUNCATE of whole month partitions) +
+                    # INSERT ... SELECT runs in a (short) transaction.
+                    replaced = replace_sales_range(records, start_date, end_date)
+                    deleted_count = replaced['deleted']
+                    inserted_count = replaced['inserted']
+                    load = replaced['load']
+                    
+                    upload_stats = {
+                        'total_in_file': total_rows,
+                        'date_range_records': len(date_filtered_df),
+                        'deleted_existing': deleted_count,
+                        'inserted_new': inserted_count,
+                        'start_date': start_date.strftime('%Y-%m-%d'),
+                        'end_date': end_date.strftime('%Y-%m-%d'),
+                        'load_seconds': round(load['seconds'], 2),
+                        'rows_per_sec': round(load['rows_per_sec']),
+                        'load_method': load['method'],
+                        'swap_seconds': round(replaced['swap_seconds'], 2),
+                        'success': True
+                    }
+                    
+                    messages.success(request, 
+                        f"Successfully uploaded! Deleted {deleted_count} existing records, inserted {inserted_count} new records for {start_date} to {end_date}.")
+                    
+                    # Keep the dashboard's pre-aggregated tables in step with the new rows
+                    rollup_counts = refresh_rollups(start_date, end_date)
+                    upload_stats['rollup_rows'] = rollup_counts['daily_rollup_rows']
+                    upload_stats['ticket_rows'] = rollup_counts['ticket_rows']
+                    upload_stats['employee_rows'] = rollup_counts['employee_rows']
+                    
+                    # Drop cached dashboard blocks and filter options that read the re-uploaded months
+                    invalidate_fragments(start_date, end_date)
+                    invalidate_facets(start_date, end_date)
+                    
+                    # Stored insights of the re-uploaded years are rebuilt by the job worker
+                    invalidate_insights(start_date, end_date)
+                    enqueue_job_once(INSIGHTS_JOB, {}, request.user)
                 
                 else:
                     error_message = "Both start date and end date are required for deduplication"
@@ -229,6 +189,60 @@ def admin_upload(request):
         'upload_stats': upload_stats,
         'error_message': error_message,
         'existing_data_range': existing_data_range,
+        'plan_versions': PlanVersion.objects.select_related('uploaded_by')[:5],
+        'user_profile': user_profile,
+        'is_admin': user_profile.is_admin,
+    }
+    
+    return render(request, 'admin_upload.html', context)
+
+
+@login_required
+def admin_plan_upload(request):
+    """
+    Admin-only upload of the plan workbook ('Main' sheet). Every upload is
+    stored as a new PlanVersion and becomes the plan plan_workflow reads.
+    """
+    try:
+        user_profile = request.user.profile
+    except:
+        return HttpResponseForbidden("Access denied. Contact administrator.")
+    
+    # ADMIN ONLY
+    if not user_profile.is_admin:
+        return HttpResponseForbidden("Only administrators can access the data upload interface.")
+    
+    plan_error_message = None
+    
+    if request.method == 'POST':
+        plan_file = request.FILES.get('plan_file')
+        
+        if not plan_file:
+            plan_error_message = "Please choose a plan workbook to upload"
+        elif not plan_file.name.endswith('.xlsx'):
+            plan_error_message = "Please upload a valid .xlsx file"
+        else:
+            try:
+                version = create_plan_version(plan_file.read(), plan_file.name, request.user)
+                messages.success(request,
+                    f"Plan uploaded! Version {version.id} with {version.row_count} rows is now active.")
+            except ValueError as e:
+                plan_error_message = f"Plan Error: {str(e)}"
+            except Exception as e:
+                plan_error_message = f"Upload Error: {str(e)}"
+                import traceback
+                traceback.print_exc()
+    
+    existing_data_range = Sales.objects.aggregate(
+        min_date=Min('cd'),
+        max_date=Max('cd'),
+        total_records=Count('idreal1')
+    )
+    
+    context = {
+        'plan_error_message': plan_error_message,
+        'existing_data_range': existing_data_range,
+        'plan_versions': PlanVersion.objects.select_related('uploaded_by')[:5],
         'user_profile': user_profile,
         'is_admin': user_profile.is_admin,
     }
@@ -0,0 +1,102 @@
+# sales_app/dates.py
+# Date range helpers that keep "CD" predicates sargable (index + partition friendly)
+
+from datetime import date, datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def day_start(day):
+    """Aware datetime at 00:00 of ``day`` in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    """First day of the month after ``day``"""
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def iter_months(start_date, end_date):
+    """First day of every month touching [start_date, end_date]"""
+    month = month_start(start_date)
+    while month <= end_date:
+        yield month
+        month = next_month(month)
+
+
+def same_day_in_year(day, year):
+    """``day`` moved to ``year``; Feb 29 becomes Feb 28 in non-leap years"""
+    try:
+        return day.replace(year=year)
+    except ValueError:
+        return day.replace(year=year, day=28)
+
+
+class DateWindow:
+    """
+    The calendar days [start_date, end_date], both inclusive, as half-open
+    predicates:
+
+        "CD" >= <start_date 00:00> AND "CD" < <day after end_date 00:00>
+
+    Never filter on the year of "CD" (``__year`` lookups, EXTRACT) next to
+    or instead of a window: the plain range is what lets Postgres use the
+    ("CD", "UN") indexes and prune monthly partitions.
+    """
+
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+
+    @classmethod
+    def for_year(cls, year):
+        return cls(date(year, 1, 1), date(year, 12, 31))
+
+    def __repr__(self):
+        return f'DateWindow({self.start_date}, {self.end_date})'
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, DateWindow)
+            and (self.start_date, self.end_date) == (other.start_date, other.end_date)
+        )
+
+    def __hash__(self):
+        return hash((self.start_date, self.end_date))
+
+    @property
+    def start(self):
+        """Aware datetime of the first instant in the window"""
+        return day_start(self.start_date)
+
+    @property
+    def end(self):
+        """Aware datetime of the first instant after the window (exclusive)"""
+        return day_start(self.end_date + timedelta(days=1))
+
+    def in_year(self, year):
+        """The same days of the calendar in another year"""
+        return DateWindow(same_day_in_year(self.start_date, year), same_day_in_year(self.end_date, year))
+
+    def clamp(self, other):
+        """Days in both windows (start after end when they don't overlap, which matches nothing)"""
+        return DateWindow(max(self.start_date, other.start_date), min(self.end_date, other.end_date))
+
+    def lookups(self, field='cd'):
+        """Filter kwargs for a datetime column"""
+        return {f'{field}__gte': self.start, f'{field}__lt': self.end}
+
+    def day_lookups(self, field='day'):
+        """Filter kwargs for a date column (rollup / ticket summary ``day``)"""
+        return {f'{field}__gte': self.start_date, f'{field}__lt': self.end_date + timedelta(days=1)}
+
+    def q(self, field='cd'):
+        return Q(**self.lookups(field))
+
+    def day_q(self, field='day'):
+        return Q(**self.day_lookups(field))
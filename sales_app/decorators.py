@@ -3,9 +3,13 @@
 
 import hashlib
 import json
+import logging
 from functools import wraps
+from django.conf import settings
 from django.core.cache import cache
 
+logger = logging.getLogger(__name__)
+
 
 def cache_dashboard_view(timeout=900):
     """
@@ -64,4 +68,77 @@ def cache_dashboard_view(timeout=900):
             return response
         
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+# ============================================================================
+# FRAGMENT CACHE - individual dashboard blocks keyed by the filter tuple
+# ============================================================================
+
+def _month_version_keys(date_ranges):
+    """One version key per calendar month touched by any of the date ranges"""
+    keys = []
+    for start_date, end_date in date_ranges:
+        year, month = start_date.year, start_date.month
+        while (year, month) <= (end_date.year, end_date.month):
+            key = f'fragment_month_version_{year}-{month:02d}'
+            if key not in keys:
+                keys.append(key)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+
+def cached_fragment(name, filter_key, date_ranges, compute, timeout=None):
+    """
+    Return the cached result of ``compute()`` for a dashboard block.
+
+    The key is built from the block name and the canonical filter key (years,
+    dates, location set, category, product, campaign), never the user, so
+    users with the same locations share entries. It also embeds the version
+    of every month the block's date ranges touch: invalidate_fragments()
+    bumps those versions and older entries simply stop being read.
+
+    Args:
+        name: Block name, e.g. 'comprehensive_stats'
+        filter_key: SalesFilter.key of the request's filters
+        date_ranges: [(start_date, end_date), ...] the block reads
+        compute: Zero-argument callable producing the block
+        timeout: Cache timeout in seconds (default CACHE_TIMEOUT_MEDIUM)
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'CACHE_TIMEOUT_MEDIUM', 1800)
+
+    version_keys = _month_version_keys(date_ranges)
+    versions = cache.get_many(version_keys)
+
+    cache_key_data = {
+        'fragment': name,
+        'filters': filter_key,
+        'versions': [versions.get(key, 0) for key in version_keys],
+    }
+    cache_key = f'fragment_{name}_' + hashlib.md5(
+        json.dumps(cache_key_data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    result = cache.get(cache_key)
+    if result is not None:
+        logger.debug("Fragment hit: %s", name)
+        return result
+
+    result = compute()
+    cache.set(cache_key, result, timeout)
+    return result
+
+
+def invalidate_fragments(start_date, end_date):
+    """
+    Invalidate every cached fragment whose date ranges overlap
+    [start_date, end_date] by bumping the version of each month in it.
+    """
+    version_keys = _month_version_keys([(start_date, end_date)])
+    for key in version_keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Month never versioned yet - entries were built against 0
+            cache.set(key, 1, None)
+    logger.info("Invalidated dashboard fragments for %d month(s)", len(version_keys))
@@ -0,0 +1,128 @@
+# sales_app/distribution.py
+# Ticket amount distribution (histogram + quartiles) computed in the database
+
+import numpy as np
+from django.db import connection
+
+
+# (min, max, label) - half-open [min, max) buckets shown on the dashboard
+TICKET_RANGES = [
+    (0, 50, '0-50'), (50, 100, '50-100'), (100, 150, '100-150'),
+    (150, 200, '150-200'), (200, 300, '200-300'), (300, 500, '300-500'),
+    (500, 1000, '500-1K'), (1000, float('inf'), '1K+')
+]
+
+EMPTY_DISTRIBUTION = {
+    'distribution': {},
+    'distribution_pct': {},
+    'total_tickets': 0,
+    'avg_ticket': 0,
+    'median_ticket': 0,
+    'p25': 0,
+    'p75': 0
+}
+
+
+def _bucket_condition(column, min_val, max_val):
+    if max_val == float('inf'):
+        return f'{column} >= {min_val}'
+    return f'{column} >= {min_val} AND {column} < {max_val}'
+
+
+def _select_columns(queryset):
+    """Column names of the compiled SELECT, in SQL order (fields, then annotations)"""
+    query = queryset.query
+    return list(query.values_select) + list(query.annotation_select)
+
+
+def _postgres_stats(sql, params, columns, label_field, amount_field):
+    """Histogram, average and percentile_cont quartiles per label in a single statement"""
+    aliases = ', '.join(f'c{i}' for i in range(len(columns)))
+    label_col = f'c{columns.index(label_field)}'
+    amount_col = f'c{columns.index(amount_field)}'
+    bucket_columns = ', '.join(
+        f'COUNT(*) FILTER (WHERE {_bucket_condition(amount_col, min_val, max_val)})'
+        for min_val, max_val, _ in TICKET_RANGES
+    )
+    stats_sql = f'''
+        SELECT
+            {label_col},
+            COUNT(*),
+            AVG({amount_col}),
+            percentile_cont(0.25) WITHIN GROUP (ORDER BY {amount_col}),
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY {amount_col}),
+            percentile_cont(0.75) WITHIN GROUP (ORDER BY {amount_col}),
+            {bucket_columns}
+        FROM ({sql}) AS tickets({aliases})
+        GROUP BY {label_col}
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(stats_sql, params)
+        rows = cursor.fetchall()
+
+    return {row[0]: (row[1], row[2], row[3], row[4], row[5], row[6:]) for row in rows}
+
+
+def _numpy_stats(sql, params, columns, label_field, amount_field):
+    """Same numbers as _postgres_stats for backends without percentile_cont (SQLite)"""
+    label_idx = columns.index(label_field)
+    amount_idx = columns.index(amount_field)
+
+    amounts_by_label = {}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            amounts_by_label.setdefault(row[label_idx], []).append(float(row[amount_idx]))
+
+    stats = {}
+    for label, values in amounts_by_label.items():
+        amounts = np.asarray(values, dtype=float)
+        # np.percentile's default linear interpolation matches percentile_cont
+        p25, median, p75 = np.percentile(amounts, [25, 50, 75])
+        counts = [
+            int(np.count_nonzero((amounts >= min_val) & (amounts < max_val)))
+            for min_val, max_val, _ in TICKET_RANGES
+        ]
+        stats[label] = (int(amounts.size), float(amounts.mean()), p25, median, p75, counts)
+    return stats
+
+
+def _build_distribution(total, avg, p25, median, p75, counts):
+    if not total:
+        return dict(EMPTY_DISTRIBUTION)
+
+    distribution = {label: count for (_, _, label), count in zip(TICKET_RANGES, counts)}
+    distribution_pct = {
+        label: (count / total * 100)
+        for label, count in distribution.items()
+    }
+
+    return {
+        'distribution': distribution,
+        'distribution_pct': distribution_pct,
+        'total_tickets': total,
+        'avg_ticket': float(avg),
+        'median_ticket': float(median),
+        'p25': float(p25),
+        'p75': float(p75)
+    }
+
+
+def ticket_distributions(queryset, label_field, amount_field, labels):
+    """
+    Distribution stats for every label in one round trip. ``queryset`` yields
+    one row per ticket with a label column (e.g. the dashboard period) and an
+    amount column. Returns {label: dict shaped like EMPTY_DISTRIBUTION}.
+    """
+    columns = _select_columns(queryset)
+    sql, params = queryset.query.sql_with_params()
+
+    if connection.vendor == 'postgresql':
+        stats = _postgres_stats(sql, params, columns, label_field, amount_field)
+    else:
+        stats = _numpy_stats(sql, params, columns, label_field, amount_field)
+
+    return {
+        label: _build_distribution(*stats[label]) if label in stats else dict(EMPTY_DISTRIBUTION)
+        for label in labels
+    }
@@ -0,0 +1,285 @@
+# sales_app/employee_stats.py
+# Employee leaderboards of employee_analytics, grouped and ranked in SQL so
+# only the final leaderboard rows come back (no per-ticket rows in Python).
+# Read from the daily employee snapshots; the sales_main_web versions remain
+# for filters the snapshots can't answer (product).
+
+from django.db import connection
+from django.db.models import Sum, Count, Q, Value, IntegerField
+from django.db.models.functions import Coalesce
+
+from sales_app.models import EmployeeDailySnapshot
+
+
+# Top employees (per location) with their ticket-size buckets. Cross-sell
+# tickets are the non-POP, non-zero selling lines of an employee, counted
+# per ticket once and bucketed by line count.
+EMPLOYEE_LEADERBOARD_SQL = """
+    WITH leaders (tanam, un, total_revenue, total_revenue_skincare_eligible, skincare_turnover,
+                  total_tickets, total_items, discount_given, std_price_total) AS (
+        {leaders_sql}
+    ),
+    cross_sell_lines (tanam, zedd) AS (
+        {lines_sql}
+    ),
+    ticket_sizes AS (
+        SELECT tanam, zedd, COUNT(zedd) AS items
+        FROM cross_sell_lines
+        WHERE tanam IN (SELECT tanam FROM leaders)
+        GROUP BY tanam, zedd
+    ),
+    cross_sell AS (
+        SELECT
+            tanam,
+            COUNT(*) AS cs_total,
+            COUNT(CASE WHEN items = 1 THEN 1 END) AS cs_one_item,
+            COUNT(CASE WHEN items = 2 THEN 1 END) AS cs_two_item,
+            COUNT(CASE WHEN items >= 3 THEN 1 END) AS cs_three_plus
+        FROM ticket_sizes
+        GROUP BY tanam
+    )
+    SELECT
+        leaders.*,
+        COALESCE(cross_sell.cs_total, 0) AS cs_total,
+        COALESCE(cross_sell.cs_one_item, 0) AS cs_one_item,
+        COALESCE(cross_sell.cs_two_item, 0) AS cs_two_item,
+        COALESCE(cross_sell.cs_three_plus, 0) AS cs_three_plus
+    FROM leaders
+    LEFT JOIN cross_sell ON cross_sell.tanam = leaders.tanam
+    ORDER BY leaders.total_revenue DESC
+"""
+
+# Top categories by revenue and the top employees of each (ROW_NUMBER per
+# category). Categories without employee rows still come back once, with
+# a NULL tanam, so the category list keeps its order.
+CATEGORY_LEADERS_SQL = """
+    WITH lines (prodg, tanam, zedd, tanxa, prodt) AS (
+        {lines_sql}
+    ),
+    top_categories AS (
+        SELECT prodg, SUM(tanxa) AS category_total
+        FROM lines
+        GROUP BY prodg
+        ORDER BY category_total DESC
+        LIMIT %s
+    ),
+    employee_stats AS (
+        SELECT prodg, tanam, SUM(tanxa) AS total_revenue, COUNT(DISTINCT zedd) AS total_tickets, COUNT(zedd) AS total_items
+        FROM lines
+        WHERE prodg IN (SELECT prodg FROM top_categories)
+        GROUP BY prodg, tanam
+    ),
+    ranked AS (
+        SELECT employee_stats.*, ROW_NUMBER() OVER (PARTITION BY prodg ORDER BY total_revenue DESC) AS position
+        FROM employee_stats
+    ),
+    ticket_sizes AS (
+        SELECT prodg, tanam, zedd, COUNT(zedd) AS items
+        FROM lines
+        WHERE prodt = 'selling item'
+          AND (tanxa <> 0 OR tanxa IS NULL)
+          AND prodg <> 'POP'
+          AND prodg IN (SELECT prodg FROM top_categories)
+        GROUP BY prodg, tanam, zedd
+    ),
+    cross_sell AS (
+        SELECT prodg, tanam, COUNT(*) AS cs_total, COUNT(CASE WHEN items >= 3 THEN 1 END) AS cs_three_plus
+        FROM ticket_sizes
+        GROUP BY prodg, tanam
+    )
+    SELECT
+        top_categories.prodg AS category,
+        ranked.tanam,
+        ranked.total_revenue,
+        ranked.total_tickets,
+        ranked.total_items,
+        COALESCE(cross_sell.cs_total, 0) AS cs_total,
+        COALESCE(cross_sell.cs_three_plus, 0) AS cs_three_plus
+    FROM top_categories
+    LEFT JOIN ranked ON ranked.prodg = top_categories.prodg AND ranked.position <= %s
+    LEFT JOIN cross_sell ON cross_sell.prodg = ranked.prodg AND cross_sell.tanam = ranked.tanam
+    ORDER BY top_categories.category_total DESC, ranked.position
+"""
+
+# Same leaderboard from sales_employee_snapshot: the rows are summed per
+# (prodg, tanam), no ticket-level work left
+SNAPSHOT_CATEGORY_LEADERS_SQL = """
+    WITH snapshot (prodg, tanam, revenue, tickets, items, cs_tickets, cs_three_plus) AS (
+        {snapshot_sql}
+    ),
+    top_categories AS (
+        SELECT prodg, SUM(revenue) AS category_total
+        FROM snapshot
+        GROUP BY prodg
+        ORDER BY category_total DESC
+        LIMIT %s
+    ),
+    employee_stats AS (
+        SELECT prodg, tanam, SUM(revenue) AS total_revenue, SUM(tickets) AS total_tickets, SUM(items) AS total_items,
+               SUM(cs_tickets) AS cs_total, SUM(cs_three_plus) AS cs_three_plus
+        FROM snapshot
+        WHERE prodg IN (SELECT prodg FROM top_categories)
+        GROUP BY prodg, tanam
+    ),
+    ranked AS (
+        SELECT employee_stats.*, ROW_NUMBER() OVER (PARTITION BY prodg ORDER BY total_revenue DESC) AS position
+        FROM employee_stats
+    )
+    SELECT
+        top_categories.prodg AS category,
+        ranked.tanam,
+        ranked.total_revenue,
+        ranked.total_tickets,
+        ranked.total_items,
+        COALESCE(ranked.cs_total, 0) AS cs_total,
+        COALESCE(ranked.cs_three_plus, 0) AS cs_three_plus
+    FROM top_categories
+    LEFT JOIN ranked ON ranked.prodg = top_categories.prodg AND ranked.position <= %s
+    ORDER BY top_categories.category_total DESC, ranked.position
+"""
+
+
+def _fetch_dicts(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def employee_leaderboard(sales_filter, cross_sell_filter, year, limit=20):
+    """
+    Top ``limit`` (employee, location) rows by revenue under ``sales_filter``
+    with revenue, skincare, tickets, items and discount totals, plus the
+    employee's cross-sell tickets under ``cross_sell_filter`` (cs_total and
+    the 1 / 2 / 3+ line buckets). One statement.
+    """
+    leaders = sales_filter.sales(year, exclude_warehouses=False).values('tanam', 'un').annotate(
+        total_revenue=Sum('tanxa'),
+        total_revenue_skincare_eligible=Sum('tanxa', filter=Q(~Q(prodg='POP'))),
+        skincare_turnover=Sum('tanxa', filter=Q(prodg='SKIN CARE')),
+        total_tickets=Count('zedd', distinct=True),
+        total_items=Count('zedd', filter=Q(~Q(prodg='POP'))),
+        discount_given=Sum('discount_price'),
+        std_price_total=Sum('std_price')
+    ).order_by('-total_revenue')[:limit]
+    if leaders.query.is_empty():
+        return []
+
+    lines = (
+        cross_sell_filter.sales(year, exclude_warehouses=False)
+        .filter(prodt='selling item')
+        .exclude(tanxa=0)
+        .exclude(prodg='POP')
+        .order_by()
+        .values_list('tanam', 'zedd')
+    )
+    leaders_sql, leaders_params = leaders.query.sql_with_params()
+    lines_sql, lines_params = lines.query.sql_with_params()
+
+    return _fetch_dicts(
+        EMPLOYEE_LEADERBOARD_SQL.format(leaders_sql=leaders_sql, lines_sql=lines_sql),
+        (*leaders_params, *lines_params),
+    )
+
+
+def category_leaderboard(sales_filter, year, categories=10, per_category=10):
+    """
+    [{'category', 'rows'}] for the top ``categories`` product groups by
+    revenue, biggest first. ``rows`` are the top ``per_category`` employees
+    of the group (tanam, total_revenue, total_tickets, total_items, and the
+    cross-sell cs_total / cs_three_plus). One statement.
+    """
+    lines = (
+        sales_filter.sales(year, exclude_warehouses=False)
+        .order_by()
+        .values_list('prodg', 'tanam', 'zedd', 'tanxa', 'prodt')
+    )
+    if lines.query.is_empty():
+        return []
+    lines_sql, params = lines.query.sql_with_params()
+    return _group_by_category(
+        _fetch_dicts(CATEGORY_LEADERS_SQL.format(lines_sql=lines_sql), (*params, categories, per_category))
+    )
+
+
+def _group_by_category(rows):
+    """[{'category', 'rows'}] from leaderboard rows ordered by category"""
+    leaders = []
+    for row in rows:
+        if not leaders or leaders[-1]['category'] != row['category']:
+            leaders.append({'category': row['category'], 'rows': []})
+        if row['total_tickets'] is not None:
+            leaders[-1]['rows'].append(row)
+    return leaders
+
+
+# ===== FROM THE DAILY SNAPSHOTS =====
+
+def snapshots_cover(sales_filter):
+    """Whether the snapshots can answer ``sales_filter`` (they have no product / campaign columns)"""
+    return sales_filter.product == 'all' and sales_filter.campaign == 'all'
+
+
+def _snapshot_rows(sales_filter, year):
+    return sales_filter.apply(
+        EmployeeDailySnapshot.objects.filter(sales_filter.window(year).day_q()),
+        exclude_warehouses=False
+    )
+
+
+def _total(field, **options):
+    return Coalesce(Sum(field, **options), Value(0), output_field=IntegerField())
+
+
+def snapshot_employee_leaderboard(sales_filter, cross_sell_filter, year, limit=20):
+    """employee_leaderboard() from sales_employee_snapshot (two small queries)"""
+    # With a category only that category's lines count, else whole tickets
+    scope = '' if sales_filter.category != 'all' else 'all_'
+    leaders = list(
+        _snapshot_rows(sales_filter, year).values('tanam', 'un').annotate(
+            total_revenue=Sum('revenue'),
+            total_revenue_skincare_eligible=Sum('revenue', filter=~Q(prodg='POP')),
+            skincare_turnover=Sum('revenue', filter=Q(prodg='SKIN CARE')),
+            total_tickets=_total(f'{scope}tickets'),
+            total_items=_total('items', filter=~Q(prodg='POP')),
+            discount_given=Sum('discount_total'),
+            std_price_total=Sum('std_price_total')
+        ).order_by('-total_revenue')[:limit]
+    )
+    if not leaders:
+        return []
+
+    scope = '' if cross_sell_filter.category != 'all' else 'all_'
+    cross_sell = {
+        row['tanam']: row
+        for row in _snapshot_rows(cross_sell_filter, year)
+        .filter(tanam__in=[emp['tanam'] for emp in leaders])
+        .values('tanam')
+        .annotate(
+            cs_total=_total(f'{scope}cs_tickets'),
+            cs_one_item=_total(f'{scope}cs_one'),
+            cs_two_item=_total(f'{scope}cs_two'),
+            cs_three_plus=_total(f'{scope}cs_three_plus'),
+        )
+        .order_by()
+    }
+    no_cross_sell = {'cs_total': 0, 'cs_one_item': 0, 'cs_two_item': 0, 'cs_three_plus': 0}
+    for emp in leaders:
+        cs = cross_sell.get(emp['tanam'], no_cross_sell)
+        emp.update((key, cs[key]) for key in no_cross_sell)
+    return leaders
+
+
+def snapshot_category_leaderboard(sales_filter, year, categories=10, per_category=10):
+    """category_leaderboard() from sales_employee_snapshot (one query)"""
+    snapshot = (
+        _snapshot_rows(sales_filter, year)
+        .order_by()
+        .values_list('prodg', 'tanam', 'revenue', 'tickets', 'items', 'cs_tickets', 'cs_three_plus')
+    )
+    if snapshot.query.is_empty():
+        return []
+    snapshot_sql, params = snapshot.query.sql_with_params()
+    return _group_by_category(
+        _fetch_dicts(SNAPSHOT_CATEGORY_LEADERS_SQL.format(snapshot_sql=snapshot_sql), (*params, categories, per_category))
+    )
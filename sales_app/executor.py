@@ -0,0 +1,50 @@
+# sales_app/executor.py
+# Run independent view queries side by side on a small, bounded thread pool
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+
+logger = logging.getLogger(__name__)
+
+
+def _in_own_connection(func):
+    """
+    Django hands every thread its own connection; close it when the task is
+    done so pooled threads never leave idle connections behind (CONN_MAX_AGE).
+    """
+    def run():
+        try:
+            return func()
+        finally:
+            connections.close_all()
+    return run
+
+
+def run_parallel(tasks, max_workers=None):
+    """
+    Run a {name: zero-argument callable} mapping and return {name: result}.
+
+    At most ``max_workers`` (default settings.DASHBOARD_QUERY_WORKERS) tasks
+    hold a database connection at once, so a single page load can't drain
+    the Postgres pool. With one worker, or inside a transaction whose
+    uncommitted rows other connections couldn't see, tasks run inline.
+    Exceptions raised by a task propagate to the caller.
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'DASHBOARD_QUERY_WORKERS', 4)
+    max_workers = max(1, min(max_workers, len(tasks)))
+
+    start = time.time()
+    if max_workers == 1 or connection.in_atomic_block:
+        results = {name: func() for name, func in tasks.items()}
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {name: pool.submit(_in_own_connection(func)) for name, func in tasks.items()}
+            results = {name: future.result() for name, future in futures.items()}
+
+    logger.debug("%d tasks on %d worker(s) in %.2fs", len(tasks), max_workers, time.time() - start)
+    return results
@@ -0,0 +1,441 @@
+# sales_app/exports.py
+# Streaming, constant-memory exports (XLSX, CSV, Parquet) of raw query results
+
+import csv
+import datetime
+import decimal
+import gzip
+import io
+import logging
+import math
+import zipfile
+from contextlib import closing
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import to_excel
+
+from sales_app.query_console import set_statement_timeout
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional - only the Parquet export needs it
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+GZIP_CONTENT_TYPE = 'application/gzip'
+PARQUET_CONTENT_TYPE = 'application/vnd.apache.parquet'
+
+# Rows per fetchmany() round trip (and per chunk sent to the client)
+FETCH_BATCH_SIZE = 2000
+
+# Rows per Parquet row group (one chunk sent to the client each)
+PARQUET_ROW_GROUP_SIZE = 50000
+
+# zlib level for .csv.gz - 9 is several times slower for a few % less
+GZIP_LEVEL = 6
+
+# Column widths are estimated from the first rows only
+WIDTH_SAMPLE_ROWS = 500
+MAX_COLUMN_WIDTH = 50
+
+# cellXfs indexes in STYLES_XML: (plain, alternate row) per kind of value
+HEADER_STYLE = 1
+BODY_STYLES = {'value': (2, 3), 'date': (4, 5), 'datetime': (6, 7)}
+
+CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Same look as the old openpyxl export: blue bold header, thin grey borders,
+# grey fill on even rows - defined once instead of per cell
+STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+    '<fonts count="2">'
+    '<font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><color rgb="FFFFFFFF"/><name val="Arial"/></font>'
+    '</fonts>'
+    '<fills count="4">'
+    '<fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FF4472C4"/><bgColor rgb="FF4472C4"/></patternFill></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FFF2F2F2"/><bgColor rgb="FFF2F2F2"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="2">'
+    '<border><left/><right/><top/><bottom/><diagonal/></border>'
+    '<border>'
+    '<left style="thin"><color rgb="FFD0D0D0"/></left><right style="thin"><color rgb="FFD0D0D0"/></right>'
+    '<top style="thin"><color rgb="FFD0D0D0"/></top><bottom style="thin"><color rgb="FFD0D0D0"/></bottom>'
+    '<diagonal/></border>'
+    '</borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="8">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="2" borderId="1" xfId="0" applyFont="1" applyFill="1" applyBorder="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center"/></xf>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="1" xfId="0" applyBorder="1" applyAlignment="1"><alignment horizontal="left" vertical="center"/></xf>'
+    '<xf numFmtId="0" fontId="0" fillId="3" borderId="1" xfId="0" applyFill="1" applyBorder="1" applyAlignment="1"><alignment horizontal="left" vertical="center"/></xf>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="1" xfId="0" applyNumberFormat="1" applyBorder="1" applyAlignment="1"><alignment horizontal="left" vertical="center"/></xf>'
+    '<xf numFmtId="14" fontId="0" fillId="3" borderId="1" xfId="0" applyNumberFormat="1" applyFill="1" applyBorder="1" applyAlignment="1"><alignment horizontal="left" vertical="center"/></xf>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="1" xfId="0" applyNumberFormat="1" applyBorder="1" applyAlignment="1"><alignment horizontal="left" vertical="center"/></xf>'
+    '<xf numFmtId="164" fontId="0" fillId="3" borderId="1" xfId="0" applyNumberFormat="1" applyFill="1" applyBorder="1" applyAlignment="1"><alignment horizontal="left" vertical="center"/></xf>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+
+def _workbook_xml(sheet_title):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<workbook xmlns="{SHEET_NS}" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_title[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+class _ChunkBuffer:
+    """Write-only sink for zipfile/gzip/pyarrow; drain() hands over what was written so far"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _text(value):
+    return escape(ILLEGAL_CHARACTERS_RE.sub('', str(value)))
+
+
+def _cell_xml(reference, value, alternate):
+    """One <c> element; None becomes a styled empty cell"""
+    if isinstance(value, bool):
+        style = BODY_STYLES['value'][alternate]
+        return f'<c r="{reference}" s="{style}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, decimal.Decimal)) and math.isfinite(value):
+        style = BODY_STYLES['value'][alternate]
+        return f'<c r="{reference}" s="{style}"><v>{value}</v></c>'
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            # Excel has no time zones - show the local wall clock time
+            value = timezone.make_naive(value)
+        style = BODY_STYLES['datetime'][alternate]
+        return f'<c r="{reference}" s="{style}"><v>{to_excel(value)}</v></c>'
+    if isinstance(value, datetime.date):
+        style = BODY_STYLES['date'][alternate]
+        return f'<c r="{reference}" s="{style}"><v>{to_excel(value)}</v></c>'
+
+    style = BODY_STYLES['value'][alternate]
+    if value is None:
+        return f'<c r="{reference}" s="{style}"/>'
+    return f'<c r="{reference}" s="{style}" t="inlineStr"><is><t xml:space="preserve">{_text(value)}</t></is></c>'
+
+
+def _column_widths(columns, sample_rows):
+    """Header/longest value length + 2, capped at MAX_COLUMN_WIDTH, from a sample"""
+    widths = [len(str(name)) for name in columns]
+    for row in sample_rows[:WIDTH_SAMPLE_ROWS]:
+        for i, value in enumerate(row):
+            if value is not None:
+                widths[i] = max(widths[i], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def _sheet_head_xml(columns, widths, letters):
+    cols = ''.join(
+        f'<col min="{i}" max="{i}" width="{width}" customWidth="1"/>'
+        for i, width in enumerate(widths, 1)
+    )
+    header = ''.join(
+        f'<c r="{letter}1" s="{HEADER_STYLE}" t="inlineStr"><is><t>{_text(name)}</t></is></c>'
+        for letter, name in zip(letters, columns)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<worksheet xmlns="{SHEET_NS}">'
+        '<sheetViews><sheetView workbookViewId="0">'
+        '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+        '</sheetView></sheetViews>'
+        f'<cols>{cols}</cols>'
+        f'<sheetData><row r="1">{header}</row>'
+    )
+
+
+def _query_batches(sql, params, timeout_ms=None):
+    """
+    Generator of the column names of ``sql``, then lists of up to
+    FETCH_BATCH_SIZE rows read from a server-side cursor. ``timeout_ms``
+    is the statement timeout of each fetch (PostgreSQL).
+
+    Runs in one transaction so a Postgres server-side cursor streams rows as
+    they are produced (outside a transaction Django declares it WITH HOLD,
+    which materializes the whole result first). The first batch is fetched
+    before the column names are yielded, so query errors surface there.
+    """
+    with transaction.atomic():
+        with connection.cursor() as settings_cursor:
+            set_statement_timeout(settings_cursor, timeout_ms)
+        cursor = connection.chunked_cursor()
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            yield [col[0] for col in cursor.description]
+            while rows:
+                yield rows
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+        finally:
+            cursor.close()
+
+
+# ---- XLSX -------------------------------------------------------------------
+
+def _xlsx_chunks(sql, params, timeout_ms=None, sheet_title='Query Results'):
+    """Column names, then XLSX bytes for the rows of ``sql``"""
+    with closing(_query_batches(sql, params, timeout_ms)) as batches:
+        columns = next(batches)
+        yield columns
+
+        first_rows = next(batches, [])
+        buffer = _ChunkBuffer()
+        letters = [get_column_letter(i) for i in range(1, len(columns) + 1)]
+        row_number = 1
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+            archive.writestr('_rels/.rels', ROOT_RELS_XML)
+            archive.writestr('xl/workbook.xml', _workbook_xml(sheet_title))
+            archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS_XML)
+            archive.writestr('xl/styles.xml', STYLES_XML)
+
+            with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+                sheet.write(_sheet_head_xml(columns, _column_widths(columns, first_rows), letters).encode('utf-8'))
+
+                for rows in chain([first_rows], batches):
+                    parts = []
+                    for row in rows:
+                        row_number += 1
+                        alternate = 1 if row_number % 2 == 0 else 0
+                        cells = ''.join(
+                            _cell_xml(f'{letter}{row_number}', value, alternate)
+                            for letter, value in zip(letters, row)
+                        )
+                        parts.append(f'<row r="{row_number}">{cells}</row>')
+                    sheet.write(''.join(parts).encode('utf-8'))
+                    yield buffer.drain()
+
+                sheet.write(b'</sheetData></worksheet>')
+        yield buffer.drain()
+        logger.debug("Streamed %d rows to XLSX", row_number - 1)
+
+
+# ---- CSV --------------------------------------------------------------------
+
+def _csv_value(value):
+    # Same wall clock time as the XLSX export, with the offset kept
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return timezone.localtime(value).isoformat(sep=' ')
+    return value
+
+
+def _csv_chunks(sql, params, timeout_ms=None, compress=False):
+    """
+    Column names, then UTF-8 CSV bytes (gzip-compressed with ``compress``)
+    for the rows of ``sql``. Starts with a BOM so Excel reads Georgian text.
+    """
+    with closing(_query_batches(sql, params, timeout_ms)) as batches:
+        columns = next(batches)
+        yield columns
+
+        buffer = _ChunkBuffer()
+        sink = gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=GZIP_LEVEL) if compress else buffer
+        text = io.StringIO()
+        writer = csv.writer(text)
+
+        def flush():
+            sink.write(text.getvalue().encode('utf-8'))
+            text.seek(0)
+            text.truncate()
+
+        text.write('\ufeff')
+        writer.writerow(columns)
+        flush()
+
+        row_count = 0
+        for rows in batches:
+            writer.writerows([_csv_value(value) for value in row] for row in rows)
+            flush()
+            row_count += len(rows)
+            yield buffer.drain()
+
+        if compress:
+            sink.close()
+        yield buffer.drain()
+        logger.debug("Streamed %d rows to CSV%s", row_count, ' (gzip)' if compress else '')
+
+
+# ---- Parquet ----------------------------------------------------------------
+
+def _arrow_type(values):
+    """
+    Arrow type of a column from its first batch of values. Numerics with
+    decimals become float64, timestamps keep their zone, anything else (and
+    an all-NULL column) is stored as text.
+    """
+    kinds = {type(value) for value in values if value is not None}
+    if kinds == {bool}:
+        return pa.bool_()
+    if kinds and kinds <= {int}:
+        return pa.int64()
+    if kinds and kinds <= {int, float, decimal.Decimal}:
+        return pa.float64()
+    if kinds == {datetime.datetime}:
+        aware = any(value.tzinfo is not None for value in values if value is not None)
+        return pa.timestamp('us', tz='UTC' if aware else None)
+    if kinds == {datetime.date}:
+        return pa.date32()
+    return pa.string()
+
+
+def _arrow_array(values, arrow_type):
+    if pa.types.is_floating(arrow_type):
+        values = [None if value is None else float(value) for value in values]
+    elif pa.types.is_string(arrow_type):
+        values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+    return pa.array(values, type=arrow_type)
+
+
+def _arrow_table(rows, schema):
+    column_values = list(zip(*rows))
+    return pa.Table.from_arrays(
+        [_arrow_array(values, field.type) for values, field in zip(column_values, schema)],
+        schema=schema,
+    )
+
+
+def _parquet_chunks(sql, params, timeout_ms=None):
+    """
+    Column names, then Parquet bytes for the rows of ``sql``, one row group
+    of PARQUET_ROW_GROUP_SIZE rows at a time. The schema comes from the
+    first batch of rows.
+    """
+    if pa is None:
+        raise ImproperlyConfigured("Parquet export needs pyarrow (pip install pyarrow)")
+
+    with closing(_query_batches(sql, params, timeout_ms)) as batches:
+        columns = next(batches)
+        yield columns
+
+        first_rows = next(batches, [])
+        first_columns = list(zip(*first_rows)) or [()] * len(columns)
+        schema = pa.schema([
+            pa.field(str(name), _arrow_type(values)) for name, values in zip(columns, first_columns)
+        ])
+
+        buffer = _ChunkBuffer()
+        row_count = 0
+        with pq.ParquetWriter(buffer, schema) as writer:
+            pending = []
+            for rows in chain([first_rows], batches):
+                pending.extend(rows)
+                if len(pending) < PARQUET_ROW_GROUP_SIZE:
+                    continue
+                writer.write_table(_arrow_table(pending, schema), row_group_size=PARQUET_ROW_GROUP_SIZE)
+                row_count += len(pending)
+                pending = []
+                yield buffer.drain()
+            if pending:
+                writer.write_table(_arrow_table(pending, schema), row_group_size=PARQUET_ROW_GROUP_SIZE)
+                row_count += len(pending)
+        yield buffer.drain()
+        logger.debug("Streamed %d rows to Parquet", row_count)
+
+
+# ---- responses --------------------------------------------------------------
+
+# export_format -> (chunk generator, extra arguments, content type, file extension)
+EXPORT_FORMATS = {
+    'xlsx': (_xlsx_chunks, {}, XLSX_CONTENT_TYPE, 'xlsx'),
+    'csv': (_csv_chunks, {}, CSV_CONTENT_TYPE, 'csv'),
+    'csv.gz': (_csv_chunks, {'compress': True}, GZIP_CONTENT_TYPE, 'csv.gz'),
+    'parquet': (_parquet_chunks, {}, PARQUET_CONTENT_TYPE, 'parquet'),
+}
+
+
+def export_chunks(sql, export_format, params=None, timeout_ms=None):
+    """
+    Generator of the file bytes of ``sql`` in ``export_format``, preceded by
+    the list of column names (also used by the benchmark command).
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    chunk_generator, arguments, _, _ = EXPORT_FORMATS[export_format]
+    return chunk_generator(sql, params, timeout_ms, **arguments)
+
+
+def stream_query_export(sql, export_format='xlsx', params=None, filename='query_results', timeout_ms=None):
+    """
+    StreamingHttpResponse with the results of ``sql`` as an XLSX, CSV,
+    gzipped CSV or Parquet file.
+
+    Rows are read with fetchmany() from a server-side cursor and written
+    straight into the response, so memory stays flat however many rows
+    there are and the download starts with the first batch. Errors raised
+    while starting the query propagate before any response exists.
+    """
+    chunks = export_chunks(sql, export_format, params, timeout_ms)
+    next(chunks)  # run the query and fetch the first batch now
+
+    _, _, content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+    return response
+
@@ -0,0 +1,154 @@
+# sales_app/facets.py
+# In-memory index of distinct (un, prodg, prod, actions) combinations per year
+# for the cascading filter dropdowns
+
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from sales_app.dates import DateWindow
+from sales_app.filters import EXCLUDED_LOCATIONS
+from sales_app.models import DailySalesRollup
+
+logger = logging.getLogger(__name__)
+
+
+FACET_FIELDS = ('un', 'prodg', 'prod', 'actions')
+
+# Response key -> facet field
+OPTION_FIELDS = {
+    'locations': 'un',
+    'categories': 'prodg',
+    'products': 'prod',
+    'campaigns': 'actions',
+}
+
+# year -> (version, built_at, FacetIndex), per process
+_memo = {}
+
+
+class FacetIndex:
+    """
+    Every distinct (un, prodg, prod, actions) combination of one year, each
+    column stored as integer codes into that field's values in database
+    order (so option lists keep the ORDER BY collation).
+
+    Option lists are answered with numpy masks over the combinations
+    instead of four DISTINCT scans of the year.
+    """
+
+    def __init__(self, year, values, codes):
+        self.year = year
+        self.values = values
+        self.codes = codes
+        self.positions = {
+            field: {value: i for i, value in enumerate(field_values)}
+            for field, field_values in values.items()
+        }
+
+    def __len__(self):
+        return len(self.codes[FACET_FIELDS[0]])
+
+    def _mask(self, field, selected):
+        positions = self.positions[field]
+        wanted = [positions[value] for value in selected if value in positions]
+        return np.isin(self.codes[field], wanted)
+
+    def options(self, locations=(), category='all', product='all', campaign='all'):
+        """
+        Same lists as the DISTINCT queries: each field's options are
+        narrowed by every selection except its own.
+        """
+        selected = {
+            'un': list(locations),
+            'prodg': [] if category == 'all' else [category],
+            'prod': [] if product == 'all' else [product],
+            'actions': [] if campaign == 'all' else [campaign],
+        }
+        masks = {field: self._mask(field, values) for field, values in selected.items() if values}
+
+        result = {}
+        for key, field in OPTION_FIELDS.items():
+            mask = None
+            for other, other_mask in masks.items():
+                if other != field:
+                    mask = other_mask if mask is None else mask & other_mask
+            codes = self.codes[field] if mask is None else self.codes[field][mask]
+            field_values = self.values[field]
+            result[key] = [field_values[code] for code in np.unique(codes)]
+        return result
+
+
+def build_facet_index(year):
+    """
+    Read the combinations of ``year`` (test warehouses excluded) from the
+    daily rollup, which has one row per (day, un, prodg, prod, actions), so
+    building never scans sales_main_web.
+    """
+    start = time.time()
+    window = DateWindow.for_year(year)
+    rollup = DailySalesRollup.objects.filter(window.day_q()).exclude(un__in=EXCLUDED_LOCATIONS)
+
+    values = {
+        field: list(rollup.values_list(field, flat=True).distinct().order_by(field))
+        for field in FACET_FIELDS
+    }
+    combinations = list(rollup.values_list(*FACET_FIELDS).distinct())
+
+    codes = {}
+    for i, field in enumerate(FACET_FIELDS):
+        positions = {value: position for position, value in enumerate(values[field])}
+        column = []
+        for combination in combinations:
+            value = combination[i]
+            if value not in positions:
+                # Not in its list (uploaded between the reads)
+                positions[value] = len(values[field])
+                values[field].append(value)
+            column.append(positions[value])
+        codes[field] = np.array(column, dtype=np.int32)
+
+    index = FacetIndex(year, values, codes)
+    logger.info("Built facet index for %s: %d combinations in %.2fs", year, len(index), time.time() - start)
+    return index
+
+
+def _version_key(year):
+    return f'facet_index_version_{year}'
+
+
+def get_facet_index(year):
+    """
+    FacetIndex for ``year``: from this process if still current, else from
+    the shared cache, else built from the database. One cache read per call
+    to check the version bumped by invalidate_facets().
+    """
+    timeout = getattr(settings, 'CACHE_TIMEOUT_LONG', 3600)
+    version = cache.get(_version_key(year), 0)
+
+    memo = _memo.get(year)
+    if memo and memo[0] == version and time.time() - memo[1] < timeout:
+        return memo[2]
+
+    cache_key = f'facet_index_{year}_v{version}'
+    index = cache.get(cache_key)
+    if index is None:
+        index = build_facet_index(year)
+        cache.set(cache_key, index, timeout)
+
+    _memo[year] = (version, time.time(), index)
+    return index
+
+
+def invalidate_facets(start_date, end_date):
+    """Drop the facet indexes of every year in [start_date, end_date]"""
+    for year in range(start_date.year, end_date.year + 1):
+        try:
+            cache.incr(_version_key(year))
+        except ValueError:
+            cache.set(_version_key(year), 1, None)
+        _memo.pop(year, None)
+    logger.info("Invalidated filter facets for %s-%s", start_date.year, end_date.year)
@@ -0,0 +1,221 @@
+# sales_app/filters.py
+# One parsed, immutable set of analytic filters shared by every sales view
+
+import hashlib
+import json
+from dataclasses import dataclass, asdict, replace
+from datetime import date, datetime
+
+from django.contrib import messages
+
+from sales_app.dates import DateWindow, same_day_in_year
+from sales_app.models import Sales, DailySalesRollup, TicketSummary
+
+
+# Warehouses that never count as sales locations
+EXCLUDED_LOCATIONS = ("მთავარი საწყობი 2", "სატესტო")
+
+# ?comparison= value -> (current_year, previous_year); anything else is 2025-2024
+COMPARISON_YEARS = {
+    '2026-2025': (2026, 2025),
+    '2026-2024': (2026, 2024),
+    '2025-2024': (2025, 2024),
+}
+DEFAULT_COMPARISON_YEARS = (2025, 2024)
+
+# GET parameter -> SalesFilter field for the line filters
+FILTER_PARAMS = {
+    'category': 'category',
+    'prod_filter': 'product',
+    'campaign_filter': 'campaign',
+    'employee_filter': 'employee',
+}
+
+
+def _parse_date(value, default):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return default
+
+
+def resolve_locations(request, user_profile, denied_message='Access denied to', notify=True):
+    """
+    Locations the user may see out of ?un_filter=.
+
+    Non-admins get their selection narrowed to their allowed locations (all
+    of them when nothing, 'all' or only forbidden ones were picked). Admins
+    get their selection, or [] for every location when 'all' is in it.
+    """
+    selected_locations = request.GET.getlist('un_filter')
+
+    if user_profile.is_admin:
+        return [] if 'all' in selected_locations else selected_locations
+
+    allowed_locations = user_profile.get_allowed_locations()
+    if not selected_locations or 'all' in selected_locations:
+        return list(allowed_locations)
+
+    unauthorized = set(selected_locations) - set(allowed_locations)
+    if unauthorized:
+        if notify:
+            messages.warning(request, f"{denied_message}: {', '.join(unauthorized)}")
+        selected_locations = [loc for loc in selected_locations if loc in allowed_locations]
+    return selected_locations or list(allowed_locations)
+
+
+@dataclass(frozen=True)
+class SalesFilter:
+    """
+    Comparison years, day range, locations and line filters of one request.
+
+    Immutable and hashable: ``key`` is canonical (locations are sorted and
+    de-duplicated) and the queryset builders always add predicates in the
+    same order, so identical filters produce byte-identical SQL. Use
+    ``dataclasses.replace()`` (or the with_* helpers) to derive variants.
+
+    ``locations`` is empty for "every location" (admins only).
+    """
+
+    current_year: int
+    previous_year: int
+    start_date: date
+    end_date: date
+    locations: tuple = ()
+    category: str = 'all'
+    product: str = 'all'
+    campaign: str = 'all'
+    employee: str = 'all'
+
+    def __post_init__(self):
+        object.__setattr__(self, 'locations', tuple(sorted(set(self.locations))))
+
+    @classmethod
+    def from_request(cls, request, user_profile, default_comparison='2026-2025',
+                     fields=('category', 'product', 'campaign'), year=None,
+                     denied_message='Access denied to', notify=True):
+        """
+        Parse ?comparison=, ?start_date=, ?end_date=, ?un_filter= and the
+        line filters named in ``fields``. Dates are moved into the current
+        year. With ``year`` the comparison is ``year`` vs the year before
+        and ?comparison= is ignored.
+        """
+        if year is None:
+            current_year, previous_year = COMPARISON_YEARS.get(
+                request.GET.get('comparison', default_comparison), DEFAULT_COMPARISON_YEARS
+            )
+        else:
+            current_year, previous_year = year, year - 1
+
+        start_date = _parse_date(request.GET.get('start_date'), date(current_year, 1, 1))
+        end_date = _parse_date(request.GET.get('end_date'), date(current_year, 12, 31))
+
+        line_filters = {
+            field: request.GET.get(param) or 'all'
+            for param, field in FILTER_PARAMS.items() if field in fields
+        }
+
+        return cls(
+            current_year=current_year,
+            previous_year=previous_year,
+            start_date=same_day_in_year(start_date, current_year),
+            end_date=same_day_in_year(end_date, current_year),
+            locations=tuple(resolve_locations(request, user_profile, denied_message, notify)),
+            **line_filters
+        )
+
+    @classmethod
+    def from_params(cls, params):
+        """Inverse of as_params() (e.g. for a background job)"""
+        params = dict(params)
+        params['start_date'] = date.fromisoformat(params['start_date'])
+        params['end_date'] = date.fromisoformat(params['end_date'])
+        params['locations'] = tuple(params.get('locations', ()))
+        return cls(**params)
+
+    def as_params(self):
+        """JSON-serializable dict of the filter"""
+        params = asdict(self)
+        params['start_date'] = self.start_date.isoformat()
+        params['end_date'] = self.end_date.isoformat()
+        params['locations'] = list(self.locations)
+        return params
+
+    # ---- derived values ---------------------------------------------------
+
+    @property
+    def comparison(self):
+        return f'{self.current_year}-{self.previous_year}'
+
+    @property
+    def key(self):
+        """Canonical cache key of the whole filter"""
+        data = json.dumps(self.as_params(), sort_keys=True)
+        return hashlib.md5(data.encode()).hexdigest()
+
+    @property
+    def has_line_filters(self):
+        """True when category/product/campaign narrow which lines of a ticket count"""
+        return self.category != 'all' or self.product != 'all' or self.campaign != 'all'
+
+    def location_label(self, is_admin):
+        """'all', the single selected location, or 'multiple'"""
+        if is_admin and not self.locations:
+            return 'all'
+        return self.locations[0] if len(self.locations) == 1 else 'multiple'
+
+    def window(self, year=None):
+        """The selected days in ``year`` (default: the current year)"""
+        return DateWindow(self.start_date, self.end_date).in_year(year or self.current_year)
+
+    @property
+    def current_window(self):
+        return self.window(self.current_year)
+
+    @property
+    def previous_window(self):
+        return self.window(self.previous_year)
+
+    def with_end_date(self, end_date):
+        return replace(self, end_date=end_date)
+
+    def with_locations(self, locations):
+        return replace(self, locations=tuple(locations))
+
+    # ---- queryset builders ------------------------------------------------
+
+    def apply(self, queryset, exclude_warehouses=True, lines=True):
+        """
+        Add the location and line filters to a Sales, DailySalesRollup or
+        TicketSummary queryset (``lines=False`` for tables without product
+        columns). An employee filter without a location matches nothing.
+        """
+        if exclude_warehouses:
+            queryset = queryset.exclude(un__in=EXCLUDED_LOCATIONS)
+        if self.locations:
+            queryset = queryset.filter(un__in=self.locations)
+        if lines:
+            if self.category != 'all':
+                queryset = queryset.filter(prodg=self.category)
+            if self.product != 'all':
+                queryset = queryset.filter(prod=self.product)
+            if self.campaign != 'all':
+                queryset = queryset.filter(actions=self.campaign)
+            if self.employee != 'all':
+                if not self.locations:
+                    return queryset.none()
+                queryset = queryset.filter(tanam=self.employee)
+        return queryset
+
+    def sales(self, year=None, **options):
+        """Sales rows of the selected days in ``year``"""
+        return self.apply(Sales.objects.filter(self.window(year).q()), **options)
+
+    def rollup(self, year=None, **options):
+        """DailySalesRollup rows of the selected days in ``year``"""
+        return self.apply(DailySalesRollup.objects.filter(self.window(year).day_q()), **options)
+
+    def tickets(self, year=None, **options):
+        """TicketSummary rows of the selected days in ``year`` (locations only)"""
+        options.setdefault('lines', False)
+        return self.apply(TicketSummary.objects.filter(self.window(year).day_q()), **options)
@@ -0,0 +1,448 @@
+# sales_app/insight_report.py
+# Narrative of the insights page (insights, recommendations, summary) and
+# the stored payloads of the common filters, rebuilt after each upload
+
+import time
+from datetime import date
+
+from sales_app.filters import SalesFilter, COMPARISON_YEARS, EXCLUDED_LOCATIONS
+from sales_app.insight_stats import year_stats
+from sales_app.models import DailySalesRollup, InsightSnapshot, UserProfile
+
+
+def build_insight_payload(sales_filter):
+    """
+    Template context of the insights page for ``sales_filter`` (everything
+    but the user): JSON-serializable, so it can be stored as it is.
+    """
+    current_year, previous_year = sales_filter.current_year, sales_filter.previous_year
+    
+    # A third year only for consecutive-year comparisons (2026-2024 lacks data)
+    two_years_ago = previous_year - 1 if current_year - previous_year == 1 else None
+    
+    start_date, end_date = sales_filter.start_date, sales_filter.end_date
+    selected_locations = list(sales_filter.locations)
+    
+    # Current, previous and two-years-ago figures in one grouped pass
+    years = [current_year, previous_year] + ([two_years_ago] if two_years_ago else [])
+    stats_by_year = year_stats(sales_filter, years)
+    stats_current = stats_by_year[current_year]
+    stats_previous = stats_by_year[previous_year]
+    stats_two_years = stats_by_year[two_years_ago] if two_years_ago else None
+    
+    # Helper functions
+    def calc_change(current, previous):
+        if previous and previous > 0:
+            return ((current - previous) / previous) * 100
+        return 0
+    
+    def format_currency(value):
+        if value >= 1000000:
+            return f"${value/1000000:.1f}M"
+        elif value >= 1000:
+            return f"${value/1000:.1f}K"
+        return f"${value:.2f}"
+    
+    def format_number(value):
+        if value >= 1000000:
+            return f"{value/1000000:.1f}M"
+        elif value >= 1000:
+            return f"{value/1000:.1f}K"
+        return f"{int(value)}"
+    
+    def get_trend_class(change_pct):
+        if change_pct > 0:
+            return 'positive'
+        elif change_pct < 0:
+            return 'negative'
+        return 'neutral'
+    
+    def get_trend_icon(change_pct):
+        if change_pct > 0:
+            return 'up'
+        elif change_pct < 0:
+            return 'down'
+        return 'right'
+    
+    # Generate insights
+    insights_list = []
+    recommendations = []
+    
+    # Calculate changes
+    revenue_change = calc_change(stats_current['total_revenue'], stats_previous['total_revenue'])
+    tickets_change = calc_change(stats_current['total_tickets'], stats_previous['total_tickets'])
+    basket_change = calc_change(stats_current['avg_basket'], stats_previous['avg_basket'])
+    cross_sell_change = calc_change(stats_current['cross_sell_rate'], stats_previous['cross_sell_rate'])
+    single_item_change = calc_change(stats_current['single_item_rate'], stats_previous['single_item_rate'])
+    
+    # INSIGHT 1: Overall Revenue Performance
+    if abs(revenue_change) > 1:  # Only show if meaningful change
+        revenue_insight = {
+            'category': 'Revenue Analysis',
+            'title': f"Revenue {'Growth' if revenue_change > 0 else 'Decline'} of {abs(revenue_change):.1f}%",
+            'icon': 'fa-chart-line',
+            'icon_class': 'icon-positive' if revenue_change > 0 else 'icon-negative',
+            'description': '',
+            'metrics': [
+                {
+                    'label': f'{current_year} Revenue',
+                    'value': format_currency(stats_current['total_revenue']),
+                    'change': f"{revenue_change:+.1f}%",
+                    'change_class': get_trend_class(revenue_change),
+                    'change_icon': get_trend_icon(revenue_change)
+                },
+                {
+                    'label': f'{previous_year} Revenue',
+                    'value': format_currency(stats_previous['total_revenue']),
+                    'change': None
+                }
+            ],
+            'year_comparison': None
+        }
+        
+        # Generate description based on revenue components
+        if revenue_change > 0:
+            if tickets_change > basket_change:
+                revenue_insight['description'] = f"<p>Your revenue increased by <span class='highlight-positive'>{revenue_change:.1f}%</span> compared to {previous_year}, primarily driven by a <strong>{tickets_change:.1f}% increase in transaction volume</strong>. This indicates strong customer acquisition or increased purchase frequency.</p>"
+            else:
+                revenue_insight['description'] = f"<p>Your revenue grew by <span class='highlight-positive'>{revenue_change:.1f}%</span> year-over-year, with the average basket size increasing by <strong>{basket_change:.1f}%</strong>. Customers are spending more per transaction, suggesting effective upselling or premium product adoption.</p>"
+        else:
+            revenue_insight['description'] = f"<p>Revenue declined by <span class='highlight-negative'>{abs(revenue_change):.1f}%</span> compared to {previous_year}. "
+            if tickets_change < 0 and basket_change < 0:
+                revenue_insight['description'] += f"Both transaction volume (down {abs(tickets_change):.1f}%) and average basket size (down {abs(basket_change):.1f}%) decreased, indicating challenges in both customer retention and purchase value.</p>"
+            elif tickets_change < 0:
+                revenue_insight['description'] += f"This is primarily due to a <strong>{abs(tickets_change):.1f}% decrease in transaction volume</strong>, despite average basket size remaining stable.</p>"
+            else:
+                revenue_insight['description'] += f"While transaction volume increased by {tickets_change:.1f}%, the average basket size decreased by {abs(basket_change):.1f}%, suggesting customers are purchasing less per visit.</p>"
+        
+        insights_list.append(revenue_insight)
+        
+        # Add recommendations based on revenue performance
+        if revenue_change < 0:
+            if tickets_change < -5:
+                recommendations.append("Focus on customer retention and acquisition strategies to reverse the declining transaction volume. Consider loyalty programs or targeted marketing campaigns.")
+            if basket_change < -5:
+                recommendations.append("Implement bundle offers or cross-selling strategies to increase average basket size and maximize value per customer visit.")
+    
+    # INSIGHT 2: Cross-Selling Performance
+    if stats_current['cross_sell_rate'] > 0:
+        cross_sell_insight = {
+            'category': 'Customer Behavior',
+            'title': f"Cross-Selling Rate: {stats_current['cross_sell_rate']:.1f}%",
+            'icon': 'fa-layer-group',
+            'icon_class': 'icon-positive' if cross_sell_change > 0 else 'icon-warning',
+            'description': '',
+            'metrics': [
+                {
+                    'label': 'Cross-Sell Rate',
+                    'value': f"{stats_current['cross_sell_rate']:.1f}%",
+                    'change': f"{cross_sell_change:+.1f}%" if cross_sell_change != 0 else "No change",
+                    'change_class': get_trend_class(cross_sell_change),
+                    'change_icon': get_trend_icon(cross_sell_change)
+                },
+                {
+                    'label': 'Single Item Rate',
+                    'value': f"{stats_current['single_item_rate']:.1f}%",
+                    'change': f"{single_item_change:+.1f}%" if single_item_change != 0 else "No change",
+                    'change_class': 'negative' if single_item_change > 0 else 'positive',
+                    'change_icon': get_trend_icon(single_item_change)
+                }
+            ],
+            'year_comparison': None
+        }
+        
+        if cross_sell_change > 5:
+            cross_sell_insight['description'] = f"<p><strong>Excellent progress!</strong> Your cross-selling rate improved by <span class='highlight-positive'>{cross_sell_change:.1f}%</span>, with <strong>{stats_current['cross_sell_rate']:.1f}% of transactions</strong> containing 3+ items. This indicates effective merchandising and sales techniques.</p>"
+            recommendations.append("Continue strengthening cross-selling initiatives. Consider training staff on successful bundling techniques and optimizing product placement.")
+        elif cross_sell_change < -5:
+            cross_sell_insight['description'] = f"<p>Cross-selling performance declined by <span class='highlight-negative'>{abs(cross_sell_change):.1f}%</span>. Only <strong>{stats_current['cross_sell_rate']:.1f}% of customers</strong> are purchasing 3+ items per transaction, down from {stats_previous['cross_sell_rate']:.1f}% last year.</p>"
+            recommendations.append("Develop strategic product bundles and train staff on cross-selling techniques. Consider implementing 'frequently bought together' displays.")
+        else:
+            cross_sell_insight['description'] = f"<p>Your cross-selling rate is stable at <strong>{stats_current['cross_sell_rate']:.1f}%</strong>, with {format_number(stats_current['total_tickets'] * stats_current['cross_sell_rate'] / 100)} multi-item transactions. There's opportunity to further improve customer basket composition.</p>"
+            
+            if stats_current['single_item_rate'] > 30:
+                cross_sell_insight['description'] += f"<p>However, <span class='highlight-warning'>{stats_current['single_item_rate']:.1f}% of transactions</span> are single-item purchases, representing a significant opportunity for improvement.</p>"
+                recommendations.append(f"With {stats_current['single_item_rate']:.1f}% single-item purchases, focus on bundling strategies and point-of-sale suggestions to increase items per basket.")
+        
+        insights_list.append(cross_sell_insight)
+    
+    # INSIGHT 3: Basket Size Trends
+    if abs(basket_change) > 3:
+        basket_insight = {
+            'category': 'Transaction Value',
+            'title': f"Average Basket {'Increased' if basket_change > 0 else 'Decreased'} to ${stats_current['avg_basket']:.2f}",
+            'icon': 'fa-shopping-basket',
+            'icon_class': 'icon-positive' if basket_change > 0 else 'icon-negative',
+            'description': '',
+            'metrics': [
+                {
+                    'label': f'{current_year} Avg Basket',
+                    'value': f"${stats_current['avg_basket']:.2f}",
+                    'change': f"{basket_change:+.1f}%",
+                    'change_class': get_trend_class(basket_change),
+                    'change_icon': get_trend_icon(basket_change)
+                },
+                {
+                    'label': 'Items per Ticket',
+                    'value': f"{stats_current['items_per_ticket']:.1f}",
+                    'change': None
+                }
+            ],
+            'year_comparison': None
+        }
+        
+        items_change = calc_change(stats_current['items_per_ticket'], stats_previous['items_per_ticket'])
+        
+        if basket_change > 0:
+            if items_change > basket_change:
+                basket_insight['description'] = f"<p>The average basket value increased by <span class='highlight-positive'>{basket_change:.1f}%</span> to <strong>${stats_current['avg_basket']:.2f}</strong>, primarily driven by customers purchasing more items per transaction (up {items_change:.1f}%).</p>"
+            else:
+                basket_insight['description'] = f"<p>Average basket size grew by <span class='highlight-positive'>{basket_change:.1f}%</span> to <strong>${stats_current['avg_basket']:.2f}</strong>, indicating customers are trading up to higher-value products or responding well to premium offerings.</p>"
+                recommendations.append("Capitalize on the premium trend by highlighting high-margin products and creating exclusive bundles.")
+        else:
+            basket_insight['description'] = f"<p>The average basket decreased by <span class='highlight-negative'>{abs(basket_change):.1f}%</span> to <strong>${stats_current['avg_basket']:.2f}</strong>. "
+            if items_change < 0:
+                basket_insight['description'] += "Customers are purchasing fewer items per visit, suggesting potential issues with product availability, pricing, or shopping experience.</p>"
+                recommendations.append("Investigate causes of smaller baskets - consider customer feedback surveys and analyze product availability during peak periods.")
+            else:
+                basket_insight['description'] += "While customers are buying similar quantities, they're choosing lower-priced options, possibly due to economic factors or competitive pricing pressure.</p>"
+        
+        insights_list.append(basket_insight)
+    
+    # INSIGHT 4: Category Performance (if available)
+    if stats_current['top_categories']:
+        top_cat = stats_current['top_categories'][0]
+        top_cat_revenue = float(top_cat['revenue'] or 0)
+        top_cat_share = (top_cat_revenue / stats_current['total_revenue'] * 100) if stats_current['total_revenue'] > 0 else 0
+        
+        # Find previous year data for same category
+        prev_cat_data = next((c for c in stats_previous['top_categories'] if c['prodg'] == top_cat['prodg']), None)
+        
+        if prev_cat_data:
+            prev_cat_revenue = float(prev_cat_data['revenue'] or 0)
+            cat_change = calc_change(top_cat_revenue, prev_cat_revenue)
+            
+            category_insight = {
+                'category': 'Category Performance',
+                'title': f"{top_cat['prodg']} Leads with {top_cat_share:.1f}% Share",
+                'icon': 'fa-tags',
+                'icon_class': 'icon-positive' if cat_change > 0 else 'icon-warning',
+                'description': f"<p><strong>{top_cat['prodg']}</strong> is your top-performing category, generating <span class='highlight'>{format_currency(top_cat_revenue)}</span> ({top_cat_share:.1f}% of total revenue). ",
+                'metrics': [
+                    {
+                        'label': 'Category Revenue',
+                        'value': format_currency(top_cat_revenue),
+                        'change': f"{cat_change:+.1f}%",
+                        'change_class': get_trend_class(cat_change),
+                        'change_icon': get_trend_icon(cat_change)
+                    },
+                    {
+                        'label': 'Revenue Share',
+                        'value': f"{top_cat_share:.1f}%",
+                        'change': None
+                    }
+                ],
+                'year_comparison': None
+            }
+            
+            if cat_change > 10:
+                category_insight['description'] += f"This category grew by <span class='highlight-positive'>{cat_change:.1f}%</span> year-over-year, significantly outpacing overall business growth.</p>"
+                recommendations.append(f"Invest in expanding the {top_cat['prodg']} category - increase inventory depth, add complementary products, and feature prominently in marketing.")
+            elif cat_change < -10:
+                category_insight['description'] += f"However, this category declined by <span class='highlight-negative'>{abs(cat_change):.1f}%</span> compared to last year, which is concerning given its importance to your business.</p>"
+                recommendations.append(f"Investigate the decline in {top_cat['prodg']} - analyze pricing, competition, and product freshness. Consider category refresh or promotional support.")
+            else:
+                category_insight['description'] += f"Performance changed by {cat_change:+.1f}% versus last year.</p>"
+            
+            insights_list.append(category_insight)
+    
+    # INSIGHT 5: Location Performance (if filtered or if there's variance)
+    if stats_current['top_locations'] and len(stats_current['top_locations']) > 1:
+        top_loc = stats_current['top_locations'][0]
+        bottom_loc = stats_current['top_locations'][-1]
+        
+        top_loc_revenue = float(top_loc['revenue'] or 0)
+        bottom_loc_revenue = float(bottom_loc['revenue'] or 0)
+        
+        if top_loc_revenue > 0 and bottom_loc_revenue > 0:
+            variance_ratio = top_loc_revenue / bottom_loc_revenue
+            
+            if variance_ratio > 2:  # Significant variance
+                location_insight = {
+                    'category': 'Location Analysis',
+                    'title': 'Significant Performance Variance Across Locations',
+                    'icon': 'fa-map-marker-alt',
+                    'icon_class': 'icon-warning',
+                    'description': f"<p>There's significant performance variance across locations. <strong>{top_loc['un']}</strong> generates {format_currency(top_loc_revenue)}, while <strong>{bottom_loc['un']}</strong> generates {format_currency(bottom_loc_revenue)} - a {variance_ratio:.1f}x difference.</p>",
+                    'metrics': [
+                        {
+                            'label': 'Top Location',
+                            'value': format_currency(top_loc_revenue),
+                            'change': None
+                        },
+                        {
+                            'label': 'Performance Spread',
+                            'value': f"{variance_ratio:.1f}x",
+                            'change': None
+                        }
+                    ],
+                    'year_comparison': None
+                }
+                
+                recommendations.append(f"Analyze best practices from {top_loc['un']} and apply learnings to underperforming locations. Consider staffing, inventory, and local marketing differences.")
+                insights_list.append(location_insight)
+    
+    # INSIGHT 6: Multi-year trend (if we have 3 years of data)
+    if stats_two_years:
+        revenue_3yr_growth = calc_change(stats_current['total_revenue'], stats_two_years['total_revenue'])
+        cagr = (((stats_current['total_revenue'] / stats_two_years['total_revenue']) ** (1/2)) - 1) * 100 if stats_two_years['total_revenue'] > 0 else 0
+        
+        if abs(revenue_3yr_growth) > 10:
+            trend_insight = {
+                'category': 'Long-term Trends',
+                'title': f"{current_year - two_years_ago}-Year Performance Trajectory",
+                'icon': 'fa-chart-area',
+                'icon_class': 'icon-positive' if revenue_3yr_growth > 0 else 'icon-negative',
+                'description': f"<p>Over the past {current_year - two_years_ago} years, revenue {'grew' if revenue_3yr_growth > 0 else 'declined'} by <span class='{'highlight-positive' if revenue_3yr_growth > 0 else 'highlight-negative'}'>{abs(revenue_3yr_growth):.1f}%</span> (CAGR: {cagr:+.1f}%). ",
+                'metrics': [],
+                'year_comparison': [
+                    {
+                        'year': str(current_year),
+                        'stats': [
+                            {'label': 'Revenue', 'value': format_currency(stats_current['total_revenue'])},
+                            {'label': 'Tickets', 'value': format_number(stats_current['total_tickets'])},
+                            {'label': 'Avg Basket', 'value': f"${stats_current['avg_basket']:.2f}"}
+                        ]
+                    },
+                    {
+                        'year': str(previous_year),
+                        'stats': [
+                            {'label': 'Revenue', 'value': format_currency(stats_previous['total_revenue'])},
+                            {'label': 'Tickets', 'value': format_number(stats_previous['total_tickets'])},
+                            {'label': 'Avg Basket', 'value': f"${stats_previous['avg_basket']:.2f}"}
+                        ]
+                    },
+                    {
+                        'year': str(two_years_ago),
+                        'stats': [
+                            {'label': 'Revenue', 'value': format_currency(stats_two_years['total_revenue'])},
+                            {'label': 'Tickets', 'value': format_number(stats_two_years['total_tickets'])},
+                            {'label': 'Avg Basket', 'value': f"${stats_two_years['avg_basket']:.2f}"}
+                        ]
+                    }
+                ]
+            }
+            
+            # Analyze the trend trajectory
+            recent_growth = calc_change(stats_current['total_revenue'], stats_previous['total_revenue'])
+            older_growth = calc_change(stats_previous['total_revenue'], stats_two_years['total_revenue'])
+            
+            if recent_growth > older_growth:
+                trend_insight['description'] += f"Growth is <strong>accelerating</strong> - {current_year} saw {recent_growth:.1f}% growth compared to {older_growth:.1f}% in the prior year.</p>"
+            elif recent_growth < older_growth:
+                trend_insight['description'] += f"Growth is <strong>decelerating</strong> - {current_year} saw {recent_growth:.1f}% growth compared to {older_growth:.1f}% in the prior year.</p>"
+            else:
+                trend_insight['description'] += f"Growth is <strong>consistent</strong> at approximately {recent_growth:.1f}% year-over-year.</p>"
+            
+            insights_list.append(trend_insight)
+    
+    # Prepare summary for the overview section
+    summary = {
+        'total_revenue': format_currency(stats_current['total_revenue']),
+        'revenue_change': f"{abs(revenue_change):.1f}%",
+        'revenue_trend': get_trend_class(revenue_change),
+        'revenue_trend_icon': get_trend_icon(revenue_change),
+        
+        'total_tickets': format_number(stats_current['total_tickets']),
+        'tickets_change': f"{abs(tickets_change):.1f}%",
+        'tickets_trend': get_trend_class(tickets_change),
+        'tickets_trend_icon': get_trend_icon(tickets_change),
+        
+        'avg_basket': f"${stats_current['avg_basket']:.2f}",
+        'basket_change': f"{abs(basket_change):.1f}%",
+        'basket_trend': get_trend_class(basket_change),
+        'basket_trend_icon': get_trend_icon(basket_change),
+        
+        'cross_sell_rate': f"{stats_current['cross_sell_rate']:.1f}",
+        'cross_sell_change': f"{abs(cross_sell_change):.1f}%",
+        'cross_sell_trend': get_trend_class(cross_sell_change),
+        'cross_sell_trend_icon': get_trend_icon(cross_sell_change)
+    }
+    
+    # Date range text
+    date_range_text = f"{start_date.strftime('%b %d')} - {end_date.strftime('%b %d')}, {current_year}"
+    if selected_locations:
+        location_text = ', '.join(selected_locations[:3])
+        if len(selected_locations) > 3:
+            location_text += f" +{len(selected_locations) - 3} more"
+        date_range_text += f" • {location_text}"
+    
+    return {
+        'insights': insights_list,
+        'recommendations': recommendations,
+        'summary': summary,
+        'date_range_text': date_range_text,
+        'current_year': current_year,
+        'previous_year': previous_year,
+        'two_years_ago': two_years_ago,
+    }
+
+
+# ===== STORED PAYLOADS =====
+
+def common_insight_filters(comparisons=None):
+    """
+    The filters most insights visits use: each comparison over its full
+    current year without line filters, for all locations, every single
+    location and every non-admin's allowed locations.
+    """
+    locations = (
+        DailySalesRollup.objects.exclude(un__in=EXCLUDED_LOCATIONS).exclude(un__isnull=True)
+        .values_list('un', flat=True).distinct().order_by('un')
+    )
+    location_sets = [()] + [(location,) for location in locations]
+    for profile in UserProfile.objects.filter(is_admin=False):
+        allowed = tuple(sorted(set(profile.get_allowed_locations())))
+        if allowed and allowed not in location_sets:
+            location_sets.append(allowed)
+
+    filters = []
+    for comparison in comparisons or COMPARISON_YEARS:
+        current_year, previous_year = COMPARISON_YEARS[comparison]
+        filters += [
+            SalesFilter(current_year, previous_year, date(current_year, 1, 1), date(current_year, 12, 31), locations)
+            for locations in location_sets
+        ]
+    return filters
+
+
+def stored_insight_payload(sales_filter):
+    """The precomputed payload of ``sales_filter``, or None"""
+    return InsightSnapshot.objects.filter(filter_key=sales_filter.key).values_list('payload', flat=True).first()
+
+
+def precompute_insights(comparisons=None, log=print):
+    """Build and store the payload of every common filter; returns how many were stored"""
+    start = time.time()
+    filters = common_insight_filters(comparisons)
+    for sales_filter in filters:
+        InsightSnapshot.objects.update_or_create(
+            filter_key=sales_filter.key,
+            defaults={
+                'current_year': sales_filter.current_year,
+                'previous_year': sales_filter.previous_year,
+                'params': sales_filter.as_params(),
+                'payload': build_insight_payload(sales_filter),
+            }
+        )
+    log(f"✓ Stored {len(filters)} insight payloads in {time.time() - start:.2f}s")
+    return len(filters)
+
+
+def invalidate_insights(start_date, end_date):
+    """Drop the stored payloads that read any year in [start_date, end_date]"""
+    # A payload reads current_year down to previous_year - 1 (two years ago)
+    deleted, _ = InsightSnapshot.objects.filter(
+        current_year__gte=start_date.year, previous_year__lte=end_date.year + 1
+    ).delete()
+    print(f"✓ Dropped {deleted} stored insight payloads for {start_date.year}-{end_date.year}")
@@ -0,0 +1,181 @@
+# sales_app/insight_stats.py
+# Year-over-year figures of the insights page: every compared year in the
+# same grouped statements (rows labelled with their year), not one set of
+# queries per year
+
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import Sum, Count, Q, Case, When, Value, IntegerField
+
+from sales_app.models import Sales, TicketSummary
+
+
+# Non-POP selling lines per ticket, bucketed per year (used when line
+# filters rule out the ticket summary)
+CROSS_SELL_SQL = """
+    WITH ticket_sizes (period_year, items) AS (
+        {tickets_sql}
+    )
+    SELECT
+        period_year,
+        COUNT(*) AS total,
+        COUNT(CASE WHEN items >= 3 THEN 1 END) AS cross_sell,
+        COUNT(CASE WHEN items = 1 THEN 1 END) AS single_item
+    FROM ticket_sizes
+    GROUP BY period_year
+"""
+
+# Top categories, products and locations of every year by revenue
+# (ROW_NUMBER per list and year)
+TOP_LISTS_SQL = """
+    WITH lines (prodg, prod, un, zedd, tanxa, idreal1, period_year) AS (
+        {lines_sql}
+    ),
+    grouped AS (
+        SELECT 'categories' AS list, period_year, prodg AS name, SUM(tanxa) AS revenue, NULL AS quantity, NULL AS tickets
+        FROM lines
+        GROUP BY period_year, prodg
+        UNION ALL
+        SELECT 'products', period_year, prod, SUM(tanxa), COUNT(idreal1), NULL
+        FROM lines
+        GROUP BY period_year, prod
+        UNION ALL
+        SELECT 'locations', period_year, un, SUM(tanxa), NULL, COUNT(DISTINCT zedd)
+        FROM lines
+        GROUP BY period_year, un
+    ),
+    ranked AS (
+        SELECT grouped.*, ROW_NUMBER() OVER (PARTITION BY list, period_year ORDER BY revenue DESC) AS position
+        FROM grouped
+    )
+    SELECT list, period_year, name, revenue, quantity, tickets
+    FROM ranked
+    WHERE position <= %s
+    ORDER BY list, period_year, position
+"""
+
+# list -> (name column, extra columns) of the insights top lists
+TOP_LISTS = {
+    'categories': ('prodg', ()),
+    'products': ('prod', ('quantity',)),
+    'locations': ('un', ('tickets',)),
+}
+
+
+def _in_years(queryset, sales_filter, years, field='cd'):
+    """Rows of the selected days in any of ``years``, annotated with period_year"""
+    windows = {year: sales_filter.window(year) for year in years}
+    day_q = (lambda window: window.q()) if field == 'cd' else (lambda window: window.day_q(field))
+    return queryset.filter(reduce(or_, (day_q(window) for window in windows.values()))).annotate(
+        period_year=Case(
+            *[When(day_q(window), then=Value(year)) for year, window in windows.items()],
+            output_field=IntegerField()
+        )
+    )
+
+
+def _fetch_dicts(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _cross_sell_counts(sales_filter, years):
+    """{year: {'total', 'cross_sell', 'single_item'}} of tickets with non-POP selling lines"""
+    if not sales_filter.has_line_filters:
+        tickets = _in_years(sales_filter.apply(TicketSummary.objects.all(), lines=False), sales_filter, years, field='day')
+        return {
+            row['period_year']: row
+            for row in tickets.filter(non_pop_count__gt=0).values('period_year').annotate(
+                total=Count('id'),
+                cross_sell=Count('id', filter=Q(non_pop_count__gte=3)),
+                single_item=Count('id', filter=Q(non_pop_count=1))
+            ).order_by()
+        }
+
+    ticket_sizes = (
+        _in_years(sales_filter.apply(Sales.objects.all()), sales_filter, years)
+        .filter(prodt='selling item')
+        .exclude(tanxa=0)
+        .exclude(prodg='POP')
+        .values('zedd', 'period_year')
+        .annotate(items=Count('idreal1'))
+        .order_by()
+        .values_list('period_year', 'items')
+    )
+    if ticket_sizes.query.is_empty():
+        return {}
+    tickets_sql, params = ticket_sizes.query.sql_with_params()
+    return {row['period_year']: row for row in _fetch_dicts(CROSS_SELL_SQL.format(tickets_sql=tickets_sql), params)}
+
+
+def _top_lists(lines, top=5):
+    """{year: {'top_categories': [...], 'top_products': [...], 'top_locations': [...]}}"""
+    lines = lines.order_by().values_list('prodg', 'prod', 'un', 'zedd', 'tanxa', 'idreal1', 'period_year')
+    if lines.query.is_empty():
+        return {}
+    lines_sql, params = lines.query.sql_with_params()
+
+    tops = {}
+    for row in _fetch_dicts(TOP_LISTS_SQL.format(lines_sql=lines_sql), (*params, top)):
+        name_column, extra_columns = TOP_LISTS[row['list']]
+        year_tops = tops.setdefault(row['period_year'], {f'top_{name}': [] for name in TOP_LISTS})
+        year_tops[f"top_{row['list']}"].append({
+            name_column: row['name'], 'revenue': row['revenue'],
+            **{column: row[column] for column in extra_columns}
+        })
+    return tops
+
+
+def year_stats(sales_filter, years):
+    """
+    {year: stats} for every year in ``years`` over the selected days: revenue,
+    tickets, items, basket, discount share, cross-sell / single-item rates
+    and the top 5 categories, products and locations. Three statements
+    whatever the number of years.
+    """
+    lines = _in_years(sales_filter.apply(Sales.objects.all()), sales_filter, years)
+    totals = {
+        row['period_year']: row
+        for row in lines.values('period_year').annotate(
+            total_revenue=Sum('tanxa'),
+            total_tickets=Count('zedd', distinct=True),
+            total_items=Count('zedd'),
+            discount_total=Sum('discount_price'),
+            std_price_total=Sum('std_price')
+        ).order_by()
+    }
+    cross_sell = _cross_sell_counts(sales_filter, years)
+    tops = _top_lists(lines)
+
+    stats = {}
+    for year in years:
+        basic_stats = totals.get(year, {})
+        total_tickets = basic_stats.get('total_tickets') or 0
+        total_revenue = float(basic_stats.get('total_revenue') or 0)
+        total_items = basic_stats.get('total_items') or 0
+        discount_total = basic_stats.get('discount_total')
+        std_price_total = basic_stats.get('std_price_total')
+
+        ticket_counts = cross_sell.get(year, {})
+        total_analyzed_tickets = ticket_counts.get('total') or 0
+
+        def rate(count):
+            return (count / total_analyzed_tickets * 100) if total_analyzed_tickets > 0 else 0
+
+        stats[year] = {
+            'year': year,
+            'total_revenue': total_revenue,
+            'total_tickets': total_tickets,
+            'total_items': total_items,
+            'avg_basket': total_revenue / total_tickets if total_tickets > 0 else 0,
+            'items_per_ticket': total_items / total_tickets if total_tickets > 0 else 0,
+            'discount_share': (1 - (discount_total / std_price_total)) * 100 if std_price_total and std_price_total > 0 else 0,
+            'cross_sell_rate': rate(ticket_counts.get('cross_sell') or 0),
+            'single_item_rate': rate(ticket_counts.get('single_item') or 0),
+            **tops.get(year, {f'top_{name}': [] for name in TOP_LISTS}),
+        }
+    return stats
@@ -0,0 +1,179 @@
+# sales_app/jobs.py
+# Database-backed background jobs: enqueue from a request, run from
+# `manage.py run_jobs`, serve the stored file when done
+
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from sales_app.filters import SalesFilter
+from sales_app.insight_report import precompute_insights
+from sales_app.location_report import build_location_report
+from sales_app.models import BackgroundJob
+
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+LOCATION_REPORT_JOB = 'location_report'
+INSIGHTS_JOB = 'insights'
+
+# Workers bump heartbeat_at of their running job this often; a job whose
+# heartbeat is older than STALE_AFTER belongs to a dead worker, however
+# long the job itself has been running
+HEARTBEAT_INTERVAL = 60
+STALE_AFTER = timedelta(minutes=5)
+MAX_ATTEMPTS = 3
+
+# Finished jobs (and their files) are kept this long
+KEEP_FINISHED = timedelta(days=7)
+
+
+def run_location_report(params):
+    """(filename, content type, bytes) of the location Excel export"""
+    filename, content = build_location_report(SalesFilter.from_params(params))
+    return filename, XLSX_CONTENT_TYPE, content
+
+
+def run_insights(params):
+    """Precompute the stored insights payloads; the file is a one-line summary"""
+    stored = precompute_insights(params.get('comparisons'))
+    return 'insights.txt', 'text/plain', f"{stored} insight payloads stored\n".encode()
+
+
+# kind -> handler(params) returning (filename, content type, bytes)
+JOB_HANDLERS = {
+    LOCATION_REPORT_JOB: run_location_report,
+    INSIGHTS_JOB: run_insights,
+}
+
+
+def enqueue_job(kind, params, user=None):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = BackgroundJob.objects.create(kind=kind, params=params, created_by=user)
+    print(f"✓ Queued {kind} job {job.id}")
+    return job
+
+
+def enqueue_job_once(kind, params, user=None):
+    """enqueue_job() unless the same job is already waiting in the queue"""
+    job = BackgroundJob.objects.filter(kind=kind, params=params, status=BackgroundJob.QUEUED).first()
+    return job or enqueue_job(kind, params, user)
+
+
+def claim_next_job():
+    """
+    Oldest queued job, switched to running by this worker, or None.
+
+    The queued -> running UPDATE is a compare-and-set on the status, so two
+    workers never run the same job (no SELECT ... FOR UPDATE needed).
+    """
+    while True:
+        job_id = (
+            BackgroundJob.objects.filter(status=BackgroundJob.QUEUED)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+
+        claimed = BackgroundJob.objects.filter(id=job_id, status=BackgroundJob.QUEUED).update(
+            status=BackgroundJob.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now(),
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return BackgroundJob.objects.get(id=job_id)
+
+
+def _heartbeat(job_id, stop):
+    """Bump heartbeat_at of a running job every HEARTBEAT_INTERVAL seconds until ``stop`` is set"""
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            BackgroundJob.objects.filter(id=job_id, status=BackgroundJob.RUNNING).update(heartbeat_at=timezone.now())
+    finally:
+        connections.close_all()
+
+
+def run_job(job):
+    """Run one claimed job and store its file or its error"""
+    start = time.time()
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job.id, stop), daemon=True)
+    heartbeat.start()
+    try:
+        filename, content_type, content = JOB_HANDLERS[job.kind](job.params)
+    except Exception as e:
+        job.status = BackgroundJob.FAILED
+        job.error = f"{e}\n\n{traceback.format_exc()}"
+        print(f"❌ Job {job.id} ({job.kind}) failed: {e}")
+    else:
+        job.status = BackgroundJob.DONE
+        job.result_name = filename
+        job.result_content_type = content_type
+        job.result = content
+        job.error = ''
+        print(f"✓ Job {job.id} ({job.kind}) done in {time.time() - start:.2f}s: {filename}")
+    finally:
+        stop.set()
+        heartbeat.join()
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'result_name', 'result_content_type', 'result', 'finished_at'])
+    return job
+
+
+def requeue_stale_jobs():
+    """Give jobs of crashed workers (no heartbeat for STALE_AFTER) another try, or fail them after MAX_ATTEMPTS"""
+    cutoff = timezone.now() - STALE_AFTER
+    # Jobs claimed before heartbeats existed only have started_at
+    stale = BackgroundJob.objects.filter(status=BackgroundJob.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=BackgroundJob.FAILED, finished_at=timezone.now(), error='Worker stopped while running the job'
+    )
+    requeued = stale.filter(attempts__lt=MAX_ATTEMPTS).update(
+        status=BackgroundJob.QUEUED, started_at=None, heartbeat_at=None
+    )
+    if failed or requeued:
+        print(f"⚠️ Stale jobs: {requeued} requeued, {failed} failed")
+
+
+def purge_finished_jobs():
+    deleted, _ = BackgroundJob.objects.filter(
+        status__in=[BackgroundJob.DONE, BackgroundJob.FAILED],
+        finished_at__lt=timezone.now() - KEEP_FINISHED,
+    ).delete()
+    if deleted:
+        print(f"✓ Purged {deleted} finished jobs")
+
+
+def work(poll_interval=2.0, once=False, log=print):
+    """
+    Worker loop: run queued jobs oldest first, sleep ``poll_interval``
+    seconds when the queue is empty. With ``once`` return when it is empty.
+    """
+    requeue_stale_jobs()
+    purge_finished_jobs()
+    last_housekeeping = time.time()
+
+    while True:
+        close_old_connections()
+        job = claim_next_job()
+        if job is not None:
+            log(f"⚡ Running job {job.id} ({job.kind})")
+            run_job(job)
+            continue
+
+        if once:
+            return
+        if time.time() - last_housekeeping > 3600:
+            requeue_stale_jobs()
+            purge_finished_jobs()
+            last_housekeeping = time.time()
+        time.sleep(poll_interval)
@@ -0,0 +1,189 @@
+# sales_app/loaders.py
+# Bulk loading of POS dataframes into sales_main_web
+
+import io
+import time
+import uuid
+from datetime import timedelta
+
+import pandas as pd
+from django.db import connection, transaction
+from django.utils import timezone
+
+from sales_app.dates import day_start
+from sales_app.models import Sales
+from sales_app.partitions import ensure_partitions, is_partitioned, split_by_month, truncate_months
+
+
+FLOAT_FIELDS = ['raod', 'discount_price', 'sachuqari', 'std_price', 'tanxa']
+INT_FIELDS = ['idreal1', 'idtanam', 'idprodt', 'idprodg']
+
+# Rows per COPY / executemany round trip
+LOAD_CHUNK_SIZE = 50000
+
+
+def sales_fields():
+    """Sales model fields in table column order"""
+    return list(Sales._meta.concrete_fields)
+
+
+def normalize_sales_frame(df):
+    """
+    Map a POS dataframe onto the Sales columns without touching rows one by
+    one: column names are matched case-insensitively, numbers are coerced,
+    CD is made timezone-aware, and missing columns / NaN become NULL.
+
+    Returns a new DataFrame whose columns are the Sales field names.
+    """
+    columns_by_lower = {col.lower(): col for col in df.columns}
+    if 'idreal1' not in columns_by_lower:
+        raise ValueError("PKL file must contain 'IdReal1' or 'idreal1' column as primary key")
+
+    frame = pd.DataFrame(index=df.index)
+    for field in sales_fields():
+        source = columns_by_lower.get(field.name)
+        frame[field.name] = df[source] if source is not None else None
+
+    for name in FLOAT_FIELDS:
+        frame[name] = pd.to_numeric(frame[name], errors='coerce')
+    for name in INT_FIELDS:
+        frame[name] = pd.to_numeric(frame[name], errors='coerce').astype('Int64')
+
+    cd = pd.to_datetime(frame['cd'])
+    if cd.dt.tz is None:
+        # Same as timezone.make_aware() on each value
+        cd = cd.dt.tz_localize(timezone.get_current_timezone_name(), ambiguous=True, nonexistent='shift_forward')
+    frame['cd'] = cd.dt.tz_convert('UTC')
+
+    return frame
+
+
+def _copy_chunk(cursor, table, columns, chunk):
+    """Stream one chunk through COPY FROM STDIN (Postgres)"""
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, header=False, index=False, na_rep='\\N')
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer
+    )
+
+
+def _executemany_chunk(cursor, table, columns, chunk):
+    """Parameterized multi-row insert for backends without COPY (SQLite)"""
+    values = chunk.astype(object).where(chunk.notna(), None)
+    values['cd'] = [
+        connection.ops.adapt_datetimefield_value(value) if value is not None else None
+        for value in values['cd']
+    ]
+    placeholders = ', '.join(['%s'] * len(chunk.columns))
+    cursor.executemany(
+        f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+        list(values.itertuples(index=False, name=None))
+    )
+
+
+def load_sales(frame, table=None):
+    """
+    Insert a frame from normalize_sales_frame() into sales_main_web (or
+    ``table``, a table with the same columns).
+
+    Postgres gets COPY FROM STDIN in chunks, other backends executemany.
+    Runs on the current connection, so callers control the transaction.
+    Returns {'rows', 'seconds', 'rows_per_sec', 'method'}.
+    """
+    fields = sales_fields()
+    table = connection.ops.quote_name(table or Sales._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    frame = frame[[field.name for field in fields]]
+
+    if connection.vendor == 'postgresql':
+        method, load_chunk = 'copy', _copy_chunk
+    else:
+        method, load_chunk = 'executemany', _executemany_chunk
+
+    start = time.time()
+    with connection.cursor() as cursor:
+        for offset in range(0, len(frame), LOAD_CHUNK_SIZE):
+            load_chunk(cursor, table, columns, frame.iloc[offset:offset + LOAD_CHUNK_SIZE])
+    seconds = time.time() - start
+
+    rows = len(frame)
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds > 0 else rows,
+        'method': method,
+    }
+
+
+def _create_staging_table():
+    """
+    Empty, index-free copy of sales_main_web. UNLOGGED on Postgres so the
+    bulk load skips WAL; a TEMP table elsewhere.
+    """
+    name = f'sales_upload_staging_{uuid.uuid4().hex[:8]}'
+    quoted = connection.ops.quote_name(name)
+    source = connection.ops.quote_name(Sales._meta.db_table)
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'CREATE UNLOGGED TABLE {quoted} (LIKE {source} INCLUDING DEFAULTS)')
+        else:
+            cursor.execute(f'CREATE TEMP TABLE {quoted} AS SELECT * FROM {source} WHERE 0')
+    return name
+
+
+def replace_sales_range(frame, start_date, end_date):
+    """
+    Replace every sale whose CD falls on a day in [start_date, end_date] by
+    the rows of ``frame`` (from normalize_sales_frame()).
+
+    The slow part - loading the file - goes into a staging table outside any
+    transaction, so dashboards keep reading the old rows meanwhile. The
+    swap itself is one short transaction: clear the range, then
+    INSERT ... SELECT from staging. On a partitioned sales_main_web, months
+    covered completely are TRUNCATEd instead of deleted row by row, and
+    missing monthly partitions are created first. The staging table is
+    always dropped.
+
+    Returns {'deleted', 'inserted', 'load', 'swap_seconds'} where ``load``
+    is the load_sales() report for the staging load.
+    """
+    staging = _create_staging_table()
+    quoted_staging = connection.ops.quote_name(staging)
+    try:
+        load = load_sales(frame, table=staging)
+
+        table = connection.ops.quote_name(Sales._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in sales_fields())
+
+        partitioned = is_partitioned()
+        if partitioned:
+            ensure_partitions(start_date, end_date)
+            whole_months, partial_ranges = split_by_month(start_date, end_date)
+        else:
+            whole_months, partial_ranges = [], [(start_date, end_date)]
+
+        start = time.time()
+        with transaction.atomic():
+            deleted = truncate_months(whole_months)
+            for range_start, range_end in partial_ranges:
+                deleted += Sales.objects.filter(
+                    cd__gte=day_start(range_start),
+                    cd__lt=day_start(range_end + timedelta(days=1))
+                ).delete()[0]
+            with connection.cursor() as cursor:
+                cursor.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {quoted_staging}')
+                inserted = cursor.rowcount
+        swap_seconds = time.time() - start
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {quoted_staging}')
+
+    return {
+        'deleted': deleted,
+        'inserted': inserted,
+        'load': load,
+        'swap_seconds': swap_seconds,
+    }
@@ -0,0 +1,338 @@
+# sales_app/location_report.py
+# Three-sheet location performance workbook (current year, previous year,
+# comparison) behind export_location_csv and its background job
+
+from io import BytesIO
+
+from django.db import connection
+from django.db.models import Sum, Count, FloatField, ExpressionWrapper, F, Q
+from openpyxl import Workbook
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+
+# Per ticket: the number of non-POP selling lines. Joined back to the lines
+# once, so every location aggregate comes out of a single grouping pass.
+LOCATION_LINES_SQL = """
+    WITH lines (un, zedd, tanxa, prodg) AS (
+        {lines_sql}
+    ),
+    ticket_sizes AS (
+        SELECT zedd, COUNT(*) AS items
+        FROM lines
+        WHERE prodg IS NULL OR prodg <> 'POP'
+        GROUP BY zedd
+    )
+    SELECT
+        lines.un,
+        SUM(lines.tanxa) AS total,
+        COUNT(DISTINCT lines.zedd) AS tickets,
+        COUNT(*) AS quantity,
+        COUNT(DISTINCT CASE WHEN ticket_sizes.items >= 3 THEN lines.zedd END) AS three_plus,
+        COUNT(DISTINCT CASE WHEN ticket_sizes.items = 1 THEN lines.zedd END) AS one_count
+    FROM lines
+    LEFT JOIN ticket_sizes ON ticket_sizes.zedd = lines.zedd
+    GROUP BY lines.un
+    ORDER BY total DESC
+"""
+
+
+def location_data_from_lines(sales_filter, year):
+    """
+    Location rows of the report straight from sales_main_web, for filters
+    that narrow lines (category / product / campaign): revenue, tickets,
+    lines, tickets with 3+ and with exactly 1 non-POP selling line, and
+    the ratios derived from them.
+    """
+    lines = (
+        sales_filter.sales(year)
+        .filter(prodt='selling item')
+        .exclude(tanxa=0)
+        .order_by()
+        .values_list('un', 'zedd', 'tanxa', 'prodg')
+    )
+    if lines.query.is_empty():
+        return []
+    lines_sql, params = lines.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(LOCATION_LINES_SQL.format(lines_sql=lines_sql), params)
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    for row in rows:
+        tickets = row['tickets']
+        row['avg_basket'] = row['total'] * 1.0 / tickets if tickets else None
+        row['three_plus_ratio'] = row['three_plus'] * 100.0 / tickets if tickets else None
+        row['one_ratio'] = row['one_count'] * 100.0 / tickets if tickets else None
+    return rows
+
+
+def build_location_report(sales_filter):
+    """(filename, xlsx bytes) of the location report for ``sales_filter``"""
+    current_year, previous_year = sales_filter.current_year, sales_filter.previous_year
+    selected_locations = list(sales_filter.locations)
+    selected_category = sales_filter.category
+    selected_product = sales_filter.product
+    selected_campaign = sales_filter.campaign
+
+    def get_location_data(year):
+        """Helper function to get data for a specific year"""
+        ratio_annotations = dict(
+            avg_basket=ExpressionWrapper(
+                F('total') * 1.0 / F('tickets'),
+                output_field=FloatField()
+            ),
+            three_plus_ratio=ExpressionWrapper(
+                (F('three_plus') * 100.0) / F('tickets'),
+                output_field=FloatField()
+            ),
+            one_ratio=ExpressionWrapper(
+                (F('one_count') * 100.0) / F('tickets'),
+                output_field=FloatField()
+            )
+        )
+
+        # Without line filters every metric is per ticket, so read the
+        # pre-aggregated ticket summary instead of grouping raw lines
+        if not sales_filter.has_line_filters:
+            tickets = sales_filter.tickets(year).filter(selling_item_count__gt=0)
+            return tickets.values('un').annotate(
+                total=Sum('selling_total'),
+                tickets=Count('id'),
+                quantity=Sum('selling_item_count'),
+                three_plus=Count('id', filter=Q(non_pop_count__gte=3)),
+                one_count=Count('id', filter=Q(non_pop_count=1))
+            ).annotate(**ratio_annotations).order_by('-total')
+
+        # Line filters change which lines make up a ticket: group raw lines once
+        return location_data_from_lines(sales_filter, year)
+
+    # Get data for both years
+    start_date, end_date = sales_filter.start_date, sales_filter.end_date
+    previous_start = sales_filter.previous_window.start_date
+    previous_end = sales_filter.previous_window.end_date
+
+    current_data = list(get_location_data(current_year))
+    previous_data = list(get_location_data(previous_year))
+
+    # Create Excel workbook
+    wb = Workbook()
+
+    # Define styles
+    header_fill = PatternFill(start_color="667EEA", end_color="667EEA", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=11)
+    total_fill = PatternFill(start_color="E0E7FF", end_color="E0E7FF", fill_type="solid")
+    total_font = Font(bold=True, size=11)
+    info_font = Font(bold=True, size=10)
+    border = Border(
+        left=Side(style='thin', color='CCCCCC'),
+        right=Side(style='thin', color='CCCCCC'),
+        top=Side(style='thin', color='CCCCCC'),
+        bottom=Side(style='thin', color='CCCCCC')
+    )
+
+    def create_sheet(ws, data, year, sheet_name):
+        """Create a formatted sheet with location data"""
+        ws.title = sheet_name
+
+        # Add header information
+        ws['A1'] = 'Location Performance Report'
+        ws['A1'].font = Font(bold=True, size=14)
+
+        ws['A2'] = 'Year:'
+        ws['B2'] = year
+        ws['A2'].font = info_font
+
+        ws['A3'] = 'Period:'
+        if year == current_year:
+            ws['B3'] = f'{start_date} to {end_date}'
+        else:
+            ws['B3'] = f'{previous_start} to {previous_end}'
+        ws['A3'].font = info_font
+
+        ws['A4'] = 'Category:'
+        ws['B4'] = selected_category
+        ws['A4'].font = info_font
+
+        ws['A5'] = 'Product:'
+        ws['B5'] = selected_product if selected_product != 'all' else 'All'
+        ws['A5'].font = info_font
+
+        ws['A6'] = 'Campaign:'
+        ws['B6'] = selected_campaign if selected_campaign != 'all' else 'All'
+        ws['A6'].font = info_font
+
+        # Column headers (row 8)
+        headers = [
+            'Location', 'Total Amount', 'Tickets', 'Quantity', 
+            'Avg Basket', '3+ Items', '1 Item', '3+ Ratio (%)', '1 Item Ratio (%)'
+        ]
+
+        for col, header in enumerate(headers, 1):
+            cell = ws.cell(row=8, column=col, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+            cell.border = border
+
+        # Data rows
+        row_num = 9
+        total_revenue = 0
+        total_tickets = 0
+        total_quantity = 0
+        total_3plus = 0
+        total_1item = 0
+
+        for row_data in data:
+            ws.cell(row=row_num, column=1, value=row_data['un'])
+            ws.cell(row=row_num, column=2, value=round(row_data['total'], 2) if row_data['total'] else 0)
+            ws.cell(row=row_num, column=3, value=row_data['tickets'])
+            ws.cell(row=row_num, column=4, value=row_data['quantity'])
+            ws.cell(row=row_num, column=5, value=round(row_data['avg_basket'], 2) if row_data['avg_basket'] else 0)
+            ws.cell(row=row_num, column=6, value=row_data['three_plus'])
+            ws.cell(row=row_num, column=7, value=row_data['one_count'])
+            ws.cell(row=row_num, column=8, value=round(row_data['three_plus_ratio'], 2) if row_data['three_plus_ratio'] else 0)
+            ws.cell(row=row_num, column=9, value=round(row_data['one_ratio'], 2) if row_data['one_ratio'] else 0)
+
+            # Apply borders
+            for col in range(1, 10):
+                ws.cell(row=row_num, column=col).border = border
+
+            # Number formatting
+            ws.cell(row=row_num, column=2).number_format = '#,##0.00'
+            ws.cell(row=row_num, column=5).number_format = '#,##0.00'
+            ws.cell(row=row_num, column=8).number_format = '0.00'
+            ws.cell(row=row_num, column=9).number_format = '0.00'
+
+            # Accumulate totals
+            total_revenue += row_data['total'] or 0
+            total_tickets += row_data['tickets'] or 0
+            total_quantity += row_data['quantity'] or 0
+            total_3plus += row_data['three_plus'] or 0
+            total_1item += row_data['one_count'] or 0
+
+            row_num += 1
+
+        # Add totals row
+        row_num += 1
+        avg_basket_total = total_revenue / total_tickets if total_tickets > 0 else 0
+        ratio_3plus = (total_3plus / total_tickets * 100) if total_tickets > 0 else 0
+        ratio_1item = (total_1item / total_tickets * 100) if total_tickets > 0 else 0
+
+        ws.cell(row=row_num, column=1, value='TOTAL')
+        ws.cell(row=row_num, column=2, value=round(total_revenue, 2))
+        ws.cell(row=row_num, column=3, value=total_tickets)
+        ws.cell(row=row_num, column=4, value=total_quantity)
+        ws.cell(row=row_num, column=5, value=round(avg_basket_total, 2))
+        ws.cell(row=row_num, column=6, value=total_3plus)
+        ws.cell(row=row_num, column=7, value=total_1item)
+        ws.cell(row=row_num, column=8, value=round(ratio_3plus, 2))
+        ws.cell(row=row_num, column=9, value=round(ratio_1item, 2))
+
+        # Style totals row
+        for col in range(1, 10):
+            cell = ws.cell(row=row_num, column=col)
+            cell.fill = total_fill
+            cell.font = total_font
+            cell.border = border
+
+        ws.cell(row=row_num, column=2).number_format = '#,##0.00'
+        ws.cell(row=row_num, column=5).number_format = '#,##0.00'
+        ws.cell(row=row_num, column=8).number_format = '0.00'
+        ws.cell(row=row_num, column=9).number_format = '0.00'
+
+        # Adjust column widths
+        ws.column_dimensions['A'].width = 25
+        for col in range(2, 10):
+            ws.column_dimensions[get_column_letter(col)].width = 15
+
+    # Create sheets for current and previous year
+    ws_current = wb.active
+    create_sheet(ws_current, current_data, current_year, f'{current_year}')
+
+    ws_previous = wb.create_sheet(title=f'{previous_year}')
+    create_sheet(ws_previous, previous_data, previous_year, f'{previous_year}')
+
+    # Create comparison sheet
+    ws_comparison = wb.create_sheet(title='Comparison')
+    ws_comparison['A1'] = f'{previous_year} vs {current_year} Comparison'
+    ws_comparison['A1'].font = Font(bold=True, size=14)
+
+    # Comparison headers
+    comp_headers = [
+        'Location', 
+        f'{previous_year} Revenue', f'{current_year} Revenue', 'Revenue Change', 'Revenue Change %',
+        f'{previous_year} Tickets', f'{current_year} Tickets', 'Tickets Change', 'Tickets Change %'
+    ]
+
+    for col, header in enumerate(comp_headers, 1):
+        cell = ws_comparison.cell(row=3, column=col, value=header)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+        cell.border = border
+
+    # Create comparison data
+    prev_dict = {row['un']: row for row in previous_data}
+    curr_dict = {row['un']: row for row in current_data}
+    all_locations = sorted(set(list(prev_dict.keys()) + list(curr_dict.keys())))
+
+    row_num = 4
+    for location in all_locations:
+        prev = prev_dict.get(location, {})
+        curr = curr_dict.get(location, {})
+
+        prev_revenue = prev.get('total', 0) or 0
+        curr_revenue = curr.get('total', 0) or 0
+        revenue_change = curr_revenue - prev_revenue
+        revenue_change_pct = ((revenue_change / prev_revenue) * 100) if prev_revenue > 0 else 0
+
+        prev_tickets = prev.get('tickets', 0) or 0
+        curr_tickets = curr.get('tickets', 0) or 0
+        tickets_change = curr_tickets - prev_tickets
+        tickets_change_pct = ((tickets_change / prev_tickets) * 100) if prev_tickets > 0 else 0
+
+        ws_comparison.cell(row=row_num, column=1, value=location)
+        ws_comparison.cell(row=row_num, column=2, value=round(prev_revenue, 2))
+        ws_comparison.cell(row=row_num, column=3, value=round(curr_revenue, 2))
+        ws_comparison.cell(row=row_num, column=4, value=round(revenue_change, 2))
+        ws_comparison.cell(row=row_num, column=5, value=round(revenue_change_pct, 2))
+        ws_comparison.cell(row=row_num, column=6, value=prev_tickets)
+        ws_comparison.cell(row=row_num, column=7, value=curr_tickets)
+        ws_comparison.cell(row=row_num, column=8, value=tickets_change)
+        ws_comparison.cell(row=row_num, column=9, value=round(tickets_change_pct, 2))
+
+        # Apply conditional formatting colors
+        for col in [4, 5, 8, 9]:
+            cell = ws_comparison.cell(row=row_num, column=col)
+            value = cell.value
+            if value > 0:
+                cell.font = Font(color="10B981")
+            elif value < 0:
+                cell.font = Font(color="EF4444")
+
+        # Apply borders
+        for col in range(1, 10):
+            ws_comparison.cell(row=row_num, column=col).border = border
+
+        row_num += 1
+
+    # Adjust comparison sheet column widths
+    ws_comparison.column_dimensions['A'].width = 25
+    for col in range(2, 10):
+        ws_comparison.column_dimensions[get_column_letter(col)].width = 16
+
+    # Create filename
+    filename_parts = [f'location_report_{current_year}_vs_{previous_year}']
+    if selected_locations:
+        filename_parts.append(f'{len(selected_locations)}locations')
+    if selected_category != 'all':
+        filename_parts.append(selected_category.replace(' ', '_'))
+    filename_parts.append(f'{start_date.strftime("%Y%m%d")}-{end_date.strftime("%Y%m%d")}')
+
+    filename = '_'.join(filename_parts) + '.xlsx'
+
+    output = BytesIO()
+    wb.save(output)
+    return filename, output.getvalue()
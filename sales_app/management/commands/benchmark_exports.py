@@ -0,0 +1,73 @@
+# sales_app/management/commands/benchmark_exports.py
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from sales_app.exports import EXPORT_FORMATS, export_chunks
+
+
+BASE_QUERY = 'SELECT * FROM sales_main_web'
+
+
+class Command(BaseCommand):
+    help = 'Time the query console export formats at several result sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help='Result sizes to export (default 10000 100000 1000000)')
+        parser.add_argument('--formats', nargs='+', choices=list(EXPORT_FORMATS), default=list(EXPORT_FORMATS),
+                            help='Formats to benchmark (default: all)')
+        parser.add_argument('--sql', default=BASE_QUERY,
+                            help='Plain SELECT to export; repeated as often as needed to reach --rows')
+        parser.add_argument('--memory', action='store_true',
+                            help='Also report peak Python memory (tracemalloc, makes every run slower)')
+
+    def handle(self, *args, **options):
+        base_sql = options['sql'].strip().rstrip(';')
+        if not base_sql.upper().startswith('SELECT'):
+            raise CommandError('--sql must be a plain SELECT')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM ({base_sql}) base')
+            base_rows = cursor.fetchone()[0]
+        if not base_rows:
+            raise CommandError('The query returns no rows, nothing to export')
+
+        self.stdout.write(f'{"rows":>9}  {"format":<8} {"seconds":>8} {"rows/s":>9} {"MB":>8}'
+                          + (f' {"peak MB":>8}' if options['memory'] else ''))
+
+        for row_count in options['rows']:
+            sql = self._sized_query(base_sql, base_rows, row_count)
+            for export_format in options['formats']:
+                seconds, size, peak = self._run(sql, export_format, options['memory'])
+                line = (f'{row_count:>9}  {export_format:<8} {seconds:>8.2f} '
+                        f'{row_count / seconds:>9.0f} {size / 1e6:>8.1f}')
+                if options['memory']:
+                    line += f' {peak / 1e6:>8.1f}'
+                self.stdout.write(self.style.SUCCESS(line))
+
+        self.stdout.write(self.style.SUCCESS('\n✓ Export benchmark finished'))
+
+    def _sized_query(self, base_sql, base_rows, row_count):
+        """``base_sql`` repeated (recursive CTE, works on Postgres and SQLite) and cut to ``row_count`` rows"""
+        copies = -(-row_count // base_rows)
+        return (
+            f'WITH RECURSIVE copies(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM copies WHERE n < {copies}) '
+            f'SELECT base.* FROM ({base_sql}) base CROSS JOIN copies LIMIT {row_count}'
+        )
+
+    def _run(self, sql, export_format, measure_memory):
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        chunks = export_chunks(sql, export_format)
+        next(chunks)  # column names
+        size = sum(len(chunk) for chunk in chunks)
+        seconds = time.perf_counter() - start
+        peak = 0
+        if measure_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return seconds, size, peak
@@ -0,0 +1,88 @@
+# sales_app/management/commands/benchmark_plans.py
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sales_app.plans import (
+    get_plan_store, expand_plan_daily, aggregate_plan_actual, plan_totals_by_geo
+)
+
+
+AGGREGATIONS = ['daily', 'weekly', 'monthly']
+
+
+class Command(BaseCommand):
+    help = 'Time the plan vs actual pipeline of plan_workflow for all locations over a full year'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, default=2026, help='Plan year (default 2026)')
+        parser.add_argument('--locations', type=int, default=0,
+                            help='Use this many synthetic locations instead of the plan workbook')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per step, the best one is reported')
+
+    def handle(self, *args, **options):
+        year = options['year']
+        start_date, end_date = date(year, 1, 1), date(year, 12, 31)
+
+        if options['locations']:
+            plan_rows = self._synthetic_plan(options['locations'], year)
+        else:
+            plan_rows = get_plan_store().slice(start_date, end_date)
+        if plan_rows.empty:
+            raise CommandError(f'No plan rows for {year}')
+
+        geos = plan_rows['geo'].unique()
+        actual_records = self._synthetic_actuals(geos, start_date, end_date)
+        self.stdout.write(f'{len(geos)} locations, {len(plan_rows)} plan rows, '
+                          f'{len(actual_records)} daily actual rows, {year}')
+
+        plan_daily = expand_plan_daily(plan_rows, start_date, end_date)
+        steps = [('expand', lambda: expand_plan_daily(plan_rows, start_date, end_date))]
+        steps += [
+            (f'aggregate {aggregation}',
+             lambda aggregation=aggregation: aggregate_plan_actual(plan_daily, actual_records, start_date, end_date, aggregation))
+            for aggregation in AGGREGATIONS
+        ]
+        steps.append(('location totals', lambda: plan_totals_by_geo(plan_daily)))
+
+        for name, step in steps:
+            best = min(self._time(step) for _ in range(options['repeat']))
+            self.stdout.write(self.style.SUCCESS(f'{name:<20} {best * 1000:>9.1f} ms'))
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Plan benchmark finished ({len(plan_daily)} daily plan rows)'))
+
+    def _time(self, step):
+        start = time.perf_counter()
+        step()
+        return time.perf_counter() - start
+
+    def _synthetic_plan(self, locations, year):
+        """PlanStore-shaped rows: every location, every month of ``year``"""
+        rng = np.random.default_rng(0)
+        n = locations * 12
+        frame = pd.DataFrame({
+            'Year': year,
+            'Month': np.tile(np.arange(1, 13), locations),
+            'geo': np.repeat([f'Location {i + 1}' for i in range(locations)], 12),
+            'Plan_turnover': rng.uniform(50000, 500000, n).round(),
+            'Plan_tickets': rng.uniform(1000, 10000, n).round(),
+        })
+        frame['location'] = frame['geo']
+        frame['Plan_basket'] = frame['Plan_turnover'] / frame['Plan_tickets']
+        frame['plan_date'] = pd.to_datetime(frame[['Year', 'Month']].assign(day=1))
+        return frame
+
+    def _synthetic_actuals(self, geos, start_date, end_date):
+        """Rows shaped like the per location and day query of plan_workflow"""
+        rng = np.random.default_rng(1)
+        days = (end_date - start_date).days + 1
+        first = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+        return [
+            {'un': geo, 'cd': first + timedelta(days=day),
+             'actual_turnover': float(rng.uniform(1000, 20000)), 'tickets': int(rng.integers(20, 400))}
+            for day in range(days) for geo in geos
+        ]
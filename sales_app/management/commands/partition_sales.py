@@ -0,0 +1,51 @@
+# sales_app/management/commands/partition_sales.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from sales_app.dates import next_month
+from sales_app.partitions import (
+    TABLE, convert_to_partitioned, ensure_partitions, is_partitioned, partition_name,
+)
+
+
+class Command(BaseCommand):
+    help = 'Convert sales_main_web to monthly range partitions on CD, or create upcoming partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Rebuild the table as a partitioned table (run with uploads paused)')
+        parser.add_argument('--ahead', type=int, default=3,
+                            help='Months after the current one to pre-create partitions for (default 3)')
+        parser.add_argument('--batch-months', type=int, default=1,
+                            help='Months copied per transaction during --convert (default 1)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning is only supported on PostgreSQL')
+
+        if options['convert']:
+            try:
+                convert_to_partitioned(
+                    log=lambda message: self.stdout.write(self.style.SUCCESS(message)),
+                    batch_months=max(1, options['batch_months'])
+                )
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+        if not is_partitioned():
+            self.stdout.write(self.style.WARNING(f'- {TABLE} is not partitioned yet, run with --convert'))
+            return
+
+        # Keep partitions ready for the next uploads
+        this_month = timezone.localdate().replace(day=1)
+        last_month = this_month
+        for _ in range(max(0, options['ahead'])):
+            last_month = next_month(last_month)
+        created = ensure_partitions(this_month, last_month)
+
+        for name in created:
+            self.stdout.write(self.style.SUCCESS(f'✓ Created {name}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✓ Partitions present through {partition_name(last_month)}'
+        ))
@@ -0,0 +1,16 @@
+# sales_app/management/commands/precompute_insights.py
+from django.core.management.base import BaseCommand
+
+from sales_app.filters import COMPARISON_YEARS
+from sales_app.insight_report import precompute_insights
+
+
+class Command(BaseCommand):
+    help = 'Store the insights page of the common filters (run after uploads or from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comparison', action='append', choices=list(COMPARISON_YEARS),
+                            help='Only this comparison (repeatable, default: all of them)')
+
+    def handle(self, *args, **options):
+        precompute_insights(options['comparison'], log=lambda message: self.stdout.write(self.style.SUCCESS(message)))
@@ -0,0 +1,55 @@
+# sales_app/management/commands/refresh_rollups.py
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min, Max
+from django.utils import timezone
+
+from sales_app.facets import invalidate_facets
+from sales_app.models import Sales
+from sales_app.rollups import refresh_rollups, incremental_range, month_chunks
+
+
+class Command(BaseCommand):
+    help = 'Refresh pre-aggregated sales tables (incremental by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--full', action='store_true', help='Rebuild everything from the first sale')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else None
+            end_date = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else None
+        except ValueError:
+            raise CommandError('Dates must use the YYYY-MM-DD format')
+
+        if options['full']:
+            sales_range = Sales.objects.aggregate(min_cd=Min('cd'), max_cd=Max('cd'))
+            if not sales_range['min_cd']:
+                self.stdout.write(self.style.WARNING('- No sales data, nothing to refresh'))
+                return
+            start_date = timezone.localtime(sales_range['min_cd']).date()
+            end_date = timezone.localtime(sales_range['max_cd']).date()
+        elif not start_date or not end_date:
+            auto_start, auto_end = incremental_range()
+            if auto_start is None:
+                self.stdout.write(self.style.WARNING('- No sales data, nothing to refresh'))
+                return
+            start_date = start_date or auto_start
+            end_date = end_date or auto_end
+
+        if start_date > end_date:
+            raise CommandError('--start must be before or equal to --end')
+
+        # One transaction per month keeps locks short on big rebuilds
+        for chunk_start, chunk_end in month_chunks(start_date, end_date):
+            counts = refresh_rollups(chunk_start, chunk_end)
+            summary = ', '.join(f'{name}={count}' for name, count in counts.items())
+            self.stdout.write(self.style.SUCCESS(f'✓ {chunk_start} → {chunk_end}: {summary}'))
+
+        # The filter dropdowns are built from the rollup
+        invalidate_facets(start_date, end_date)
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Rollups refreshed for {start_date} to {end_date}'))
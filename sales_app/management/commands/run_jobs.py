@@ -0,0 +1,26 @@
+# sales_app/management/commands/run_jobs.py
+from django.core.management.base import BaseCommand
+
+from sales_app.jobs import work
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (location Excel exports, stored insights); keep one running next to gunicorn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of polling')
+        parser.add_argument('--poll', type=float, default=2.0,
+                            help='Seconds between queue checks when idle (default 2)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('✓ Job worker started'))
+        try:
+            work(
+                poll_interval=max(0.1, options['poll']),
+                once=options['once'],
+                log=lambda message: self.stdout.write(message),
+            )
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('✓ Job worker stopped'))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales_app', '0003_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('un', models.TextField(blank=True, null=True)),
+                ('prodg', models.TextField(blank=True, null=True)),
+                ('prod', models.TextField(blank=True, null=True)),
+                ('actions', models.TextField(blank=True, null=True)),
+                ('revenue', models.FloatField(default=0)),
+                ('items', models.IntegerField(default=0)),
+                ('discount_total', models.FloatField(default=0)),
+                ('std_price_total', models.FloatField(default=0)),
+                ('tickets', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'sales_daily_rollup',
+                'indexes': [models.Index(fields=['day', 'un'], name='rollup_day_un_idx'), models.Index(fields=['day', 'prodg'], name='rollup_day_prodg_idx'), models.Index(fields=['un', 'day'], name='rollup_un_day_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales_app', '0004_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zedd', models.TextField()),
+                ('day', models.DateField()),
+                ('un', models.TextField(blank=True, null=True)),
+                ('tanam', models.TextField(blank=True, null=True)),
+                ('item_count', models.IntegerField(default=0)),
+                ('selling_item_count', models.IntegerField(default=0)),
+                ('non_pop_count', models.IntegerField(default=0)),
+                ('cross_sell_count', models.IntegerField(default=0)),
+                ('ticket_total', models.FloatField(default=0)),
+                ('selling_total', models.FloatField(default=0)),
+            ],
+            options={
+                'db_table': 'sales_ticket_summary',
+                'indexes': [models.Index(fields=['day', 'un'], name='ticket_day_un_idx'), models.Index(fields=['tanam', 'day'], name='ticket_tanam_day_idx'), models.Index(fields=['zedd'], name='ticket_zedd_idx')],
+            },
+        ),
+    ]
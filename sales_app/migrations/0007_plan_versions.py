@@ -0,0 +1,50 @@
+# Generated by Django 4.2.27 on 2026-10-18 15:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('sales_app', '0006_background_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('sha1', models.CharField(max_length=40)),
+                ('row_count', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=False)),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='plan_versions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'sales_plan_version',
+                'ordering': ['-uploaded_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlanRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=255)),
+                ('geo', models.CharField(max_length=255)),
+                ('year', models.IntegerField()),
+                ('month', models.SmallIntegerField()),
+                ('plan_turnover', models.FloatField()),
+                ('plan_tickets', models.FloatField(blank=True, null=True)),
+                ('plan_basket', models.FloatField(blank=True, null=True)),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='sales_app.planversion')),
+            ],
+            options={
+                'db_table': 'sales_plan_row',
+                'indexes': [models.Index(fields=['version', 'geo', 'year', 'month'], name='plan_row_version_geo_ym_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.27 on 2026-10-18 15:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales_app', '0007_plan_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeDailySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('un', models.TextField(blank=True, null=True)),
+                ('tanam', models.TextField(blank=True, null=True)),
+                ('prodg', models.TextField(blank=True, null=True)),
+                ('revenue', models.FloatField(default=0)),
+                ('items', models.IntegerField(default=0)),
+                ('discount_total', models.FloatField(default=0)),
+                ('std_price_total', models.FloatField(default=0)),
+                ('tickets', models.IntegerField(default=0)),
+                ('cs_tickets', models.IntegerField(default=0)),
+                ('cs_one', models.IntegerField(default=0)),
+                ('cs_two', models.IntegerField(default=0)),
+                ('cs_three_plus', models.IntegerField(default=0)),
+                ('all_tickets', models.IntegerField(default=0)),
+                ('all_cs_tickets', models.IntegerField(default=0)),
+                ('all_cs_one', models.IntegerField(default=0)),
+                ('all_cs_two', models.IntegerField(default=0)),
+                ('all_cs_three_plus', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'sales_employee_snapshot',
+                'indexes': [models.Index(fields=['day', 'un'], name='employee_snap_day_un_idx'), models.Index(fields=['tanam', 'day'], name='employee_snap_tanam_day_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales_app', '0008_employee_daily_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InsightSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filter_key', models.CharField(max_length=32, unique=True)),
+                ('current_year', models.IntegerField()),
+                ('previous_year', models.IntegerField()),
+                ('params', models.JSONField(default=dict)),
+                ('payload', models.JSONField(default=dict)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'sales_insight_snapshot',
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.27 on 2026-10-18 15:53
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def drop_duplicate_tickets(apps, schema_editor):
+    # Earlier range refreshes could leave a second, partial row for tickets
+    # across a range boundary; drop both (refresh_rollups over those days
+    # rebuilds them)
+    TicketSummary = apps.get_model('sales_app', 'TicketSummary')
+    duplicated = (
+        TicketSummary.objects.values('zedd').annotate(rows=Count('id')).filter(rows__gt=1).values('zedd')
+    )
+    TicketSummary.objects.filter(zedd__in=duplicated).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales_app', '0010_background_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_tickets, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='ticketsummary',
+            name='ticket_zedd_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='ticketsummary',
+            constraint=models.UniqueConstraint(fields=('zedd',), name='ticket_zedd_uniq'),
+        ),
+    ]
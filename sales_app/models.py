@@ -66,4 +66,235 @@ class Sales(models.Model):
         ]
 
     def __str__(self):
-        return f"Ticket {self.zedd} - {self.un} - ${self.tanxa}"
\ No newline at end of file
+        return f"Ticket {self.zedd} - {self.un} - ${self.tanxa}"
+
+class DailySalesRollup(models.Model):
+    """
+    Pre-aggregated daily facts built from sales_main_web.
+
+    One row per (day, un, prodg, prod, actions). Kept current by
+    `manage.py refresh_rollups` and by admin_upload; see sales_app/rollups.py.
+    Revenue/items/discount sums are additive across rows. `tickets` is the
+    distinct ticket count inside a single row, so it must NOT be summed to get
+    ticket totals - use the raw table (or a ticket-level table) for those.
+    """
+    day = models.DateField()
+    un = models.TextField(blank=True, null=True)
+    prodg = models.TextField(blank=True, null=True)
+    prod = models.TextField(blank=True, null=True)
+    actions = models.TextField(blank=True, null=True)
+
+    revenue = models.FloatField(default=0)
+    items = models.IntegerField(default=0)
+    discount_total = models.FloatField(default=0)
+    std_price_total = models.FloatField(default=0)
+    tickets = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'sales_daily_rollup'
+        indexes = [
+            models.Index(fields=['day', 'un'], name='rollup_day_un_idx'),
+            models.Index(fields=['day', 'prodg'], name='rollup_day_prodg_idx'),
+            models.Index(fields=['un', 'day'], name='rollup_un_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.un} - {self.prod} - ${self.revenue}"
+
+
+class TicketSummary(models.Model):
+    """
+    One row per ticket (zedd) built from sales_main_web, so cross-sell and
+    basket metrics don't have to group millions of line items on every request.
+
+    Line counts follow the filters the views use:
+      item_count          - every line
+      selling_item_count  - prodt = 'selling item' and tanxa <> 0
+      non_pop_count       - selling lines outside the POP category
+      cross_sell_count    - non-POP selling lines minus bag/service products
+    Only valid for requests without category/product/campaign filters, since
+    those filter individual lines before counting.
+    """
+    zedd = models.TextField()
+    day = models.DateField()
+    un = models.TextField(blank=True, null=True)
+    tanam = models.TextField(blank=True, null=True)
+
+    item_count = models.IntegerField(default=0)
+    selling_item_count = models.IntegerField(default=0)
+    non_pop_count = models.IntegerField(default=0)
+    cross_sell_count = models.IntegerField(default=0)
+    ticket_total = models.FloatField(default=0)
+    selling_total = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'sales_ticket_summary'
+        indexes = [
+            models.Index(fields=['day', 'un'], name='ticket_day_un_idx'),
+            models.Index(fields=['tanam', 'day'], name='ticket_tanam_day_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['zedd'], name='ticket_zedd_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Ticket {self.zedd} - {self.un} - {self.item_count} items"
+
+
+class EmployeeDailySnapshot(models.Model):
+    """
+    Daily employee facts built from sales_main_web for employee_analytics.
+
+    One row per (day, un, tanam, prodg), kept current with the other
+    rollups (see sales_app/rollups.py). Revenue, line and discount sums are
+    additive. Tickets come in two scopes:
+      tickets, cs_*          - tickets with lines in this category; the
+                               cross-sell buckets count only those lines.
+                               Add up within one prodg only.
+      all_tickets, all_cs_*  - every ticket counted once, on the row of its
+                               first category; buckets count all its lines.
+                               Add up across categories.
+    Cross-sell lines are non-POP selling lines with a non-zero price. The
+    buckets split tickets with 1 / 2 / 3+ of them.
+    """
+    day = models.DateField()
+    un = models.TextField(blank=True, null=True)
+    tanam = models.TextField(blank=True, null=True)
+    prodg = models.TextField(blank=True, null=True)
+
+    revenue = models.FloatField(default=0)
+    items = models.IntegerField(default=0)
+    discount_total = models.FloatField(default=0)
+    std_price_total = models.FloatField(default=0)
+
+    tickets = models.IntegerField(default=0)
+    cs_tickets = models.IntegerField(default=0)
+    cs_one = models.IntegerField(default=0)
+    cs_two = models.IntegerField(default=0)
+    cs_three_plus = models.IntegerField(default=0)
+
+    all_tickets = models.IntegerField(default=0)
+    all_cs_tickets = models.IntegerField(default=0)
+    all_cs_one = models.IntegerField(default=0)
+    all_cs_two = models.IntegerField(default=0)
+    all_cs_three_plus = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'sales_employee_snapshot'
+        indexes = [
+            models.Index(fields=['day', 'un'], name='employee_snap_day_un_idx'),
+            models.Index(fields=['tanam', 'day'], name='employee_snap_tanam_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.un} - {self.tanam} - {self.prodg} - ${self.revenue}"
+
+
+class BackgroundJob(models.Model):
+    """
+    Database-backed work queue for slow reports (no broker needed).
+
+    Requests enqueue a row, `manage.py run_jobs` claims queued rows one at
+    a time, runs the handler registered for `kind` in sales_app/jobs.py
+    and stores the finished file in `result`. While a job runs its worker
+    bumps `heartbeat_at`, so a job is only taken back from dead workers.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='background_jobs')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    result_name = models.CharField(max_length=255, blank=True)
+    result_content_type = models.CharField(max_length=100, blank=True)
+    result = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'sales_background_job'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} - {self.kind} - {self.status}"
+
+
+class PlanVersion(models.Model):
+    """
+    One uploaded plan workbook. plan_workflow reads the rows of the active
+    version; older versions are kept so a plan can be rolled back from the
+    Django admin.
+    """
+    file_name = models.CharField(max_length=255)
+    sha1 = models.CharField(max_length=40)
+    row_count = models.IntegerField(default=0)
+    is_active = models.BooleanField(default=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='plan_versions')
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'sales_plan_version'
+        ordering = ['-uploaded_at']
+
+    def __str__(self):
+        return f"Plan v{self.id} - {self.file_name}{' (active)' if self.is_active else ''}"
+
+
+class PlanRow(models.Model):
+    """Monthly plan of one location, a row of the 'Main' sheet"""
+    version = models.ForeignKey(PlanVersion, on_delete=models.CASCADE, related_name='rows')
+    location = models.CharField(max_length=255)
+    geo = models.CharField(max_length=255)
+    year = models.IntegerField()
+    month = models.SmallIntegerField()
+    plan_turnover = models.FloatField()
+    plan_tickets = models.FloatField(null=True, blank=True)
+    plan_basket = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'sales_plan_row'
+        indexes = [
+            models.Index(fields=['version', 'geo', 'year', 'month'], name='plan_row_version_geo_ym_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.geo} {self.year}-{self.month:02d}: {self.plan_turnover}"
+
+
+class InsightSnapshot(models.Model):
+    """
+    Precomputed insights page (narrative, recommendations and summary) of
+    one common filter: a comparison over full years for all locations, one
+    location or a user's allowed locations. Built by
+    `manage.py precompute_insights` and the job admin_upload queues; the
+    rows of re-uploaded years are dropped with the upload.
+    """
+    filter_key = models.CharField(max_length=32, unique=True)  # SalesFilter.key
+    current_year = models.IntegerField()
+    previous_year = models.IntegerField()
+    params = models.JSONField(default=dict)
+    payload = models.JSONField(default=dict)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'sales_insight_snapshot'
+
+    def __str__(self):
+        return f"Insights {self.current_year}-{self.previous_year} {self.params.get('locations') or 'all'}"
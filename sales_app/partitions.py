@@ -0,0 +1,176 @@
+# sales_app/partitions.py
+# Monthly range partitioning of sales_main_web on "CD" (Postgres only)
+
+import re
+from datetime import timedelta
+
+from django.db import connection, transaction
+
+from sales_app.dates import day_start, iter_months, next_month
+from sales_app.models import Sales
+
+
+TABLE = Sales._meta.db_table
+BUILD_TABLE = f'{TABLE}_partitioned'
+LEGACY_TABLE = f'{TABLE}_legacy'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def partition_name(month):
+    """sales_main_web_y2025m03 for any day in March 2025"""
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def is_partitioned():
+    """True when sales_main_web is a partitioned (parent) table"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def ensure_partitions(start_date, end_date, parent=TABLE):
+    """Create any missing monthly partitions of ``parent`` covering [start_date, end_date]"""
+    created = []
+    with connection.cursor() as cursor:
+        for month in iter_months(start_date, end_date):
+            name = partition_name(month)
+            cursor.execute("SELECT to_regclass(%s)", [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+            cursor.execute(
+                f'CREATE TABLE {_q(name)} PARTITION OF {_q(parent)} FOR VALUES FROM (%s) TO (%s)',
+                [day_start(month), day_start(next_month(month))]
+            )
+            created.append(name)
+    return created
+
+
+def split_by_month(start_date, end_date):
+    """
+    Split [start_date, end_date] into months it covers completely and the
+    (first, last) day ranges of the months it only partly covers.
+    """
+    whole, partial = [], []
+    for month in iter_months(start_date, end_date):
+        month_end = next_month(month) - timedelta(days=1)
+        if month >= start_date and month_end <= end_date:
+            whole.append(month)
+        else:
+            partial.append((max(month, start_date), min(month_end, end_date)))
+    return whole, partial
+
+
+def truncate_months(months):
+    """
+    Empty the partitions of whole months; much cheaper than DELETE (no dead
+    tuples, no per-row index maintenance). Returns the number of rows removed.
+    Call inside the caller's transaction.
+    """
+    names = [partition_name(month) for month in months]
+    if not names:
+        return 0
+
+    removed = 0
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f'SELECT COUNT(*) FROM {_q(name)}')
+            removed += cursor.fetchone()[0]
+        cursor.execute(f'TRUNCATE {", ".join(_q(name) for name in names)}')
+    return removed
+
+
+def _index_definitions(table):
+    """(name, definition) of the non-unique indexes on ``table``"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexdef NOT LIKE 'CREATE UNIQUE%%'",
+            [table]
+        )
+        return cursor.fetchall()
+
+
+def convert_to_partitioned(log=print, batch_months=1):
+    """
+    Rebuild sales_main_web as a table partitioned by month on "CD".
+
+    1. Build sales_main_web_partitioned with one partition per month between
+       the first and last sale (plus a DEFAULT partition for NULL CD).
+    2. Copy the rows month by month, each batch in its own transaction.
+    3. Recreate the existing secondary indexes on the new parent.
+    4. Swap the names in one short transaction; the old heap is kept as
+       sales_main_web_legacy for rollback.
+
+    IdReal1 can no longer be a primary key (a unique constraint on a
+    partitioned table must include "CD"), so it gets a plain index.
+    Uploads must not run while this is in progress.
+    """
+    if connection.vendor != 'postgresql':
+        raise RuntimeError('Partitioning is only supported on PostgreSQL')
+    if is_partitioned():
+        log(f'- {TABLE} is already partitioned')
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN("CD"), MAX("CD") FROM {_q(TABLE)}')
+        min_cd, max_cd = cursor.fetchone()
+    if min_cd is None:
+        raise RuntimeError(f'{TABLE} is empty, nothing to partition')
+
+    first_day = min_cd.date()
+    last_day = max_cd.date()
+    indexes = _index_definitions(TABLE)
+
+    # 1. Partitioned parent + monthly partitions
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {_q(BUILD_TABLE)} (LIKE {_q(TABLE)} INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE ("CD")'
+        )
+        cursor.execute(f'CREATE TABLE {_q(DEFAULT_PARTITION)} PARTITION OF {_q(BUILD_TABLE)} DEFAULT')
+    created = ensure_partitions(first_day, last_day, parent=BUILD_TABLE)
+    log(f'✓ Created {len(created)} monthly partitions ({first_day:%Y-%m} → {last_day:%Y-%m})')
+
+    # 2. Copy month by month
+    months = list(iter_months(first_day, last_day))
+    for i in range(0, len(months), batch_months):
+        batch = months[i:i + batch_months]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {_q(BUILD_TABLE)} SELECT * FROM {_q(TABLE)} WHERE "CD" >= %s AND "CD" < %s',
+                [day_start(batch[0]), day_start(next_month(batch[-1]))]
+            )
+            log(f'✓ Copied {cursor.rowcount} rows for {batch[0]:%Y-%m}' + (f' → {batch[-1]:%Y-%m}' if len(batch) > 1 else ''))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {_q(BUILD_TABLE)} SELECT * FROM {_q(TABLE)} WHERE "CD" IS NULL')
+        if cursor.rowcount:
+            log(f'✓ Copied {cursor.rowcount} rows without CD into the default partition')
+
+    # 3. Secondary indexes (cascade to every partition)
+    with connection.cursor() as cursor:
+        for name, definition in indexes:
+            definition = re.sub(r'^CREATE INDEX \S+ ON (\S+\.)?\S+', f'CREATE INDEX {_q(name + "_part")} ON {_q(BUILD_TABLE)}', definition)
+            cursor.execute(definition)
+        cursor.execute(f'CREATE INDEX {_q("sales_idreal1_part")} ON {_q(BUILD_TABLE)} ("IdReal1")')
+        cursor.execute(f'ANALYZE {_q(BUILD_TABLE)}')
+    log(f'✓ Rebuilt {len(indexes) + 1} indexes on the partitioned table')
+
+    # 4. Swap names
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {_q(TABLE)} RENAME TO {_q(LEGACY_TABLE)}')
+        cursor.execute(f'ALTER TABLE {_q(BUILD_TABLE)} RENAME TO {_q(TABLE)}')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {_q(name)} RENAME TO {_q(name + "_legacy")}')
+            cursor.execute(f'ALTER INDEX {_q(name + "_part")} RENAME TO {_q(name)}')
+        cursor.execute(f'ALTER INDEX {_q("sales_idreal1_part")} RENAME TO {_q("sales_idreal1_idx")}')
+    log(f'✓ {TABLE} is now partitioned by month; previous table kept as {LEGACY_TABLE}')
@@ -0,0 +1,391 @@
+# sales_app/plans.py
+# Monthly plan targets: uploaded plan versions stored in the database, or
+# "Full Plan workflow.xlsx" (parsed once per file version) until the first
+# upload
+
+import hashlib
+import io
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from sales_app.models import PlanVersion, PlanRow
+
+logger = logging.getLogger(__name__)
+
+
+PLAN_SHEET = 'Main'
+PLAN_COLUMNS = ['Year', 'Month', 'location', 'geo', 'Plan_turnover', 'Plan_tickets', 'Plan_basket']
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+ACTIVE_VERSION_KEY = 'plan_active_version'
+
+# (mtime_ns, size) of the file -> PlanStore, per process
+_memo = {}
+
+
+def plan_workbook_path():
+    return os.path.join(settings.BASE_DIR, 'sales_app', 'data', 'Full Plan workflow.xlsx')
+
+
+class PlanStore:
+    """
+    The plan sheet as one compact frame: only PLAN_COLUMNS, Year/Month as
+    integers and the first day of each month precomputed in ``plan_date``.
+
+    Requests only take slices of it (boolean masks, no copies of the whole
+    sheet); the frame itself is never modified after parsing.
+    """
+
+    def __init__(self, frame, digest):
+        self.frame = frame
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.frame)
+
+    def slice(self, start_date, end_date, geo='all'):
+        """Plan rows of the months from start_date to end_date, of one geo or all"""
+        plan_date = self.frame['plan_date']
+        mask = (plan_date >= pd.Timestamp(start_date.replace(day=1))) & (plan_date <= pd.Timestamp(end_date.replace(day=1)))
+        if geo != 'all':
+            mask &= self.frame['geo'] == geo
+        return self.frame[mask]
+
+
+def parse_plan_workbook(path, digest):
+    """PlanStore from the 'Main' sheet of the workbook at ``path``"""
+    start = time.time()
+    frame = pd.read_excel(path, engine='openpyxl', sheet_name=PLAN_SHEET, usecols=PLAN_COLUMNS)
+    frame['Year'] = frame['Year'].astype(int)
+    frame['Month'] = frame['Month'].astype(int)
+    frame['plan_date'] = pd.to_datetime(frame[['Year', 'Month']].assign(day=1))
+    frame = frame.reset_index(drop=True)
+
+    logger.debug("Parsed plan workbook: %d rows, %s-%s in %.2fs",
+                 len(frame), frame['Year'].min(), frame['Year'].max(), time.time() - start)
+    return PlanStore(frame, digest)
+
+
+def get_plan_store(path=None):
+    """
+    PlanStore of the current plan workbook.
+
+    A stat() per call: while mtime and size are unchanged the parsed store
+    of this process is reused. Otherwise the file is hashed and the store
+    is read from the shared cache under that hash (so gunicorn workers
+    parse each version once between them), or parsed and cached.
+    Raises FileNotFoundError when the workbook is missing.
+    """
+    path = path or plan_workbook_path()
+    stat = os.stat(path)
+    signature = (path, stat.st_mtime_ns, stat.st_size)
+
+    store = _memo.get(signature)
+    if store is not None:
+        return store
+
+    with open(path, 'rb') as workbook:
+        digest = hashlib.sha1(workbook.read()).hexdigest()
+
+    cache_key = f'plan_store_{digest}'
+    store = cache.get(cache_key)
+    if store is None:
+        store = parse_plan_workbook(path, digest)
+        cache.set(cache_key, store, getattr(settings, 'CACHE_TIMEOUT_LONG', 3600))
+
+    _memo.clear()
+    _memo[signature] = store
+    return store
+
+
+def warm_plan_store():
+    """
+    Parse the workbook in a starting worker (gunicorn's post_worker_init) so
+    the first plan request doesn't pay for it. A failure is logged and left
+    to that first request.
+    """
+    try:
+        if active_plan_version_id():
+            return
+        get_plan_store()
+    except Exception:
+        logger.warning("Plan workbook not loaded at startup", exc_info=True)
+
+
+# ===== UPLOADED PLAN VERSIONS =====
+
+def read_plan_upload(content):
+    """
+    Validated 'Main' sheet of an uploaded workbook (bytes) as a frame of
+    PLAN_COLUMNS. Raises ValueError with every problem found.
+    """
+    try:
+        frame = pd.read_excel(io.BytesIO(content), engine='openpyxl', sheet_name=PLAN_SHEET)
+    except Exception as e:
+        raise ValueError(f"Could not read the '{PLAN_SHEET}' sheet: {e}")
+
+    missing = [column for column in PLAN_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"The '{PLAN_SHEET}' sheet is missing columns: {', '.join(missing)}")
+
+    frame = frame[PLAN_COLUMNS].dropna(how='all').reset_index(drop=True)
+    if frame.empty:
+        raise ValueError(f"The '{PLAN_SHEET}' sheet has no plan rows")
+
+    errors = []
+    for column in ['Year', 'Month', 'Plan_turnover', 'Plan_tickets', 'Plan_basket']:
+        numeric = pd.to_numeric(frame[column], errors='coerce')
+        bad = numeric.isna() & frame[column].notna()
+        if column in ('Year', 'Month', 'Plan_turnover'):
+            bad |= frame[column].isna()
+        if bad.any():
+            errors.append(f"{column} is missing or not a number in rows {_sheet_rows(bad)}")
+        frame[column] = numeric
+
+    # NaN compares False, so rows already reported above are skipped here
+    bad = (frame['Month'] < 1) | (frame['Month'] > 12) | (frame['Month'] % 1 > 0)
+    if bad.any():
+        errors.append(f"Month must be 1-12 in rows {_sheet_rows(bad)}")
+    bad = (frame['Year'] < 2000) | (frame['Year'] > 2100) | (frame['Year'] % 1 > 0)
+    if bad.any():
+        errors.append(f"Year is out of range in rows {_sheet_rows(bad)}")
+
+    # Kept as typed: geo has to match Sales.un exactly, trailing spaces included
+    for column in ['location', 'geo']:
+        bad = frame[column].isna() | (frame[column].astype(str).str.strip() == '')
+        if bad.any():
+            errors.append(f"{column} is empty in rows {_sheet_rows(bad)}")
+
+    if not errors:
+        duplicated = frame.duplicated(['geo', 'Year', 'Month'], keep=False)
+        if duplicated.any():
+            errors.append(f"More than one plan for the same geo and month in rows {_sheet_rows(duplicated)}")
+
+    if errors:
+        raise ValueError('; '.join(errors))
+
+    frame['Year'] = frame['Year'].astype(int)
+    frame['Month'] = frame['Month'].astype(int)
+    return frame
+
+
+def _sheet_rows(mask, limit=10):
+    """Excel row numbers (header is row 1) of the rows in ``mask``"""
+    rows = [str(index + 2) for index in mask[mask].index[:limit]]
+    more = int(mask.sum()) - len(rows)
+    return ', '.join(rows) + (f' (+{more} more)' if more > 0 else '')
+
+
+def create_plan_version(content, file_name, user=None):
+    """
+    Store an uploaded workbook as a new PlanVersion and make it the active
+    plan. Raises ValueError (nothing is stored) when the sheet is invalid.
+    """
+    start = time.time()
+    frame = read_plan_upload(content)
+
+    with transaction.atomic():
+        version = PlanVersion.objects.create(
+            file_name=file_name,
+            sha1=hashlib.sha1(content).hexdigest(),
+            row_count=len(frame),
+            uploaded_by=user,
+        )
+        PlanRow.objects.bulk_create([
+            PlanRow(
+                version=version,
+                location=str(row.location),
+                geo=str(row.geo),
+                year=row.Year,
+                month=row.Month,
+                plan_turnover=row.Plan_turnover,
+                plan_tickets=None if pd.isna(row.Plan_tickets) else row.Plan_tickets,
+                plan_basket=None if pd.isna(row.Plan_basket) else row.Plan_basket,
+            )
+            for row in frame.itertuples(index=False)
+        ], batch_size=2000)
+        activate_plan_version(version)
+
+    logger.debug("Plan version %s stored: %d rows from %s in %.2fs", version.id, len(frame), file_name, time.time() - start)
+    return version
+
+
+def activate_plan_version(version):
+    """Make ``version`` the plan plan_workflow reads"""
+    with transaction.atomic():
+        PlanVersion.objects.filter(is_active=True).exclude(id=version.id).update(is_active=False)
+        PlanVersion.objects.filter(id=version.id).update(is_active=True)
+        transaction.on_commit(lambda: cache.delete(ACTIVE_VERSION_KEY))
+    version.is_active = True
+
+
+def active_plan_version_id():
+    """Id of the active PlanVersion, or None while no plan was uploaded"""
+    version_id = cache.get(ACTIVE_VERSION_KEY)
+    if version_id is None:
+        version_id = PlanVersion.objects.filter(is_active=True).values_list('id', flat=True).first() or 0
+        cache.set(ACTIVE_VERSION_KEY, version_id, getattr(settings, 'CACHE_TIMEOUT_LONG', 3600))
+    return version_id or None
+
+
+def load_plan_rows(version_id, start_date, end_date, geo='all'):
+    """Plan rows of one version for the months from start_date to end_date, shaped like PlanStore.frame"""
+    rows = PlanRow.objects.filter(version_id=version_id).filter(
+        Q(year__gt=start_date.year) | Q(year=start_date.year, month__gte=start_date.month),
+        Q(year__lt=end_date.year) | Q(year=end_date.year, month__lte=end_date.month),
+    )
+    if geo != 'all':
+        rows = rows.filter(geo=geo)
+
+    frame = pd.DataFrame.from_records(
+        rows.order_by('id').values_list(
+            'year', 'month', 'location', 'geo', 'plan_turnover', 'plan_tickets', 'plan_basket'
+        ),
+        columns=PLAN_COLUMNS,
+    )
+    frame['Year'] = frame['Year'].astype(int)
+    frame['Month'] = frame['Month'].astype(int)
+    for column in ['Plan_turnover', 'Plan_tickets', 'Plan_basket']:
+        frame[column] = frame[column].astype(float)
+    frame['plan_date'] = pd.to_datetime(frame[['Year', 'Month']].assign(day=1))
+    return frame
+
+
+def plan_slice(start_date, end_date, geo='all', path=None):
+    """
+    Plan rows of the months from start_date to end_date, of one geo or all.
+
+    From the active uploaded version when there is one (one indexed query,
+    cached per version and slice), else from the plan workbook. Raises
+    FileNotFoundError when there is neither.
+    """
+    version_id = active_plan_version_id()
+    if not version_id:
+        return get_plan_store(path).slice(start_date, end_date, geo)
+
+    geo_key = hashlib.md5(geo.encode('utf-8')).hexdigest()[:12]
+    cache_key = f'plan_slice_{version_id}_{start_date:%Y%m}_{end_date:%Y%m}_{geo_key}'
+    frame = cache.get(cache_key)
+    if frame is None:
+        frame = load_plan_rows(version_id, start_date, end_date, geo)
+        cache.set(cache_key, frame, getattr(settings, 'CACHE_TIMEOUT_LONG', 3600))
+    return frame
+
+
+# ===== PLAN VS ACTUAL =====
+# Sums use np.bincount, which adds in input order like the old per-record
+# loops did (pandas groupby sums are compensated and drift in the last digits)
+
+def expand_plan_daily(plan_rows, start_date, end_date):
+    """
+    Monthly plan rows spread evenly over the days of their month, one row per
+    location and day between start_date and end_date: geo, date, day (offset
+    from start_date), daily_plan, daily_tickets, avg_basket.
+    """
+    days_in_month = plan_rows['plan_date'].dt.days_in_month.to_numpy()
+    repeat = np.repeat(np.arange(len(plan_rows)), days_in_month)
+    # 0, 1, .. days_in_month - 1 within each month
+    day_of_month = np.arange(len(repeat)) - np.repeat(np.cumsum(days_in_month) - days_in_month, days_in_month)
+
+    dates = plan_rows['plan_date'].to_numpy()[repeat] + day_of_month.astype('timedelta64[D]')
+    daily = pd.DataFrame({
+        'geo': plan_rows['geo'].to_numpy()[repeat],
+        'date': dates,
+        'day': (dates - np.datetime64(start_date, 'D')).astype('timedelta64[D]').astype(int),
+        'daily_plan': (plan_rows['Plan_turnover'].to_numpy(dtype=float) / days_in_month)[repeat],
+        'daily_tickets': (plan_rows['Plan_tickets'].to_numpy(dtype=float) / days_in_month)[repeat],
+        'avg_basket': plan_rows['Plan_basket'].to_numpy(dtype=float)[repeat],
+    })
+    in_range = (daily['date'] >= pd.Timestamp(start_date)) & (daily['date'] <= pd.Timestamp(end_date))
+    return daily[in_range].reset_index(drop=True)
+
+
+def period_calendar(start_date, end_date, aggregation):
+    """
+    (labels, period) for a chart from start_date to end_date: one label per
+    month, ISO week or day, and the label index of every day of the range.
+    """
+    dates = pd.date_range(start_date, end_date, freq='D')
+
+    if aggregation == 'monthly':
+        period = (dates.year - start_date.year) * 12 + dates.month - start_date.month
+        months = dates[np.r_[True, np.diff(period) > 0]]
+        labels = [f"{MONTH_NAMES[d.month - 1]} '{str(d.year)[-2:]}" for d in months]
+    elif aggregation == 'weekly':
+        iso = dates.isocalendar()
+        week_key = (iso['year'] * 100 + iso['week']).to_numpy()
+        first = np.r_[True, week_key[1:] != week_key[:-1]]
+        period = np.cumsum(first) - 1
+        labels = [f"W{week} '{str(year)[-2:]}" for year, week in zip(iso['year'][first], iso['week'][first])]
+    else:
+        period = np.arange(len(dates))
+        labels = list(dates.strftime('%b %d'))
+
+    return labels, np.asarray(period)
+
+
+def _bucket_sums(period, days, weights, n_labels):
+    """Per-label sums of ``weights``, rows given by their day offset in the range"""
+    in_range = (days >= 0) & (days < len(period))
+    return np.bincount(period[days[in_range]], weights=weights[in_range], minlength=n_labels)
+
+
+def aggregate_plan_actual(plan_daily, actual_records, start_date, end_date, aggregation):
+    """
+    Chart series of plan vs actual turnover, tickets and basket per month,
+    ISO week or day. ``actual_records`` are the per location and day rows
+    (cd, actual_turnover, tickets) from the database.
+    """
+    labels, period = period_calendar(start_date, end_date, aggregation)
+    n_labels = len(labels)
+
+    plan_days = plan_daily['day'].to_numpy()
+    plan = _bucket_sums(period, plan_days, plan_daily['daily_plan'].to_numpy(), n_labels)
+    tickets_plan = _bucket_sums(period, plan_days, plan_daily['daily_tickets'].to_numpy(), n_labels)
+    basket_sum = _bucket_sums(period, plan_days, plan_daily['avg_basket'].to_numpy(), n_labels)
+    basket_count = _bucket_sums(period, plan_days, np.ones(len(plan_daily)), n_labels)
+
+    actual = np.zeros(n_labels)
+    tickets_actual = np.zeros(n_labels, dtype=int)
+    if actual_records:
+        frame = pd.DataFrame.from_records(actual_records, columns=['cd', 'actual_turnover', 'tickets'])
+        cd = pd.to_datetime(frame['cd'], utc=True).dt.tz_localize(None).dt.normalize()
+        actual_days = (cd - pd.Timestamp(start_date)).dt.days.to_numpy()
+        actual = _bucket_sums(period, actual_days, frame['actual_turnover'].fillna(0).to_numpy(dtype=float), n_labels)
+        tickets_actual = _bucket_sums(period, actual_days, frame['tickets'].fillna(0).to_numpy(dtype=float), n_labels).astype(int)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        basket_plan = np.where(basket_count > 0, basket_sum / basket_count, 0)
+        basket_actual = np.where(tickets_actual > 0, actual / tickets_actual, 0)
+
+    return {
+        'labels': labels,
+        'plan_values': plan.tolist(),
+        'plan_85_values': (plan * 0.85).tolist(),
+        'actual_values': actual.tolist(),
+        'tickets_plan_values': tickets_plan.tolist(),
+        'tickets_actual_values': tickets_actual.tolist(),
+        'basket_plan_values': basket_plan.tolist(),
+        'basket_actual_values': basket_actual.tolist(),
+    }
+
+
+def plan_totals_by_geo(plan_daily):
+    """Plan turnover, tickets and average basket per location, one pass over the daily rows"""
+    codes, geos = pd.factorize(plan_daily['geo'])
+    count = np.bincount(codes, minlength=len(geos))
+    basket_sum = np.bincount(codes, weights=plan_daily['avg_basket'].to_numpy(), minlength=len(geos))
+    return pd.DataFrame({
+        'plan': np.bincount(codes, weights=plan_daily['daily_plan'].to_numpy(), minlength=len(geos)),
+        'tickets': np.bincount(codes, weights=plan_daily['daily_tickets'].to_numpy(), minlength=len(geos)),
+        'basket': np.where(count > 0, basket_sum / np.maximum(count, 1), 0),
+    }, index=geos)
@@ -0,0 +1,130 @@
+# sales_app/query_console.py
+# Guard rails for the admin SQL console: validation, paged previews,
+# per-query statement timeouts and cancelling a running query
+
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+
+PROHIBITED_KEYWORDS = ['DROP', 'DELETE', 'INSERT', 'UPDATE', 'ALTER', 'CREATE', 'TRUNCATE', 'EXEC', 'EXECUTE']
+
+# Preview sizes offered in the console (rows per page)
+PAGE_SIZES = (100, 500, 1000, 5000)
+
+# Client-generated id of one console run, used to find its backend PID
+QUERY_TOKEN_RE = re.compile(r'^[A-Za-z0-9-]{8,64}$')
+
+
+def preview_timeout_ms():
+    return getattr(settings, 'QUERY_CONSOLE_TIMEOUT_MS', 60000)
+
+
+def export_timeout_ms():
+    return getattr(settings, 'QUERY_CONSOLE_EXPORT_TIMEOUT_MS', 300000)
+
+
+def default_page_size():
+    return getattr(settings, 'QUERY_CONSOLE_PAGE_SIZE', 500)
+
+
+def validate_query(query_text):
+    """Error message for anything but a single read-only SELECT / WITH, else None"""
+    query_upper = query_text.upper().strip()
+    if not (query_upper.startswith('SELECT') or query_upper.startswith('WITH')):
+        return "Only SELECT queries (including CTEs with WITH) are allowed for security reasons."
+    if any(keyword in query_upper for keyword in PROHIBITED_KEYWORDS):
+        return "Detected prohibited SQL keywords. Only SELECT queries are allowed."
+    return None
+
+
+def strip_query(query_text):
+    """Query text without trailing semicolons / comment lines, ready to be used as a subquery"""
+    query_text = query_text.strip()
+    while True:
+        lines = query_text.rsplit('\n', 1)
+        if query_text.endswith(';'):
+            query_text = query_text[:-1].rstrip()
+        elif len(lines) == 2 and lines[1].lstrip().startswith('--'):
+            query_text = lines[0].rstrip()
+        else:
+            return query_text
+
+
+def set_statement_timeout(cursor, milliseconds):
+    """
+    SET LOCAL statement_timeout for the rest of the current transaction
+    (PostgreSQL only - must run inside transaction.atomic()).
+    """
+    if milliseconds and connection.vendor == 'postgresql':
+        cursor.execute('SET LOCAL statement_timeout = %s', [int(milliseconds)])
+
+
+def describe_error(error, timeout_ms):
+    """Console message for a failed query, spelling out timeouts and cancels"""
+    text = str(error).strip()
+    if 'statement timeout' in text:
+        return (f"Query stopped after {timeout_ms / 1000:.0f}s (statement timeout). "
+                "Narrow it down with a WHERE on \"CD\" or export the results instead.")
+    if 'canceling statement due to user request' in text:
+        return "Query cancelled."
+    return f"Query Error: {text}"
+
+
+def _pid_key(token):
+    return f'query_console_pid_{token}'
+
+
+def fetch_page(query_text, page=1, page_size=None, timeout_ms=None, token=None, user_id=None):
+    """
+    One page of the rows of ``query_text``: (columns, rows, has_more).
+
+    The query is wrapped in LIMIT/OFFSET so the database never sends more
+    than page_size + 1 rows (the extra row only tells whether more follow),
+    and runs under its own statement timeout. With a ``token`` the backend
+    PID is kept in the cache while the query runs so cancel_query() can
+    stop it from another request.
+    """
+    page_size = page_size or default_page_size()
+    timeout_ms = preview_timeout_ms() if timeout_ms is None else timeout_ms
+    offset = (max(page, 1) - 1) * page_size
+    # Newlines so a trailing -- comment cannot swallow the wrapper
+    paged_sql = f'SELECT * FROM (\n{strip_query(query_text)}\n) console_query LIMIT {page_size + 1} OFFSET {offset}'
+
+    register = bool(token and QUERY_TOKEN_RE.match(token)) and connection.vendor == 'postgresql'
+    with transaction.atomic(), connection.cursor() as cursor:
+        set_statement_timeout(cursor, timeout_ms)
+        if register:
+            cursor.execute('SELECT pg_backend_pid()')
+            cache.set(_pid_key(token), (user_id, cursor.fetchone()[0]), timeout_ms // 1000 + 60)
+        try:
+            cursor.execute(paged_sql)
+            rows = cursor.fetchall()
+            columns = [col[0] for col in cursor.description]
+        finally:
+            if register:
+                cache.delete(_pid_key(token))
+
+    return columns, rows[:page_size], len(rows) > page_size
+
+
+def cancel_query(token, user_id):
+    """
+    pg_cancel_backend() on the query started with ``token`` by ``user_id``.
+    Cancels the statement only - the worker's connection stays usable.
+    True when a running query was signalled.
+    """
+    if connection.vendor != 'postgresql' or not QUERY_TOKEN_RE.match(token or ''):
+        return False
+
+    entry = cache.get(_pid_key(token))
+    if not entry or entry[0] != user_id:
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_cancel_backend(%s)', [entry[1]])
+        cancelled = bool(cursor.fetchone()[0])
+    print(f"⚠️ Query console cancel for PID {entry[1]}: {'sent' if cancelled else 'not running'}")
+    return cancelled
@@ -0,0 +1,265 @@
+# sales_app/rollups.py
+# Pre-aggregated tables derived from sales_main_web
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum, Count, Max, Min, FloatField, IntegerField, Value, Q, Case, When
+from django.db.models.functions import TruncDate, Coalesce
+from django.utils import timezone
+
+from sales_app.dates import DateWindow
+from sales_app.models import Sales, DailySalesRollup, TicketSummary, EmployeeDailySnapshot
+
+
+def _day_bounds(start_date, end_date):
+    """Aware [start, end) datetimes covering whole days start_date..end_date"""
+    start_dt = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+    end_dt = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return start_dt, end_dt
+
+
+def _insert_from_queryset(table, queryset):
+    """
+    Run INSERT INTO <table> (...) SELECT ... using the SQL Django compiles for
+    a values().annotate() queryset, so the aggregation never leaves the database.
+    Target column names must match the queryset's field/annotation names.
+    """
+    query = queryset.query
+    columns = list(query.values_select) + list(query.annotation_select)
+    sql, params = query.sql_with_params()
+    column_sql = ', '.join(connection.ops.quote_name(col) for col in columns)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {connection.ops.quote_name(table)} ({column_sql}) {sql}', params)
+        return cursor.rowcount
+
+
+def refresh_daily_rollup(start_date, end_date):
+    """
+    Rebuild sales_daily_rollup for every day in [start_date, end_date].
+
+    Existing rows for the range are replaced inside one transaction, so the
+    dashboard never sees a half-written day.
+    """
+    start_dt, end_dt = _day_bounds(start_date, end_date)
+
+    source = (
+        Sales.objects
+        .filter(cd__gte=start_dt, cd__lt=end_dt)
+        .annotate(day=TruncDate('cd'))
+        .values('un', 'prodg', 'prod', 'actions', 'day')
+        .annotate(
+            revenue=Coalesce(Sum('tanxa'), Value(0.0), output_field=FloatField()),
+            items=Count('idreal1'),
+            discount_total=Coalesce(Sum('discount_price'), Value(0.0), output_field=FloatField()),
+            std_price_total=Coalesce(Sum('std_price'), Value(0.0), output_field=FloatField()),
+            tickets=Count('zedd', distinct=True),
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        DailySalesRollup.objects.filter(day__gte=start_date, day__lte=end_date).delete()
+        inserted = _insert_from_queryset(DailySalesRollup._meta.db_table, source)
+
+    return inserted
+
+
+# Line filters shared by every cross-sell / basket metric in the views
+SELLING_LINE = Q(prodt='selling item') & ~Q(tanxa=0)
+NON_POP_LINE = SELLING_LINE & ~Q(prodg='POP')
+CROSS_SELL_LINE = NON_POP_LINE & ~Q(idprod__in=['M9157', 'M9121', 'M9850'])
+
+
+def refresh_ticket_summary(start_date, end_date):
+    """
+    Rebuild sales_ticket_summary for tickets with a line in [start_date,
+    end_date] and drop the rows of days in the range that lost their lines.
+    A ticket is aggregated over all of its lines, also those outside the
+    range (e.g. across midnight at a range or month-chunk boundary). Its
+    day/location/employee are taken from its lines (first timestamp, and
+    the MAX of un/tanam).
+    """
+    start_dt, end_dt = _day_bounds(start_date, end_date)
+    touched = Sales.objects.filter(cd__gte=start_dt, cd__lt=end_dt, zedd__isnull=False).values('zedd')
+
+    source = (
+        Sales.objects
+        .filter(zedd__in=touched)
+        .values('zedd')
+        .annotate(
+            day=Min(TruncDate('cd')),
+            un=Max('un'),
+            tanam=Max('tanam'),
+            item_count=Count('idreal1'),
+            selling_item_count=Count('idreal1', filter=SELLING_LINE),
+            non_pop_count=Count('idreal1', filter=NON_POP_LINE),
+            cross_sell_count=Count('idreal1', filter=CROSS_SELL_LINE),
+            ticket_total=Coalesce(Sum('tanxa'), Value(0.0), output_field=FloatField()),
+            selling_total=Coalesce(Sum('tanxa', filter=SELLING_LINE), Value(0.0), output_field=FloatField()),
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        TicketSummary.objects.filter(Q(day__gte=start_date, day__lte=end_date) | Q(zedd__in=touched)).delete()
+        inserted = _insert_from_queryset(TicketSummary._meta.db_table, source)
+
+    return inserted
+
+
+# Lines grouped per ticket and category first; window functions over the
+# ticket then give its cross-sell lines across categories and the one row
+# (its first category) that counts it in the all_* columns
+EMPLOYEE_SNAPSHOT_SQL = """
+    WITH lines ({line_columns}) AS (
+        {lines_sql}
+    ),
+    ticket_categories AS (
+        SELECT day, un, tanam, prodg, zedd,
+               SUM(tanxa) AS revenue,
+               COUNT(zedd) AS items,
+               SUM(discount_price) AS discount_total,
+               SUM(std_price) AS std_price_total,
+               SUM(cross_sell) AS cs_items
+        FROM lines
+        GROUP BY day, un, tanam, prodg, zedd
+    ),
+    ranked AS (
+        SELECT ticket_categories.*,
+               SUM(cs_items) OVER ticket AS ticket_cs_items,
+               ROW_NUMBER() OVER (ticket ORDER BY prodg) AS category_rank
+        FROM ticket_categories
+        WINDOW ticket AS (PARTITION BY day, un, tanam, zedd)
+    )
+    INSERT INTO {table} ({columns})
+    SELECT
+        day, un, tanam, prodg,
+        COALESCE(SUM(revenue), 0),
+        SUM(items),
+        COALESCE(SUM(discount_total), 0),
+        COALESCE(SUM(std_price_total), 0),
+        COUNT(zedd),
+        COUNT(CASE WHEN zedd IS NOT NULL AND cs_items > 0 THEN 1 END),
+        COUNT(CASE WHEN zedd IS NOT NULL AND cs_items = 1 THEN 1 END),
+        COUNT(CASE WHEN zedd IS NOT NULL AND cs_items = 2 THEN 1 END),
+        COUNT(CASE WHEN zedd IS NOT NULL AND cs_items >= 3 THEN 1 END),
+        COUNT(CASE WHEN zedd IS NOT NULL AND category_rank = 1 THEN 1 END),
+        COUNT(CASE WHEN zedd IS NOT NULL AND category_rank = 1 AND ticket_cs_items > 0 THEN 1 END),
+        COUNT(CASE WHEN zedd IS NOT NULL AND category_rank = 1 AND ticket_cs_items = 1 THEN 1 END),
+        COUNT(CASE WHEN zedd IS NOT NULL AND category_rank = 1 AND ticket_cs_items = 2 THEN 1 END),
+        COUNT(CASE WHEN zedd IS NOT NULL AND category_rank = 1 AND ticket_cs_items >= 3 THEN 1 END)
+    FROM ranked
+    GROUP BY day, un, tanam, prodg
+"""
+
+EMPLOYEE_SNAPSHOT_COLUMNS = [
+    'day', 'un', 'tanam', 'prodg', 'revenue', 'items', 'discount_total', 'std_price_total',
+    'tickets', 'cs_tickets', 'cs_one', 'cs_two', 'cs_three_plus',
+    'all_tickets', 'all_cs_tickets', 'all_cs_one', 'all_cs_two', 'all_cs_three_plus',
+]
+
+
+def refresh_employee_snapshot(start_date, end_date):
+    """
+    Rebuild sales_employee_snapshot for every day in [start_date, end_date]
+    (one INSERT ... SELECT, replacing the days inside one transaction).
+    """
+    start_dt, end_dt = _day_bounds(start_date, end_date)
+
+    lines = (
+        Sales.objects
+        .filter(cd__gte=start_dt, cd__lt=end_dt)
+        .annotate(
+            day=TruncDate('cd'),
+            cross_sell=Case(When(NON_POP_LINE, then=Value(1)), default=Value(0), output_field=IntegerField()),
+        )
+        .values('un', 'tanam', 'prodg', 'zedd', 'tanxa', 'discount_price', 'std_price', 'day', 'cross_sell')
+        .order_by()
+    )
+    query = lines.query
+    line_columns = list(query.values_select) + list(query.annotation_select)
+    lines_sql, params = query.sql_with_params()
+    sql = EMPLOYEE_SNAPSHOT_SQL.format(
+        line_columns=', '.join(line_columns),
+        lines_sql=lines_sql,
+        table=connection.ops.quote_name(EmployeeDailySnapshot._meta.db_table),
+        columns=', '.join(connection.ops.quote_name(col) for col in EMPLOYEE_SNAPSHOT_COLUMNS),
+    )
+
+    with transaction.atomic():
+        EmployeeDailySnapshot.objects.filter(day__gte=start_date, day__lte=end_date).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            inserted = cursor.rowcount
+        if inserted < 0:
+            # sqlite3 reports -1 for statements starting with WITH
+            inserted = EmployeeDailySnapshot.objects.filter(day__gte=start_date, day__lte=end_date).count()
+
+    return inserted
+
+
+def _location_ranking_key(year):
+    return f'location_ranking_{year}'
+
+
+def location_ranking(year):
+    """
+    [(un, revenue)] of every location in ``year``, biggest first. Summed
+    from the daily rollup and cached until the rollup of that year is
+    refreshed.
+    """
+    ranking = cache.get(_location_ranking_key(year))
+    if ranking is None:
+        ranking = list(
+            DailySalesRollup.objects.filter(DateWindow.for_year(year).day_q())
+            .values('un')
+            .annotate(total=Sum('revenue'))
+            .order_by('-total')
+            .values_list('un', 'total')
+        )
+        cache.set(_location_ranking_key(year), ranking, getattr(settings, 'CACHE_TIMEOUT_LONG', 3600))
+    return ranking
+
+
+def refresh_rollups(start_date, end_date):
+    """Refresh every derived table for the given date range"""
+    counts = {
+        'daily_rollup_rows': refresh_daily_rollup(start_date, end_date),
+        'ticket_rows': refresh_ticket_summary(start_date, end_date),
+        'employee_rows': refresh_employee_snapshot(start_date, end_date),
+    }
+    cache.delete_many([_location_ranking_key(year) for year in range(start_date.year, end_date.year + 1)])
+    return counts
+
+
+def incremental_range():
+    """
+    Date range that still needs refreshing: from the last rolled-up day
+    (re-done, it may have been partial) up to the newest sale.
+    Returns (None, None) when there is no sales data.
+    """
+    sales_range = Sales.objects.aggregate(min_cd=Min('cd'), max_cd=Max('cd'))
+    if not sales_range['max_cd']:
+        return None, None
+
+    last_day = DailySalesRollup.objects.aggregate(last_day=Max('day'))['last_day']
+    start_date = last_day or timezone.localtime(sales_range['min_cd']).date()
+    end_date = timezone.localtime(sales_range['max_cd']).date()
+    return start_date, end_date
+
+
+def month_chunks(start_date, end_date):
+    """Split [start_date, end_date] into (first, last) day pairs per calendar month"""
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        if chunk_start.month == 12:
+            next_month = chunk_start.replace(year=chunk_start.year + 1, month=1, day=1)
+        else:
+            next_month = chunk_start.replace(month=chunk_start.month + 1, day=1)
+        chunk_end = min(end_date, next_month - timedelta(days=1))
+        yield chunk_start, chunk_end
+        chunk_start = next_month
@@ -1,3 +1,1043 @@
-from django.test import TestCase
+import json
+import re
+import threading
+from dataclasses import replace
+import csv
+import gzip
+import io
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from sales_app.dates import DateWindow
+from sales_app.decorators import cached_fragment, invalidate_fragments
+from sales_app.distribution import EMPTY_DISTRIBUTION, _numpy_stats, _postgres_stats, ticket_distributions
+from sales_app.facets import get_facet_index, invalidate_facets
+from sales_app.filters import EXCLUDED_LOCATIONS, SalesFilter
+from sales_app.insight_report import build_insight_payload, invalidate_insights, precompute_insights, stored_insight_payload
+from sales_app.insight_stats import year_stats
+from sales_app.executor import run_parallel
+from sales_app.jobs import claim_next_job, requeue_stale_jobs, STALE_AFTER
+from sales_app.exports import export_chunks, pq
+from sales_app.employee_stats import (
+    category_leaderboard, employee_leaderboard, snapshot_category_leaderboard, snapshot_employee_leaderboard
+)
+from sales_app.loaders import load_sales, normalize_sales_frame, replace_sales_range
+from sales_app.location_report import location_data_from_lines
+from sales_app.models import Sales, DailySalesRollup, TicketSummary, BackgroundJob, UserProfile
+from sales_app.plans import (
+    aggregate_plan_actual, create_plan_version, expand_plan_daily, get_plan_store, parse_plan_workbook, plan_slice,
+    plan_totals_by_geo, read_plan_upload, warm_plan_store
+)
+from sales_app.rollups import (
+    location_ranking, refresh_daily_rollup, refresh_employee_snapshot, refresh_rollups, refresh_ticket_summary
+)
+
+
+def sql_of(queryset):
+    return str(queryset.query)
+
+
+class UnmanagedSalesTableMixin:
+    """sales_main_web is unmanaged, so the test database doesn't have it: create it per test class"""
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            editor.create_model(Sales)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            editor.delete_model(Sales)
+
+
+class DateWindowSQLTests(SimpleTestCase):
+    """Date filters must stay plain half-open ranges on "CD" / day"""
+
+    # EXTRACT on Postgres, django_datetime_extract on SQLite, BETWEEN from __year
+    YEAR_EXTRACTION = re.compile(r'EXTRACT|_extract\(|BETWEEN', re.IGNORECASE)
+
+    def assertHalfOpen(self, sql, column):
+        self.assertIsNone(self.YEAR_EXTRACTION.search(sql), sql)
+        self.assertIn(f'{column} >= ', sql)
+        self.assertIn(f'{column} < ', sql)
+        self.assertNotIn(f'{column} <= ', sql)
+
+    def test_sales_window_is_half_open(self):
+        window = DateWindow(date(2025, 3, 1), date(2025, 3, 31))
+        self.assertHalfOpen(sql_of(Sales.objects.filter(window.q())), '"CD"')
+
+    def test_year_window_has_no_year_extraction(self):
+        queryset = Sales.objects.filter(DateWindow.for_year(2026).q()).values('un').distinct()
+        self.assertHalfOpen(sql_of(queryset), '"CD"')
+
+    def test_day_columns_are_half_open(self):
+        window = DateWindow(date(2025, 1, 1), date(2025, 6, 30))
+        self.assertHalfOpen(sql_of(DailySalesRollup.objects.filter(window.day_q())), '"day"')
+        self.assertHalfOpen(sql_of(TicketSummary.objects.filter(**window.day_lookups())), '"day"')
+
+    def test_bounds(self):
+        window = DateWindow(date(2025, 3, 1), date(2025, 3, 31))
+        self.assertEqual(window.start.date(), date(2025, 3, 1))
+        self.assertEqual(window.end.date(), date(2025, 4, 1))
+        self.assertEqual(window.day_lookups()['day__lt'], date(2025, 4, 1))
+
+    def test_in_year_handles_leap_day(self):
+        window = DateWindow(date(2024, 2, 1), date(2024, 2, 29)).in_year(2025)
+        self.assertEqual(window, DateWindow(date(2025, 2, 1), date(2025, 2, 28)))
+
+    def test_clamp_to_year(self):
+        window = DateWindow(date(2025, 6, 1), date(2026, 2, 1)).clamp(DateWindow.for_year(2025))
+        self.assertEqual(window, DateWindow(date(2025, 6, 1), date(2025, 12, 31)))
+
+    def test_sources_have_no_year_lookups(self):
+        """__year / extract(year ...) on CD defeats the indexes and partition pruning"""
+        pattern = re.compile(r'\b(cd|day)__year\b|extract\s*\(\s*year', re.IGNORECASE)
+        app_dir = Path(__file__).resolve().parent
+        for path in app_dir.rglob('*.py'):
+            if path.name == 'tests.py':
+                continue
+            for number, line in enumerate(path.read_text(encoding='utf-8').splitlines(), 1):
+                self.assertIsNone(pattern.search(line), f'{path.name}:{number}: {line.strip()}')
+
+
+class FakeProfile:
+    def __init__(self, is_admin, allowed_locations=()):
+        self.is_admin = is_admin
+        self.allowed_locations = list(allowed_locations)
+
+    def get_allowed_locations(self):
+        return [] if self.is_admin else self.allowed_locations
+
+
+class SalesFilterTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def parse(self, query, profile=None, **kwargs):
+        request = self.factory.get('/dashboard/?' + query)
+        return SalesFilter.from_request(request, profile or FakeProfile(True), notify=False, **kwargs)
+
+    def test_same_selection_same_key_and_sql(self):
+        first = self.parse('un_filter=B&un_filter=A&category=MAKEUP&comparison=2026-2025')
+        second = self.parse('category=MAKEUP&un_filter=A&un_filter=B&un_filter=A&comparison=2026-2025')
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+        self.assertEqual(first.key, second.key)
+        self.assertEqual(sql_of(first.sales(2025)), sql_of(second.sales(2025)))
+
+    def test_dates_are_pinned_to_the_current_year(self):
+        sales_filter = self.parse('comparison=2026-2024&start_date=2025-03-01&end_date=bad')
+        self.assertEqual((sales_filter.current_year, sales_filter.previous_year), (2026, 2024))
+        self.assertEqual(sales_filter.start_date, date(2026, 3, 1))
+        self.assertEqual(sales_filter.end_date, date(2026, 12, 31))
+        self.assertEqual(sales_filter.previous_window, DateWindow(date(2024, 3, 1), date(2024, 12, 31)))
+
+    def test_unknown_comparison_falls_back(self):
+        self.assertEqual(self.parse('comparison=nope').comparison, '2025-2024')
+
+    def test_admin_all_means_every_location(self):
+        self.assertEqual(self.parse('un_filter=A&un_filter=all').locations, ())
+
+    def test_non_admin_is_limited_to_allowed_locations(self):
+        profile = FakeProfile(False, ['A', 'B'])
+        self.assertEqual(self.parse('un_filter=A&un_filter=Z', profile).locations, ('A',))
+        self.assertEqual(self.parse('un_filter=Z', profile).locations, ('A', 'B'))
+        self.assertEqual(self.parse('', profile).locations, ('A', 'B'))
+
+    def test_employee_without_location_matches_nothing(self):
+        sales_filter = self.parse('employee_filter=Nino', fields=('employee',))
+        self.assertEqual(sales_filter.employee, 'Nino')
+        self.assertTrue(sales_filter.sales().query.is_empty())
+
+    def test_warehouses_excluded_unless_asked(self):
+        sales_filter = self.parse('')
+        self.assertIn('NOT', sql_of(sales_filter.sales()))
+        self.assertNotIn('NOT', sql_of(sales_filter.sales(exclude_warehouses=False)))
+
+    def test_params_round_trip(self):
+        sales_filter = self.parse('un_filter=B&un_filter=A&category=MAKEUP&start_date=2026-02-01')
+        params = json.loads(json.dumps(sales_filter.as_params()))
+        self.assertEqual(SalesFilter.from_params(params), sales_filter)
+
+
+class CachedFragmentTests(SimpleTestCase):
+    """Dashboard blocks cached per filter key and invalidated per month"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_served_from_cache_until_its_month_is_invalidated(self):
+        january = mock.Mock(return_value={'revenue': 1})
+        february = mock.Mock(return_value={'revenue': 2})
+
+        def fetch():
+            # the filter key carries the dates in the dashboard
+            return (
+                cached_fragment('stats', 'january', [(date(2026, 1, 1), date(2026, 1, 31))], january),
+                cached_fragment('stats', 'february', [(date(2026, 2, 1), date(2026, 2, 28))], february),
+            )
+
+        self.assertEqual(fetch(), ({'revenue': 1}, {'revenue': 2}))
+        self.assertEqual(fetch(), ({'revenue': 1}, {'revenue': 2}))
+        self.assertEqual((january.call_count, february.call_count), (1, 1))
+
+        cached_fragment('stats', 'january, location A', [(date(2026, 1, 1), date(2026, 1, 31))], january)
+        self.assertEqual(january.call_count, 2)
+
+        invalidate_fragments(date(2026, 1, 15), date(2026, 1, 15))
+        fetch()
+        self.assertEqual((january.call_count, february.call_count), (3, 1))
+
+
+class TicketDistributionTests(TestCase):
+    """Histogram and interpolated quartiles of ticket totals"""
+
+    @classmethod
+    def setUpTestData(cls):
+        totals = [('A', 10.0), ('A', 50.0), ('A', 60.0), ('A', 120.0), ('A', 250.0), ('A', 1200.0), ('B', 100.0)]
+        TicketSummary.objects.bulk_create([
+            TicketSummary(zedd=f'T{i}', day=date(2026, 3, 1), un=un, ticket_total=total)
+            for i, (un, total) in enumerate(totals)
+        ])
+        cls.tickets = TicketSummary.objects.values('un', 'ticket_total')
+
+    def test_known_totals(self):
+        stats = ticket_distributions(self.tickets, 'un', 'ticket_total', ['A', 'B', 'C'])
+
+        a = stats['A']
+        self.assertEqual(a['distribution'], {
+            '0-50': 1, '50-100': 2, '100-150': 1, '150-200': 0, '200-300': 1, '300-500': 0, '500-1K': 0, '1K+': 1
+        })
+        self.assertEqual(a['total_tickets'], 6)
+        self.assertAlmostEqual(a['distribution_pct']['50-100'], 100 / 3)
+        self.assertAlmostEqual(a['avg_ticket'], 1690 / 6)
+        # linear interpolation between the closest ranks, as percentile_cont
+        self.assertEqual((a['p25'], a['median_ticket'], a['p75']), (52.5, 90.0, 217.5))
+
+        self.assertEqual((stats['B']['median_ticket'], stats['B']['distribution']['100-150']), (100.0, 1))
+        self.assertEqual(stats['C'], EMPTY_DISTRIBUTION)
+
+    @skipUnless(connection.vendor == 'postgresql', 'percentile_cont needs PostgreSQL')
+    def test_postgres_matches_numpy(self):
+        columns = ['un', 'ticket_total']
+        sql, params = self.tickets.query.sql_with_params()
+        postgres = _postgres_stats(sql, params, columns, 'un', 'ticket_total')
+        numpy = _numpy_stats(sql, params, columns, 'un', 'ticket_total')
+
+        self.assertEqual(postgres.keys(), numpy.keys())
+        for label in numpy:
+            self.assertEqual(list(postgres[label][5]), numpy[label][5])
+            for postgres_value, numpy_value in zip(postgres[label][:5], numpy[label][:5]):
+                self.assertAlmostEqual(float(postgres_value), float(numpy_value))
+
+
+class RunParallelTests(SimpleTestCase):
+    """Dashboard tasks on the bounded thread pool"""
+
+    def test_tasks_run_side_by_side(self):
+        # Both tasks must be running at once to get past the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def task(value):
+            barrier.wait()
+            return value, threading.get_ident()
+
+        results = run_parallel({'a': lambda: task(1), 'b': lambda: task(2)}, max_workers=2)
+
+        self.assertEqual({name: value for name, (value, _) in results.items()}, {'a': 1, 'b': 2})
+        self.assertNotIn(threading.get_ident(), {thread for _, thread in results.values()})
+
+    def test_task_errors_propagate(self):
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaisesMessage(ValueError, 'boom'):
+            run_parallel({'ok': lambda: 1, 'fail': fail}, max_workers=2)
+
+
+class RunParallelInTransactionTests(TestCase):
+    """Inside atomic() the tasks run inline so they see uncommitted rows"""
+
+    def test_inline_inside_atomic(self):
+        User.objects.create(username='uncommitted')
+
+        results = run_parallel({
+            'thread': threading.get_ident,
+            'users': lambda: User.objects.filter(username='uncommitted').count(),
+        }, max_workers=4)
+
+        self.assertEqual(results, {'thread': threading.get_ident(), 'users': 1})
+
+
+class QueryExportTests(TestCase):
+    """Each streamed export format reads back to the rows of the query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        DailySalesRollup.objects.bulk_create([
+            DailySalesRollup(day=date(2025, 3, 1), un='ვაკე 1', prodg='MAKEUP', revenue=12.5, items=3),
+            DailySalesRollup(day=date(2025, 3, 2), un=None, prodg='POP', revenue=0.0, items=1),
+        ])
+        queryset = DailySalesRollup.objects.order_by('day').values_list('un', 'prodg', 'revenue', 'items')
+        cls.sql, cls.params = queryset.query.sql_with_params()
+        cls.rows = [list(row) for row in queryset]
+
+    def export(self, export_format):
+        chunks = export_chunks(self.sql, export_format, self.params)
+        columns = next(chunks)
+        return columns, b''.join(chunks)
+
+    def test_xlsx(self):
+        columns, content = self.export('xlsx')
+
+        sheet = load_workbook(io.BytesIO(content)).active
+        values = [list(row) for row in sheet.iter_rows(values_only=True)]
+        self.assertEqual(values[0], columns)
+        self.assertEqual(values[1:], self.rows)
+
+    def test_csv_and_gzip(self):
+        for export_format in ('csv', 'csv.gz'):
+            columns, content = self.export(export_format)
+            if export_format == 'csv.gz':
+                content = gzip.decompress(content)
+
+            lines = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+            self.assertEqual(lines[0], columns)
+            self.assertEqual(lines[1:], [['' if value is None else str(value) for value in row] for row in self.rows])
+
+    @skipUnless(pq, 'pyarrow is not installed')
+    def test_parquet(self):
+        columns, content = self.export('parquet')
+
+        table = pq.read_table(io.BytesIO(content))
+        self.assertEqual(table.column_names, columns)
+        self.assertEqual([list(row.values()) for row in table.to_pylist()], self.rows)
+
+
+class JobQueueTests(TestCase):
+    """Claiming and requeueing background jobs"""
+
+    def test_claim_is_compare_and_set(self):
+        first = BackgroundJob.objects.create(kind='location_report')
+        second = BackgroundJob.objects.create(kind='location_report')
+        real_first = QuerySet.first
+
+        def lose_race_once(queryset):
+            # Another worker claims the oldest job between our SELECT and UPDATE
+            job_id = real_first(queryset)
+            if job_id == first.id:
+                BackgroundJob.objects.filter(id=first.id).update(status=BackgroundJob.RUNNING)
+            return job_id
+
+        with mock.patch.object(QuerySet, 'first', lose_race_once):
+            claimed = claim_next_job()
+
+        self.assertEqual(claimed.id, second.id)
+        self.assertEqual((claimed.status, claimed.attempts), (BackgroundJob.RUNNING, 1))
+        self.assertEqual(BackgroundJob.objects.get(id=first.id).attempts, 0)
+        self.assertIsNone(claim_next_job())
+
+    def test_only_jobs_without_heartbeat_are_requeued(self):
+        long_ago = timezone.now() - timedelta(hours=3)
+        alive = BackgroundJob.objects.create(
+            kind='location_report', status=BackgroundJob.RUNNING, attempts=1,
+            started_at=long_ago, heartbeat_at=timezone.now()
+        )
+        dead = BackgroundJob.objects.create(
+            kind='location_report', status=BackgroundJob.RUNNING, attempts=1,
+            started_at=long_ago, heartbeat_at=timezone.now() - STALE_AFTER * 2
+        )
+
+        requeue_stale_jobs()
+
+        self.assertEqual(BackgroundJob.objects.get(id=alive.id).status, BackgroundJob.RUNNING)
+        self.assertEqual(BackgroundJob.objects.get(id=dead.id).status, BackgroundJob.QUEUED)
+
+
+class PlanPipelineTests(SimpleTestCase):
+    """Monthly plans spread over days and re-bucketed per period / location"""
+
+    def setUp(self):
+        self.plan_rows = pd.DataFrame({
+            'geo': ['A', 'A', 'B'],
+            'Plan_turnover': [3100.0, 2800.0, 620.0],
+            'Plan_tickets': [31.0, 28.0, float('nan')],
+            'Plan_basket': [100.0, 100.0, 20.0],
+            'plan_date': pd.to_datetime(['2026-01-01', '2026-02-01', '2026-01-01']),
+        })
+        self.daily = expand_plan_daily(self.plan_rows, date(2026, 1, 1), date(2026, 2, 28))
+
+    def test_expand_spreads_month_evenly(self):
+        self.assertEqual(len(self.daily), 31 + 28 + 31)
+        self.assertEqual(set(self.daily[self.daily['geo'] == 'A']['daily_plan']), {100.0})
+        self.assertEqual(self.daily['day'].max(), 58)
+
+    def test_monthly_and_weekly_buckets(self):
+        actual = [{'cd': datetime(2026, 1, 5, tzinfo=timezone.utc), 'actual_turnover': 50.0, 'tickets': 2}]
+        monthly = aggregate_plan_actual(self.daily, actual, date(2026, 1, 1), date(2026, 2, 28), 'monthly')
+        self.assertEqual(monthly['labels'], ["Jan '26", "Feb '26"])
+        self.assertEqual(monthly['plan_values'], [3720.0, 2800.0])
+        self.assertEqual(monthly['actual_values'], [50.0, 0.0])
+        self.assertEqual(monthly['tickets_actual_values'], [2, 0])
+        self.assertEqual(monthly['basket_actual_values'], [25.0, 0])
+        # a missing ticket plan stays missing instead of counting as 0
+        self.assertTrue(pd.isna(monthly['tickets_plan_values'][0]))
+        self.assertEqual(monthly['tickets_plan_values'][1], 28.0)
+
+        weekly = aggregate_plan_actual(self.daily, actual, date(2026, 1, 1), date(2026, 2, 28), 'weekly')
+        self.assertEqual(weekly['labels'][:2], ["W1 '26", "W2 '26"])
+        self.assertEqual(weekly['actual_values'][:2], [0.0, 50.0])
+
+    def test_totals_by_geo(self):
+        totals = plan_totals_by_geo(self.daily)
+        self.assertAlmostEqual(totals.loc['A', 'plan'], 5900.0)
+        self.assertAlmostEqual(totals.loc['B', 'basket'], 20.0)
+
+
+class PlanStoreTests(SimpleTestCase):
+    """The plan workbook is parsed once per file version"""
+
+    def setUp(self):
+        cache.clear()
+        memo = mock.patch.dict('sales_app.plans._memo', clear=True)
+        memo.start()
+        self.addCleanup(memo.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'plan.xlsx')
+
+    def write_workbook(self, turnovers, mtime_ns):
+        pd.DataFrame({
+            'Year': 2026, 'Month': range(1, len(turnovers) + 1), 'location': 'A', 'geo': 'A',
+            'Plan_turnover': turnovers, 'Plan_tickets': None, 'Plan_basket': None,
+        }).to_excel(self.path, sheet_name='Main', index=False)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_reparsed_only_when_the_file_changes(self):
+        self.write_workbook([10.0, 20.0], mtime_ns=1_000_000_000)
+        with mock.patch('sales_app.plans.parse_plan_workbook', wraps=parse_plan_workbook) as parse:
+            store = get_plan_store(self.path)
+            self.assertIs(get_plan_store(self.path), store)
+            self.assertEqual(parse.call_count, 1)
+
+            # same bytes, new mtime: hashed again but served from the cache
+            os.utime(self.path, ns=(2_000_000_000, 2_000_000_000))
+            self.assertEqual(get_plan_store(self.path).digest, store.digest)
+            self.assertEqual(parse.call_count, 1)
+
+            self.write_workbook([10.0, 20.0, 30.0], mtime_ns=3_000_000_000)
+            changed = get_plan_store(self.path)
+            self.assertEqual(parse.call_count, 2)
+
+        self.assertNotEqual(changed.digest, store.digest)
+        self.assertEqual((len(store), len(changed)), (2, 3))
+
+    def test_warm_up_failure_is_logged(self):
+        with mock.patch('sales_app.plans.active_plan_version_id', return_value=None), \
+                mock.patch('sales_app.plans.plan_workbook_path', return_value=self.path), \
+                self.assertLogs('sales_app.plans', 'WARNING') as logs:
+            warm_plan_store()
+        self.assertIn('FileNotFoundError', logs.output[0])
+
+
+class PlanVersionTests(TestCase):
+    """Uploaded plan workbooks are validated and become the active plan"""
+
+    def workbook(self, rows, sheet_name='Main'):
+        buffer = io.BytesIO()
+        pd.DataFrame(rows).to_excel(buffer, sheet_name=sheet_name, index=False)
+        return buffer.getvalue()
+
+    def plan_row(self, geo, month, turnover, tickets=None):
+        return {'Year': 2026, 'Month': month, 'location': geo, 'geo': geo,
+                'Plan_turnover': turnover, 'Plan_tickets': tickets, 'Plan_basket': None}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalid_sheets_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, "missing columns: Plan_basket"):
+            read_plan_upload(self.workbook([{k: v for k, v in self.plan_row('A', 1, 10).items() if k != 'Plan_basket'}]))
+        with self.assertRaisesMessage(ValueError, "Month must be 1-12 in rows 3"):
+            read_plan_upload(self.workbook([self.plan_row('A', 1, 10), self.plan_row('A', 13, 10)]))
+        with self.assertRaisesMessage(ValueError, "same geo and month in rows 2, 3"):
+            read_plan_upload(self.workbook([self.plan_row('A', 1, 10), self.plan_row('A', 1, 20)]))
+        with self.assertRaisesMessage(ValueError, "Worksheet named 'Main' not found"):
+            read_plan_upload(self.workbook([self.plan_row('A', 1, 10)], sheet_name='Plan'))
+
+    def test_latest_upload_is_sliced(self):
+        create_plan_version(self.workbook([self.plan_row('A', 1, 10), self.plan_row('B', 1, 20)]), 'v1.xlsx')
+        version = create_plan_version(self.workbook([
+            self.plan_row('A', 1, 100, 5), self.plan_row('A', 2, 200), self.plan_row('B', 2, 300),
+        ]), 'v2.xlsx')
+
+        self.assertTrue(version.is_active)
+        frame = plan_slice(date(2026, 2, 1), date(2026, 3, 31), 'A')
+        self.assertEqual(frame[['geo', 'Month', 'Plan_turnover']].values.tolist(), [['A', 2, 200.0]])
+        self.assertEqual(len(plan_slice(date(2026, 1, 1), date(2026, 2, 28))), 3)
+
+
+class SalesLoaderTests(UnmanagedSalesTableMixin, TestCase):
+    """POS dataframes mapped onto the Sales columns, bulk loaded and swapped in by day range"""
+
+    def pos_frame(self, **overrides):
+        columns = {
+            'IdReal1': ['1', '2', '3'],
+            'CD': ['2026-03-01 10:00', '2026-03-01 11:00', '2026-03-02 09:00'],
+            'Zedd': ['T1', 'T1', None],
+            'UN': ['A', 'A', 'B'],
+            'Tanxa': ['10.5', 'n/a', None],
+            'IdTanam': [7.0, float('nan'), 8.0],
+            'Unknown': [1, 2, 3],
+        }
+        columns.update(overrides)
+        return pd.DataFrame(columns)
+
+    def test_normalize(self):
+        frame = normalize_sales_frame(self.pos_frame())
+
+        self.assertEqual(list(frame.columns), [field.name for field in Sales._meta.concrete_fields])
+        self.assertEqual(str(frame['idreal1'].dtype), 'Int64')
+        self.assertEqual(str(frame['idtanam'].dtype), 'Int64')
+        self.assertTrue(pd.isna(frame['idtanam'][1]))
+        self.assertEqual(frame['tanxa'][0], 10.5)
+        self.assertTrue(frame['tanxa'][1:].isna().all())
+        self.assertEqual(frame['cd'][0], pd.Timestamp('2026-03-01 10:00', tz='UTC'))
+        self.assertTrue(frame['prod'].isna().all())
+
+        # column names are matched case-insensitively
+        lower = self.pos_frame().rename(columns=str.lower)
+        pd.testing.assert_frame_equal(normalize_sales_frame(lower), frame)
+
+        with self.assertRaisesMessage(ValueError, "must contain 'IdReal1'"):
+            normalize_sales_frame(self.pos_frame().drop(columns='IdReal1'))
+
+    def test_load_round_trip(self):
+        report = load_sales(normalize_sales_frame(self.pos_frame()))
+
+        self.assertEqual(report['rows'], 3)
+        self.assertEqual(report['method'], 'copy' if connection.vendor == 'postgresql' else 'executemany')
+        self.assertEqual(Sales.objects.count(), 3)
+        self.assertEqual(
+            list(Sales.objects.order_by('idreal1').values_list('idreal1', 'zedd', 'tanxa', 'idtanam', 'prod')),
+            [(1, 'T1', 10.5, 7, None), (2, 'T1', None, None, None), (3, None, None, 8, None)]
+        )
+        self.assertEqual(Sales.objects.get(idreal1=3).cd, timezone.make_aware(datetime(2026, 3, 2, 9)))
+
+    def test_replace_range(self):
+        outside = [
+            Sales(idreal1=100, zedd='OLD1', tanxa=1.0, cd=timezone.make_aware(datetime(2026, 2, 28, 23, 59))),
+            Sales(idreal1=101, zedd='OLD2', tanxa=2.0, cd=timezone.make_aware(datetime(2026, 3, 3))),
+        ]
+        Sales.objects.bulk_create(outside + [
+            Sales(idreal1=102, zedd='OLD3', tanxa=3.0, cd=timezone.make_aware(datetime(2026, 3, 1))),
+            Sales(idreal1=103, zedd='OLD3', tanxa=4.0, cd=timezone.make_aware(datetime(2026, 3, 2, 23, 59))),
+        ])
+        before = list(Sales.objects.filter(idreal1__in=[100, 101]).order_by('idreal1').values())
+
+        report = replace_sales_range(normalize_sales_frame(self.pos_frame()), date(2026, 3, 1), date(2026, 3, 2))
+
+        self.assertEqual((report['deleted'], report['inserted'], report['load']['rows']), (2, 3, 3))
+        self.assertEqual(list(Sales.objects.filter(idreal1__in=[100, 101]).order_by('idreal1').values()), before)
+        self.assertEqual(list(Sales.objects.order_by('idreal1').values_list('idreal1', flat=True)), [1, 2, 3, 100, 101])
+
+
+def old_location_data(sales_filter, year):
+    """export_location_csv's former per-location zedd__in implementation"""
+    query = sales_filter.sales(year).filter(prodt='selling item').exclude(tanxa=0)
+    filtered_tickets = query.exclude(prodg='POP')
+    return list(query.values('un').annotate(
+        total=Sum('tanxa'),
+        tickets=Count('zedd', distinct=True),
+        quantity=Count('idreal1'),
+        three_plus=Count('zedd', distinct=True, filter=Q(
+            zedd__in=filtered_tickets.values('zedd').annotate(c=Count('idreal1')).filter(c__gte=3).values('zedd')
+        )),
+        one_count=Count('zedd', distinct=True, filter=Q(
+            zedd__in=filtered_tickets.values('zedd').annotate(c=Count('idreal1')).filter(c=1).values('zedd')
+        )),
+    ).order_by('-total'))
+
+
+class LocationReportTests(UnmanagedSalesTableMixin, TestCase):
+    """The single-CTE location aggregates match the old subquery version"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lines = [
+            # un, zedd, prodg, prod, actions, tanxa, prodt
+            ('A', 'T1', 'MAKEUP', 'P1', None, 10.0, 'selling item'),
+            ('A', 'T1', 'MAKEUP', 'P2', None, 12.5, 'selling item'),
+            ('A', 'T1', 'MAKEUP', 'P1', 'SALE', 7.0, 'selling item'),
+            ('A', 'T2', 'MAKEUP', 'P1', 'SALE', 20.0, 'selling item'),
+            ('A', 'T2', 'POP', 'BAG', 'SALE', 1.0, 'selling item'),
+            ('A', 'T2', 'POP', 'BAG', 'SALE', 1.0, 'selling item'),
+            ('A', 'T3', 'MAKEUP', 'P2', None, 0, 'selling item'),
+            ('A', 'T3', 'MAKEUP', 'P2', None, 15.0, 'selling item'),
+            ('A', 'T4', 'MAKEUP', 'P1', None, 5.0, 'service'),
+            ('A', 'T4', 'SKIN CARE', 'P3', None, 30.0, 'selling item'),
+            ('A', None, 'MAKEUP', 'P1', None, 4.0, 'selling item'),
+            ('B', 'T5', 'MAKEUP', 'P1', None, 9.0, 'selling item'),
+            ('B', 'T5', 'MAKEUP', 'P2', None, 9.0, 'selling item'),
+            ('B', 'T6', 'MAKEUP', 'P1', 'SALE', 11.0, 'selling item'),
+            ('B', 'T6', 'MAKEUP', 'P2', 'SALE', 11.0, 'selling item'),
+            ('B', 'T6', 'POP', 'BAG', 'SALE', 1.0, 'selling item'),
+            ('B', 'T6', None, 'GIFT', 'SALE', 3.0, 'selling item'),
+            ('B', 'T7', 'POP', 'BAG', 'SALE', 1.0, 'selling item'),
+            ('B', 'T8', 'SKIN CARE', 'P3', 'SALE', 40.0, 'selling item'),
+            ('სატესტო', 'T9', 'MAKEUP', 'P1', 'SALE', 99.0, 'selling item'),
+        ]
+        rows = []
+        for year in (2024, 2025):
+            for i, (un, zedd, prodg, prod, actions, tanxa, prodt) in enumerate(lines):
+                # 2024 drops every third line so the years differ
+                if year == 2024 and i % 3 == 0:
+                    continue
+                rows.append(Sales(
+                    idreal1=year * 1000 + i, un=un, zedd=zedd and f'{zedd}-{year}',
+                    prodg=prodg, prod=prod, actions=actions, tanxa=tanxa, prodt=prodt,
+                    cd=timezone.make_aware(datetime(year, 3, 1 + i % 20, 12)),
+                ))
+        Sales.objects.bulk_create(rows)
+
+    def assertSameLocations(self, sales_filter, year):
+        old = {row['un']: row for row in old_location_data(sales_filter, year)}
+        new = {row['un']: row for row in location_data_from_lines(sales_filter, year)}
+        self.assertEqual(set(old), set(new))
+        self.assertTrue(old, 'filter matched no lines')
+        for un, old_row in old.items():
+            for field in ('tickets', 'quantity', 'three_plus', 'one_count'):
+                self.assertEqual(new[un][field], old_row[field], f'{un} {field}')
+            self.assertAlmostEqual(new[un]['total'], old_row['total'])
+            self.assertAlmostEqual(new[un]['avg_basket'], old_row['total'] / old_row['tickets'])
+            self.assertAlmostEqual(new[un]['three_plus_ratio'], old_row['three_plus'] * 100.0 / old_row['tickets'])
+
+    def test_matches_old_implementation(self):
+        base = SalesFilter(2025, 2024, date(2025, 1, 1), date(2025, 12, 31))
+        filters = [
+            replace(base, category='MAKEUP'),
+            replace(base, campaign='SALE'),
+            replace(base, product='P1'),
+            replace(base, campaign='SALE', locations=('B',)),
+        ]
+        for sales_filter in filters:
+            for year in (2025, 2024):
+                with self.subTest(filter=sales_filter, year=year):
+                    self.assertSameLocations(sales_filter, year)
+
+    def test_single_query(self):
+        sales_filter = SalesFilter(2025, 2024, date(2025, 1, 1), date(2025, 12, 31), campaign='SALE')
+        with self.assertNumQueries(1):
+            location_data_from_lines(sales_filter, 2025)
+
+
+class EmployeeStatsTests(UnmanagedSalesTableMixin, TestCase):
+    """Employee leaderboards and ticket-size buckets computed in SQL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lines = [
+            # tanam, zedd, prodg, tanxa
+            ('e1', 'T1', 'MAKEUP', 10.0),
+            ('e1', 'T1', 'MAKEUP', 10.0),
+            ('e1', 'T1', 'MAKEUP', 10.0),
+            ('e1', 'T2', 'SKIN CARE', 50.0),
+            ('e1', 'T2', 'POP', 1.0),
+            ('e2', 'T3', 'MAKEUP', 5.0),
+            ('e2', 'T3', 'MAKEUP', 0),
+            ('e2', 'T4', 'HAIR', 8.0),
+            ('e2', 'T4', 'HAIR', 8.0),
+            ('e3', 'T5', 'POP', 100.0),
+        ]
+        Sales.objects.bulk_create([
+            Sales(idreal1=i, un='A', tanam=tanam, zedd=zedd, prodg=prodg, tanxa=tanxa, prodt='selling item',
+                  discount_price=tanxa, std_price=tanxa * 2,
+                  cd=timezone.make_aware(datetime(2025, 3, int(zedd[1:]), 12, i)))
+            for i, (tanam, zedd, prodg, tanxa) in enumerate(lines)
+        ])
+        cls.sales_filter = SalesFilter(2025, 2024, date(2025, 1, 1), date(2025, 12, 31))
+        refresh_employee_snapshot(date(2025, 1, 1), date(2025, 12, 31))
+
+    def test_employee_leaderboard(self):
+        with self.assertNumQueries(1):
+            rows = employee_leaderboard(self.sales_filter, self.sales_filter, 2025)
+
+        self.assertEqual([row['tanam'] for row in rows], ['e3', 'e1', 'e2'])
+        buckets = {row['tanam']: (row['cs_total'], row['cs_one_item'], row['cs_two_item'], row['cs_three_plus']) for row in rows}
+        self.assertEqual(buckets, {'e1': (2, 1, 0, 1), 'e2': (2, 1, 1, 0), 'e3': (0, 0, 0, 0)})
+        e1 = rows[1]
+        self.assertEqual((e1['total_tickets'], e1['total_items']), (2, 4))
+        self.assertAlmostEqual(e1['skincare_turnover'], 50.0)
+        self.assertAlmostEqual(e1['total_revenue_skincare_eligible'], 80.0)
+
+    def test_category_leaders_top_n(self):
+        with self.assertNumQueries(1):
+            leaders = category_leaderboard(self.sales_filter, 2025, categories=2, per_category=1)
+
+        self.assertEqual([leader['category'] for leader in leaders], ['POP', 'SKIN CARE'])
+        pop, skin = (leader['rows'] for leader in leaders)
+        self.assertEqual([(row['tanam'], row['total_tickets'], row['cs_total']) for row in pop], [('e3', 1, 0)])
+        self.assertEqual([(row['tanam'], row['total_items'], row['cs_total'], row['cs_three_plus']) for row in skin],
+                         [('e1', 1, 1, 0)])
+
+        makeup = category_leaderboard(replace(self.sales_filter, category='MAKEUP'), 2025, categories=1)
+        self.assertEqual([(row['tanam'], row['cs_total'], row['cs_three_plus']) for row in makeup[0]['rows']],
+                         [('e1', 1, 1), ('e2', 1, 0)])
+
+    def test_snapshots_match_sales_lines(self):
+        self.maxDiff = None
+        for sales_filter in (self.sales_filter, replace(self.sales_filter, category='MAKEUP')):
+            self.assertEqual(
+                snapshot_employee_leaderboard(sales_filter, sales_filter, 2025),
+                employee_leaderboard(sales_filter, sales_filter, 2025),
+            )
+            self.assertEqual(
+                snapshot_category_leaderboard(sales_filter, 2025, categories=3, per_category=2),
+                category_leaderboard(sales_filter, 2025, categories=3, per_category=2),
+            )
+
+
+class InsightStatsTests(UnmanagedSalesTableMixin, TestCase):
+    """Per-year insight figures from one grouped pass"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lines = [
+            # year, un, zedd, prodg, tanxa
+            (2025, 'A', 'T1', 'MAKEUP', 10.0),
+            (2025, 'A', 'T1', 'MAKEUP', 10.0),
+            (2025, 'A', 'T1', 'MAKEUP', 10.0),
+            (2025, 'B', 'T2', 'SKIN CARE', 50.0),
+            (2025, 'B', 'T2', 'POP', 1.0),
+            (2024, 'A', 'T9', 'MAKEUP', 20.0),
+        ]
+        Sales.objects.bulk_create([
+            Sales(idreal1=i, un=un, tanam='e1', zedd=zedd, prodg=prodg, prod=f'{prodg} 1', tanxa=tanxa,
+                  prodt='selling item', cd=timezone.make_aware(datetime(year, 3, 1, 12, i)))
+            for i, (year, un, zedd, prodg, tanxa) in enumerate(lines)
+        ])
+        cls.sales_filter = SalesFilter(2025, 2024, date(2025, 1, 1), date(2025, 12, 31))
+
+    def test_all_years_in_three_queries(self):
+        with self.assertNumQueries(3):
+            stats = year_stats(replace(self.sales_filter, category='MAKEUP'), [2025, 2024, 2023])
+
+        current, previous, empty = stats[2025], stats[2024], stats[2023]
+        self.assertEqual((current['total_revenue'], current['total_tickets'], current['total_items']), (30.0, 1, 3))
+        self.assertEqual((current['cross_sell_rate'], current['single_item_rate']), (100, 0))
+        self.assertEqual((previous['total_revenue'], previous['single_item_rate']), (20.0, 100))
+        self.assertEqual((empty['total_revenue'], empty['avg_basket'], empty['top_products']), (0, 0, []))
+
+    def test_top_lists_per_year(self):
+        stats = year_stats(self.sales_filter, [2025, 2024])
+
+        self.assertEqual([row['prodg'] for row in stats[2025]['top_categories']], ['SKIN CARE', 'MAKEUP', 'POP'])
+        self.assertEqual(stats[2025]['top_locations'], [
+            {'un': 'B', 'revenue': 51.0, 'tickets': 1}, {'un': 'A', 'revenue': 30.0, 'tickets': 1}
+        ])
+        self.assertEqual(stats[2024]['top_products'], [{'prod': 'MAKEUP 1', 'revenue': 20.0, 'quantity': 1}])
+
+    def test_stored_payloads(self):
+        precompute_insights(['2025-2024'], log=lambda message: None)
+
+        stored = stored_insight_payload(self.sales_filter)
+        self.assertEqual(stored, build_insight_payload(self.sales_filter))
+        self.assertIsNone(stored_insight_payload(replace(self.sales_filter, category='MAKEUP')))
+
+        invalidate_insights(date(2026, 1, 1), date(2026, 1, 31))
+        self.assertIsNotNone(stored_insight_payload(self.sales_filter))
+        invalidate_insights(date(2023, 1, 1), date(2023, 1, 31))
+        self.assertIsNone(stored_insight_payload(self.sales_filter))
+
+
+class DailyRollupTests(UnmanagedSalesTableMixin, TestCase):
+    """sales_daily_rollup against the Sales aggregates it replaces"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lines = [
+            # day, hour, un, zedd, prodg, actions, tanxa, discount_price, std_price
+            (1, 9, 'A', 'T1', 'MAKEUP', None, 10.0, 8.0, 10.0),
+            (1, 9, 'A', 'T1', 'MAKEUP', None, 10.0, 8.0, 10.0),
+            (1, 9, 'A', 'T1', 'POP', None, 1.0, 1.0, 1.0),
+            (1, 10, 'A', 'T2', 'MAKEUP', '1+1', 0.0, 0.0, 10.0),
+            (1, 11, 'B', 'T3', 'SKIN CARE', None, 50.0, 45.0, 50.0),
+            (2, 9, 'A', 'T4', 'SKIN CARE', '1+1', 30.0, None, None),
+            (2, 23, 'B', 'T5', 'POP', None, 0.0, 0.0, 0.0),
+            (3, 12, 'B', 'T6', 'MAKEUP', None, 25.0, 20.0, 25.0),
+            (3, 12, 'B', 'T6', 'SKIN CARE', None, 15.0, 15.0, 15.0),
+        ]
+        Sales.objects.bulk_create([
+            Sales(idreal1=i, un=un, zedd=zedd, prodg=prodg, prod=f'{prodg} 1', actions=actions, tanxa=tanxa,
+                  discount_price=discount_price, std_price=std_price, prodt='selling item',
+                  cd=timezone.make_aware(datetime(2025, 3, day, hour, i)))
+            for i, (day, hour, un, zedd, prodg, actions, tanxa, discount_price, std_price) in enumerate(lines)
+        ])
+
+    def old_totals(self, *keys):
+        """Totals straight from Sales, grouped by ``keys``"""
+        return {
+            tuple(row.pop(key) for key in keys): row
+            for row in Sales.objects.annotate(day=TruncDate('cd')).values(*keys).annotate(
+                revenue=Sum('tanxa'), items=Count('idreal1'),
+                discount_total=Sum('discount_price'), std_price_total=Sum('std_price')
+            ).order_by()
+        }
+
+    def rollup_totals(self, *keys):
+        return {
+            tuple(row.pop(key) for key in keys): row
+            for row in DailySalesRollup.objects.values(*keys).annotate(
+                revenue=Sum('revenue'), items=Sum('items'),
+                discount_total=Sum('discount_total'), std_price_total=Sum('std_price_total')
+            ).order_by()
+        }
+
+    def test_sums_match_sales(self):
+        refresh_daily_rollup(date(2025, 3, 1), date(2025, 3, 3))
+
+        old = self.old_totals('day', 'un')
+        for key, row in old.items():
+            # the rollup stores 0 where every line had no price
+            old[key] = {name: value or 0 for name, value in row.items()}
+        self.assertEqual(self.rollup_totals('day', 'un'), old)
+
+        old_tickets = Sales.objects.annotate(day=TruncDate('cd')).values(
+            'day', 'un', 'prodg', 'prod', 'actions'
+        ).annotate(tickets=Count('zedd', distinct=True)).order_by()
+        self.assertCountEqual(
+            DailySalesRollup.objects.values('day', 'un', 'prodg', 'prod', 'actions', 'tickets'), old_tickets
+        )
+
+    def test_partial_refresh_leaves_other_days(self):
+        refresh_daily_rollup(date(2025, 3, 1), date(2025, 3, 3))
+        untouched = list(DailySalesRollup.objects.exclude(day=date(2025, 3, 2)).order_by('id').values())
+
+        Sales.objects.create(idreal1=100, un='A', zedd='T7', prodg='SKIN CARE', prod='SKIN CARE 1', actions='1+1',
+                             tanxa=20.0, discount_price=18.0, std_price=20.0, prodt='selling item',
+                             cd=timezone.make_aware(datetime(2025, 3, 2, 15)))
+        Sales.objects.filter(idreal1=0).update(tanxa=99.0)
+        refresh_daily_rollup(date(2025, 3, 2), date(2025, 3, 2))
+
+        self.assertEqual(list(DailySalesRollup.objects.exclude(day=date(2025, 3, 2)).order_by('id').values()), untouched)
+        day_two = DailySalesRollup.objects.get(day=date(2025, 3, 2), un='A')
+        self.assertEqual((day_two.revenue, day_two.items, day_two.tickets), (50.0, 2, 2))
+
+
+class TicketSummaryTests(UnmanagedSalesTableMixin, TestCase):
+    """Dashboard ticket metrics from sales_ticket_summary against the old per-line computation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lines = [
+            # zedd, day, hour, minute, un, prodg, idprod, tanxa
+            ('T1', 1, 10, 0, 'A', 'MAKEUP', 'P1', 10.0),
+            ('T1', 1, 10, 0, 'A', 'MAKEUP', 'P2', 12.0),
+            ('T1', 1, 10, 0, 'A', 'SKIN CARE', 'P3', 30.0),
+            ('T1', 1, 10, 0, 'A', 'POP', 'P9', 1.0),
+            ('T2', 1, 11, 0, 'A', 'MAKEUP', 'P1', 10.0),
+            ('T2', 1, 11, 0, 'A', 'MAKEUP', 'M9157', 2.0),
+            # crosses midnight, two counted lines once the excluded products are dropped
+            ('T3', 1, 23, 50, 'B', 'MAKEUP', 'P1', 10.0),
+            ('T3', 1, 23, 55, 'B', 'MAKEUP', 'M9121', 2.0),
+            ('T3', 2, 0, 5, 'B', 'SKIN CARE', 'M9850', 2.0),
+            ('T3', 2, 0, 10, 'B', 'SKIN CARE', 'P3', 30.0),
+            ('T4', 2, 9, 0, 'B', 'POP', 'P9', 1.0),
+            ('T4', 2, 9, 0, 'B', 'MAKEUP', 'P1', 0.0),
+            ('T5', 2, 12, 0, 'A', 'SKIN CARE', 'P3', 30.0),
+            ('T6', 2, 13, 0, 'B', 'MAKEUP', 'M9850', 5.0),
+        ]
+        Sales.objects.bulk_create([
+            Sales(idreal1=i, zedd=zedd, un=un, tanam='e1', prodg=prodg, prod=f'{prodg} 1', idprod=idprod, tanxa=tanxa,
+                  prodt='selling item', cd=timezone.make_aware(datetime(2026, 3, day, hour, minute)))
+            for i, (zedd, day, hour, minute, un, prodg, idprod, tanxa) in enumerate(lines)
+        ])
+        refresh_rollups(date(2026, 3, 1), date(2026, 3, 2))
+
+        user = User.objects.create_user('viewer', password='x')
+        UserProfile.objects.create(user=user, allowed_locations=['A', 'B'])
+        cls.user = user
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def dashboard_context(self):
+        with mock.patch('sales_app.views.render', return_value=HttpResponse()) as render:
+            self.client.get('/dashboard/', {'comparison': '2026-2025'})
+        return render.call_args.args[2]
+
+    def old_cross_selling_stats(self):
+        """The line-level computation the dashboard used before the ticket summary"""
+        tickets = Sales.objects.filter(
+            cd__date__gte=date(2026, 3, 1), cd__date__lte=date(2026, 3, 2), prodt='selling item'
+        ).exclude(tanxa=0).exclude(prodg='POP').exclude(
+            idprod__in=['M9157', 'M9121', 'M9850']
+        ).values('zedd').annotate(item_count=Count('idreal1'))
+
+        total = len(tickets)
+        cross_sell = sum(1 for ticket in tickets if ticket['item_count'] >= 3)
+        single_item = sum(1 for ticket in tickets if ticket['item_count'] == 1)
+        return cross_sell / total * 100, single_item / total * 100
+
+    def test_midnight_ticket_is_one_row(self):
+        ticket = TicketSummary.objects.get(zedd='T3')
+        self.assertEqual((ticket.day, ticket.item_count, ticket.cross_sell_count), (date(2026, 3, 1), 4, 2))
+
+    def test_refresh_from_inside_a_ticket(self):
+        before = list(TicketSummary.objects.order_by('zedd').values())
+
+        # T3 started on March 1st: refreshing March 2nd alone (a range or
+        # month-chunk boundary) must rebuild its one row over all its lines
+        refresh_ticket_summary(date(2026, 3, 2), date(2026, 3, 2))
+        after = list(TicketSummary.objects.order_by('zedd').values())
+        self.assertEqual([{**row, 'id': None} for row in after], [{**row, 'id': None} for row in before])
+
+        Sales.objects.filter(zedd='T5').delete()
+        refresh_ticket_summary(date(2026, 3, 2), date(2026, 3, 2))
+        self.assertFalse(TicketSummary.objects.filter(zedd='T5').exists())
+
+    def test_percentages_and_basket_match_line_level(self):
+        context = self.dashboard_context()
+
+        cross_sell, single_item = self.old_cross_selling_stats()
+        self.assertEqual((cross_sell, single_item), (25.0, 50.0))
+        self.assertAlmostEqual(context['cross_sell_percentage_current'], cross_sell)
+        self.assertAlmostEqual(context['single_item_percentage_current'], single_item)
+
+        totals = Sales.objects.aggregate(revenue=Sum('tanxa'), tickets=Count('zedd', distinct=True))
+        self.assertEqual(context['avg_basket'], f"${totals['revenue'] / totals['tickets']:.2f}")
+
+
+class LocationRankingTests(UnmanagedSalesTableMixin, TestCase):
+    """Cached location ranking from the daily rollup and the views reading it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        lines = [
+            # un, zedd, prodg, tanxa
+            ('A', 'T1', 'MAKEUP', 10.0),
+            ('A', 'T1', 'MAKEUP', 20.0),
+            ('B', 'T2', 'SKIN CARE', 50.0),
+            ('B', 'T2', 'POP', 1.0),
+        ]
+        Sales.objects.bulk_create([
+            Sales(idreal1=i, un=un, tanam='e1', zedd=zedd, prodg=prodg, prod=f'{prodg} 1', tanxa=tanxa,
+                  prodt='selling item', cd=timezone.make_aware(datetime(2026, 3, 1, 12, i)))
+            for i, (un, zedd, prodg, tanxa) in enumerate(lines)
+        ])
+        refresh_rollups(date(2026, 1, 1), date(2026, 12, 31))
+
+        cls.admin = User.objects.create_user('admin', password='x')
+        UserProfile.objects.create(user=cls.admin, is_admin=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_follows_rollup_refresh(self):
+        self.assertEqual(location_ranking(2026), [('B', 51.0), ('A', 30.0)])
+
+        Sales.objects.create(idreal1=100, un='A', zedd='T7', prodg='MAKEUP', tanxa=40.0, prodt='selling item',
+                             cd=timezone.make_aware(datetime(2026, 4, 1, 12)))
+        with self.assertNumQueries(0):
+            self.assertEqual(location_ranking(2026)[0], ('B', 51.0))
+        refresh_rollups(date(2026, 4, 1), date(2026, 4, 1))
+        self.assertEqual(location_ranking(2026), [('A', 70.0), ('B', 51.0)])
+
+    def test_dashboard_defaults_admin_to_top_location(self):
+        with mock.patch('sales_app.views.location_ranking', wraps=location_ranking) as ranking, \
+                mock.patch('sales_app.views.render', return_value=HttpResponse()) as render:
+            self.client.get('/dashboard/', {'comparison': '2026-2025'})
+
+        ranking.assert_called_once_with(2026)
+        request = render.call_args.args[0]
+        self.assertIn('Showing data for B.', [str(message) for message in get_messages(request)][0])
+
+    def test_stat_main_reads_the_ranking(self):
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch('sales_app.views.render', return_value=HttpResponse()) as render:
+            self.client.get('/hypothesis_testing_me_/')
+
+        self.assertEqual(render.call_args.args[2]['location'], [('B', 51.0), ('A', 30.0)])
+        self.assertFalse([query for query in queries if Sales._meta.db_table in query['sql']])
+
+
+class FacetIndexTests(TestCase):
+    """Filter dropdown options from the per-year facet index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rows = [
+            # year, un, prodg, prod, actions
+            (2026, 'A', 'MAKEUP', 'Lipstick', '1+1'),
+            (2026, 'A', 'SKIN CARE', 'Cream', '1+1'),
+            (2026, 'B', 'MAKEUP', 'Mascara', '3+1'),
+            (2026, 'B', 'MAKEUP', 'Lipstick', '2+1'),
+            (2026, EXCLUDED_LOCATIONS[0], 'PERFUME', 'Scent', '1+1'),
+            (2025, 'C', 'MAKEUP', 'Lipstick', '1+1'),
+        ]
+        DailySalesRollup.objects.bulk_create([
+            DailySalesRollup(day=date(year, 3, 1), un=un, prodg=prodg, prod=prod, actions=actions)
+            for year, un, prodg, prod, actions in rows
+        ])
+
+    def setUp(self):
+        cache.clear()
+        memo = mock.patch.dict('sales_app.facets._memo', clear=True)
+        memo.start()
+        self.addCleanup(memo.stop)
+
+    def test_options_cascade(self):
+        # four value lists and the combinations, all from the rollup
+        with self.assertNumQueries(5):
+            index = get_facet_index(2026)
+
+        self.assertEqual(index.options(), {
+            'locations': ['A', 'B'],
+            'categories': ['MAKEUP', 'SKIN CARE'],
+            'products': ['Cream', 'Lipstick', 'Mascara'],
+            'campaigns': ['1+1', '2+1', '3+1'],
+        })
+        # each list is narrowed by the other selections, not its own
+        self.assertEqual(index.options(locations=['B'], category='MAKEUP'), {
+            'locations': ['A', 'B'],
+            'categories': ['MAKEUP'],
+            'products': ['Lipstick', 'Mascara'],
+            'campaigns': ['2+1', '3+1'],
+        })
+        self.assertEqual(index.options(product='Lipstick', campaign='1+1')['locations'], ['A'])
+        self.assertEqual(index.options(locations=['Z'])['categories'], [])
+
+    def test_invalidate_rebuilds_only_those_years(self):
+        self.assertEqual(get_facet_index(2025).options()['locations'], ['C'])
+        get_facet_index(2026)
+        DailySalesRollup.objects.create(day=date(2026, 4, 1), un='D', prodg='MAKEUP', prod='Lipstick', actions='1+1')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_facet_index(2026).options()['locations'], ['A', 'B'])
+
+        invalidate_facets(date(2026, 4, 1), date(2026, 4, 1))
+        self.assertEqual(get_facet_index(2026).options()['locations'], ['A', 'B', 'D'])
+        with self.assertNumQueries(0):
+            get_facet_index(2025)
@@ -1,21 +1,37 @@
 import json
-import pandas as pd
-from openpyxl import Workbook, load_workbook
+import logging
+from openpyxl import load_workbook
 from django.shortcuts import render
-from .models import Sales
-from django.db.models import Sum, Count, Avg, FloatField, ExpressionWrapper, F, Q, Min,OuterRef, Max
+from .models import Sales, DailySalesRollup, TicketSummary, UserProfile, BackgroundJob
+from .distribution import ticket_distributions, TICKET_RANGES
+from .executor import run_parallel
+from .exports import stream_query_export, EXPORT_FORMATS
+from .facets import get_facet_index
+from .jobs import enqueue_job, LOCATION_REPORT_JOB
+from .location_report import build_location_report
+from .insight_report import build_insight_payload, stored_insight_payload
+from .employee_stats import (
+    employee_leaderboard, snapshots_cover, snapshot_employee_leaderboard, snapshot_category_leaderboard
+)
+from .plans import (
+    plan_slice, plan_workbook_path, expand_plan_daily, aggregate_plan_actual, plan_totals_by_geo
+)
+from .filters import SalesFilter, EXCLUDED_LOCATIONS
+from .query_console import (
+    PAGE_SIZES, cancel_query, default_page_size, describe_error, export_timeout_ms,
+    fetch_page, preview_timeout_ms, strip_query, validate_query,
+)
+from .dates import DateWindow
+from .rollups import location_ranking
+from django.db.models import Sum, Count, Avg, Q, Min,OuterRef, Max, Case, When, Value, CharField
 from django.db.models.functions import ExtractMonth, ExtractDay, TruncDay, ExtractWeek
 from django.http import HttpResponse
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
+from dataclasses import replace
 from django.utils import timezone
 from django.http import JsonResponse
-import os
-from django.conf import settings
 import calendar
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 from pathlib import Path
-from django.db import connection
 from django.contrib import messages
 import re
 
@@ -24,67 +40,24 @@ from django.http import HttpResponseForbidden
 
 from django.contrib.auth import login, logout ,authenticate
 from django.contrib.auth.forms import AuthenticationForm
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.db.models import Prefetch
 
-from sales_app.decorators import cache_dashboard_view
+from sales_app.decorators import cache_dashboard_view, cached_fragment
+
+logger = logging.getLogger(__name__)
 
 
 # At the top of your views.py, outside any view
-def calculate_filter_options(current_year, selected_locations, selected_category, selected_product, selected_campaign, user_profile):
+def calculate_filter_options(sales_filter, user_profile):
     """Shared logic for calculating available filter options"""
-    allowed_locations = user_profile.get_allowed_locations()
-    
-    base_query = Sales.objects.filter(cd__year=current_year).exclude(
-        un__in=["მთავარი საწყობი 2", "სატესტო"]
+    options = get_facet_index(sales_filter.current_year).options(
+        sales_filter.locations, sales_filter.category, sales_filter.product, sales_filter.campaign
     )
-    
-    # LOCATIONS
-    q_locations = base_query
-    if selected_category != 'all':
-        q_locations = q_locations.filter(prodg=selected_category)
-    if selected_product != 'all':
-        q_locations = q_locations.filter(prod=selected_product)
-    if selected_campaign != 'all':
-        q_locations = q_locations.filter(actions=selected_campaign)
-    available_locations = list(q_locations.values_list('un', flat=True).distinct().order_by('un'))
-    
-    # CATEGORIES
-    q_categories = base_query
-    if selected_locations:
-        q_categories = q_categories.filter(un__in=selected_locations)
-    if selected_product != 'all':
-        q_categories = q_categories.filter(prod=selected_product)
-    if selected_campaign != 'all':
-        q_categories = q_categories.filter(actions=selected_campaign)
-    available_categories = list(q_categories.values_list('prodg', flat=True).distinct().order_by('prodg'))
-    
-    # PRODUCTS
-    q_products = base_query
-    if selected_locations:
-        q_products = q_products.filter(un__in=selected_locations)
-    if selected_category != 'all':
-        q_products = q_products.filter(prodg=selected_category)
-    if selected_campaign != 'all':
-        q_products = q_products.filter(actions=selected_campaign)
-    available_products = list(q_products.values_list('prod', flat=True).distinct().order_by('prod'))
-    
-    # CAMPAIGNS
-    q_campaigns = base_query
-    if selected_locations:
-        q_campaigns = q_campaigns.filter(un__in=selected_locations)
-    if selected_category != 'all':
-        q_campaigns = q_campaigns.filter(prodg=selected_category)
-    if selected_product != 'all':
-        q_campaigns = q_campaigns.filter(prod=selected_product)
-    available_campaigns = list(q_campaigns.values_list('actions', flat=True).distinct().order_by('actions'))
-    
-    return {
-        'locations': available_locations if user_profile.is_admin else allowed_locations,
-        'categories': available_categories,
-        'products': available_products,
-        'campaigns': available_campaigns
-    }
+    if not user_profile.is_admin:
+        options['locations'] = user_profile.get_allowed_locations()
+    return options
 
 def user_login(request):
     # If already logged in, go to dashboard
@@ -135,391 +108,362 @@ def dashboard(request):
     
     allowed_locations = user_profile.get_allowed_locations()
     
-    # Year selection
-    comparison_mode = request.GET.get('comparison', '2026-2025')
-    if comparison_mode == '2026-2025':
-        current_year, previous_year = 2026, 2025
-    elif comparison_mode == '2026-2024':
-        current_year, previous_year = 2026, 2024
-    else:
-        current_year, previous_year = 2025, 2024
-    
-    # Date parsing
-    start_date_str = request.GET.get('start_date', f'{current_year}-01-01')
-    end_date_str = request.GET.get('end_date', f'{current_year}-12-31')
+    # Years, dates, location security check and line filters
+    sales_filter = SalesFilter.from_request(request, user_profile, default_comparison='2026-2025')
+    current_year, previous_year = sales_filter.current_year, sales_filter.previous_year
     
-    try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-    except:
-        start_date = date(current_year, 1, 1)
-    
-    try:
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-    except:
-        end_date = date(current_year, 12, 31)
-    
-    # Location security check - UPDATED FOR ADMIN PERFORMANCE
-    selected_locations = request.GET.getlist('un_filter')
-    
-    if not user_profile.is_admin:
-        # Non-admin logic (unchanged)
-        if not selected_locations or 'all' in selected_locations:
-            selected_locations = allowed_locations
-        else:
-            unauthorized = set(selected_locations) - set(allowed_locations)
-            if unauthorized:
-                messages.warning(request, f"Access denied to: {', '.join(unauthorized)}")
-                selected_locations = [loc for loc in selected_locations if loc in allowed_locations]
-            if not selected_locations:
-                selected_locations = allowed_locations
-    else:
-        # ADMIN: Default to top location to avoid slow "all" query
-        if not selected_locations:
-            # First visit - auto-select top location by revenue
-            top_location = Sales.objects.filter(
-                cd__year=current_year
-            ).values('un').annotate(
-                total=Sum('tanxa')
-            ).order_by('-total').values_list('un', flat=True).first()
+    if user_profile.is_admin and not sales_filter.locations:
+        if 'all' not in request.GET.getlist('un_filter'):
+            # ADMIN first visit - auto-select top location by revenue to avoid slow "all" query
+            ranking = location_ranking(current_year)
+            top_location = ranking[0][0] if ranking else None
             
             if top_location:
-                selected_locations = [top_location]
+                sales_filter = sales_filter.with_locations([top_location])
                 messages.info(request, f"Showing data for {top_location}. Use filters to view other locations or all data.")
-            else:
-                selected_locations = []
-        elif 'all' in selected_locations:
+        else:
             # Explicitly selected "all" - allow but warn about performance
-            selected_locations = []
             messages.warning(request, "Loading all locations - this may take 1-2 minutes. Consider selecting specific locations for faster results.")
     
-    if not selected_locations and not user_profile.is_admin:
+    if not sales_filter.locations and not user_profile.is_admin:
         return HttpResponseForbidden("You don't have access to any locations. Contact administrator.")
     
-    # Display selected location
-    if user_profile.is_admin and (not selected_locations or 'all' in request.GET.getlist('un_filter')):
-        selected_un = 'all'
-    else:
-        selected_un = selected_locations[0] if len(selected_locations) == 1 else 'multiple'
-    
-    # Other filters
-    selected_category = request.GET.get('category', 'all')
-    selected_product = request.GET.get('prod_filter', 'all')
-    selected_campaign = request.GET.get('campaign_filter', 'all')
-    
-    # Adjust dates to current year
-    start_date = start_date.replace(year=current_year)
-    end_date = end_date.replace(year=current_year)
-    
-    # Get max date for current year (OPTIMIZED - single query)
-    max_date_query = Sales.objects.filter(cd__year=current_year)
-    if selected_locations:
-        max_date_query = max_date_query.filter(un__in=selected_locations)
-    if selected_category != 'all':
-        max_date_query = max_date_query.filter(prodg=selected_category)
-    if selected_product != 'all':
-        max_date_query = max_date_query.filter(prod=selected_product)
-    if selected_campaign != 'all':
-        max_date_query = max_date_query.filter(actions=selected_campaign)
+    # Get max date for current year (from the daily rollup - no raw scan)
+    max_date = sales_filter.apply(
+        DailySalesRollup.objects.filter(DateWindow.for_year(current_year).day_q()),
+        exclude_warehouses=False
+    ).aggregate(max_date=Max('day'))['max_date']
     
-    max_date = max_date_query.aggregate(max_date=Max('cd'))['max_date']
+    if max_date and sales_filter.end_date > max_date:
+        sales_filter = sales_filter.with_end_date(max_date)
     
-    if max_date and end_date > max_date.date():
-        end_date = max_date.date()
+    start_date, end_date = sales_filter.start_date, sales_filter.end_date
     
-    # Previous year dates
-    previous_start = start_date.replace(year=previous_year)
-    previous_end = end_date.replace(year=previous_year)
+    # Half-open date windows: "CD" >= start AND "CD" < day after end
+    current_window = sales_filter.current_window
+    previous_window = sales_filter.previous_window
+    previous_start, previous_end = previous_window.start_date, previous_window.end_date
     
-    # Timezone-aware datetimes
-    start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
     end_datetime = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
-    previous_start_datetime = timezone.make_aware(datetime.combine(previous_start, datetime.min.time()))
-    previous_end_datetime = timezone.make_aware(datetime.combine(previous_end, datetime.max.time()))
-    
-    date_filter_current = {
-        'cd__year': current_year,
-        'cd__gte': start_datetime,
-        'cd__lte': end_datetime
-    }
-    
-    date_filter_previous = {
-        'cd__year': previous_year,
-        'cd__gte': previous_start_datetime,
-        'cd__lte': previous_end_datetime
-    }
     
     # ==================== HELPER FUNCTIONS ====================
     
-    def apply_filters(q):
-        """Apply all filters consistently"""
-        if selected_locations:
-            q = q.filter(un__in=selected_locations)
-        if selected_category != 'all':
-            q = q.filter(prodg=selected_category)
-        if selected_product != 'all':
-            q = q.filter(prod=selected_product)
-        if selected_campaign != 'all':
-            q = q.filter(actions=selected_campaign)
-        return q
-    
     def get_base_queryset(is_current=True):
         """Get base queryset with filters applied"""
-        if is_current:
-            q = Sales.objects.filter(**date_filter_current).exclude(
-                un__in=["მთავარი საწყობი 2", "სატესტო"]
-            )
-        else:
-            q = Sales.objects.filter(**date_filter_previous).exclude(
-                un__in=["მთავარი საწყობი 2", "სატესტო"]
-            )
-        return apply_filters(q)
+        return sales_filter.sales(current_year if is_current else previous_year)
+    
+    def get_rollup_queryset(is_current=True):
+        """Same filters as get_base_queryset, against the daily rollup table"""
+        return sales_filter.rollup(current_year if is_current else previous_year)
+    
+    # Ticket-level metrics can come from the per-ticket summary table unless a
+    # category/product/campaign filter narrows which lines of a ticket count
+    use_ticket_summary = not sales_filter.has_line_filters
+    
+    # ==================== PERIOD HELPERS ====================
+    # Current and previous periods are fetched by the same statement: rows are
+    # labelled with their period and aggregates use FILTER (WHERE <period>)
+    
+    PERIODS = ('current', 'previous')
+    
+    def period_q(field, period):
+        """Q for one period on the raw cd timestamp or a rollup/ticket day column"""
+        window = current_window if period == 'current' else previous_window
+        if field == 'cd':
+            return window.q()
+        return window.day_q(field)
+    
+    def period_label(field):
+        return Case(
+            When(period_q(field, 'current'), then=Value('current')),
+            default=Value('previous'),
+            output_field=CharField()
+        )
+    
+    def in_periods(queryset, field):
+        """Restrict to both periods and annotate each row with its period label"""
+        return queryset.filter(
+            period_q(field, 'current') | period_q(field, 'previous')
+        ).annotate(period=period_label(field))
+    
+    def get_period_base_queryset():
+        return in_periods(sales_filter.apply(Sales.objects.all()), 'cd')
+    
+    def get_period_rollup_queryset():
+        return in_periods(sales_filter.apply(DailySalesRollup.objects.all()), 'day')
+    
+    def get_period_ticket_queryset(exclude_warehouses=True):
+        """Per-ticket summary rows for both periods and the selected locations"""
+        q = sales_filter.apply(TicketSummary.objects.all(), exclude_warehouses=exclude_warehouses, lines=False)
+        return in_periods(q, 'day')
+    
+    def get_period_selling_lines(*excluded_groups, excluded_products=()):
+        """Raw selling lines for both periods (line-filtered ticket metrics)"""
+        q = Sales.objects.filter(prodt='selling item').exclude(tanxa=0)
+        if excluded_groups:
+            q = q.exclude(prodg__in=excluded_groups)
+        if excluded_products:
+            q = q.exclude(idprod__in=excluded_products)
+        return in_periods(sales_filter.apply(q, exclude_warehouses=False), 'cd')
+    
+    def per_period_aggregate(queryset, field, **aggregates):
+        """
+        One aggregate() call returning {period: {name: value}}; each aggregate
+        is evaluated once per period with the period added to its filter
+        """
+        expressions = {}
+        for period in PERIODS:
+            for name, aggregate in aggregates.items():
+                period_aggregate = aggregate.copy()
+                period_filter = period_q(field, period)
+                period_aggregate.filter = period_filter & aggregate.filter if aggregate.filter else period_filter
+                expressions[f'{name}__{period}'] = period_aggregate
+        
+        result = queryset.aggregate(**expressions)
+        return {
+            period: {name: result[f'{name}__{period}'] for name in aggregates}
+            for period in PERIODS
+        }
     
     # ==================== OPTIMIZED DATA FETCHING ====================
     
-    def get_comprehensive_stats(is_current=True):
+    def get_comprehensive_stats():
         """
-        PRODUCTION OPTIMIZED: Prevents timeouts with proper filtering
+        Revenue/items/discount come from the daily rollup, ticket counts from
+        the ticket summary (or raw rows when line filters are active).
+        Both periods per query; returns {'current': {...}, 'previous': {...}}.
         """
-        # Use the pre-built date filters from parent scope
-        if is_current:
-            base_filter = date_filter_current
-        else:
-            base_filter = date_filter_previous
-        
-        # Build query using the complete filter
-        q = Sales.objects.filter(**base_filter).exclude(
-            un__in=["მთავარი საწყობი 2", "სატესტო"]
-        )
-        
-        if selected_locations:
-            q = q.filter(un__in=selected_locations)
-        if selected_category != 'all':
-            q = q.filter(prodg=selected_category)
-        if selected_product != 'all':
-            q = q.filter(prod=selected_product)
-        if selected_campaign != 'all':
-            q = q.filter(actions=selected_campaign)
+        empty_stats = {
+            'daily_data': [],
+            'total_revenue': 0,
+            'total_tickets': 0,
+            'total_items': 0,
+            'avg_basket': 0,
+            'discount_share': 0
+        }
+        rollup = get_period_rollup_queryset()
         
-        # STEP 1: Get simple aggregates (NO DISTINCT - very fast)
+        # STEP 1: Additive totals from the rollup
         try:
-            totals = q.aggregate(
-                total_revenue=Sum('tanxa'),
-                total_items=Count('idreal1'),
-                discount_total=Sum('discount_price'),
-                std_price_total=Sum('std_price')
+            totals = per_period_aggregate(
+                rollup, 'day',
+                total_revenue=Sum('revenue'),
+                total_items=Sum('items'),
+                discount_total=Sum('discount_total'),
+                std_price_total=Sum('std_price_total')
             )
         except Exception as e:
             print(f"❌ Stats query failed: {e}")
-            return {
-                'daily_data': [],
-                'total_revenue': 0,
-                'total_tickets': 0,
-                'total_items': 0,
-                'avg_basket': 0,
-                'discount_share': 0
-            }
+            return {period: dict(empty_stats) for period in PERIODS}
         
         # STEP 2: Get ticket count with timeout protection
         try:
-            # Use Django ORM instead of raw SQL for simplicity
-            total_tickets = q.values('zedd').distinct().count()
+            if use_ticket_summary:
+                ticket_counts = per_period_aggregate(
+                    get_period_ticket_queryset(), 'day',
+                    tickets=Count('id')
+                )
+            else:
+                ticket_counts = per_period_aggregate(
+                    get_period_base_queryset(), 'cd',
+                    tickets=Count('zedd', distinct=True)
+                )
         except Exception as e:
             print(f"⚠️ Ticket count timed out, estimating: {e}")
-            total_tickets = max(1, (totals['total_items'] or 0) // 3)
+            ticket_counts = {
+                period: {'tickets': max(1, (totals[period]['total_items'] or 0) // 3)}
+                for period in PERIODS
+            }
         
-        # STEP 3: Simplified daily data with ticket counts per day
+        # STEP 3: Daily data - sums from the rollup, ticket counts per day
+        daily_data = {period: [] for period in PERIODS}
         try:
-            # Get daily revenue and items
-            daily_data = list(
-                q.annotate(
+            daily_rows = rollup.annotate(
+                month=ExtractMonth('day'),
+                day_of_month=ExtractDay('day')
+            ).values('period', 'month', 'day_of_month').annotate(
+                revenue=Sum('revenue'),
+                items=Sum('items'),
+                discount_total=Sum('discount_total'),
+                std_price_total=Sum('std_price_total')
+            ).order_by('period', 'month', 'day_of_month')
+            
+            if use_ticket_summary:
+                daily_ticket_rows = get_period_ticket_queryset().annotate(
+                    month=ExtractMonth('day'),
+                    day_of_month=ExtractDay('day')
+                ).values('period', 'month', 'day_of_month').annotate(
+                    tickets=Count('id')
+                ).order_by()
+            else:
+                daily_ticket_rows = get_period_base_queryset().annotate(
                     month=ExtractMonth('cd'),
-                    day=ExtractDay('cd')
-                ).values('month', 'day').annotate(
-                    revenue=Sum('tanxa'),
-                    items=Count('idreal1'),
-                    discount_total=Sum('discount_price'),
-                    std_price_total=Sum('std_price'),
-                    tickets=Count('zedd', distinct=True)  # FIXED: Get actual daily ticket count
-                ).order_by('month', 'day')[:366]
-            )
+                    day_of_month=ExtractDay('cd')
+                ).values('period', 'month', 'day_of_month').annotate(
+                    tickets=Count('zedd', distinct=True)
+                ).order_by()
+            daily_tickets = {
+                (row['period'], row['month'], row['day_of_month']): row['tickets']
+                for row in daily_ticket_rows
+            }
+            for row in daily_rows:
+                period = row.pop('period')
+                row['day'] = row.pop('day_of_month')
+                row['tickets'] = daily_tickets.get((period, row['month'], row['day']), 0)
+                daily_data[period].append(row)
         except Exception as e:
             print(f"❌ Daily data failed: {e}")
-            daily_data = []
+            daily_data = {period: [] for period in PERIODS}
         
         # Calculate final metrics
-        total_revenue = float(totals['total_revenue'] or 0)
-        total_items = totals['total_items'] or 0
-        total_discount = float(totals['discount_total'] or 0)
-        total_std_price = float(totals['std_price_total'] or 0)
-        
-        avg_basket = total_revenue / total_tickets if total_tickets > 0 else 0
-        discount_share = (1 - (total_discount / total_std_price)) * 100 if total_std_price > 0 else 0
+        stats = {}
+        for period in PERIODS:
+            total_revenue = float(totals[period]['total_revenue'] or 0)
+            total_items = totals[period]['total_items'] or 0
+            total_discount = float(totals[period]['discount_total'] or 0)
+            total_std_price = float(totals[period]['std_price_total'] or 0)
+            total_tickets = ticket_counts[period]['tickets']
+            
+            stats[period] = {
+                'daily_data': daily_data[period],
+                'total_revenue': total_revenue,
+                'total_tickets': total_tickets,
+                'total_items': total_items,
+                'avg_basket': total_revenue / total_tickets if total_tickets > 0 else 0,
+                'discount_share': (1 - (total_discount / total_std_price)) * 100 if total_std_price > 0 else 0
+            }
         
-        return {
-            'daily_data': daily_data,
-            'total_revenue': total_revenue,
-            'total_tickets': total_tickets,
-            'total_items': total_items,
-            'avg_basket': avg_basket,
-            'discount_share': discount_share
-        }
+        return stats
 
-    def get_cross_selling_stats(is_current=True):
+    def get_cross_selling_stats():
         """
-        OPTIMIZED: Single query with conditional aggregation for cross-selling
+        OPTIMIZED: Conditional aggregation for cross-selling, both periods at once
         """
-        if is_current:
-            date_filter = date_filter_current
+        if use_ticket_summary:
+            counts = per_period_aggregate(
+                get_period_ticket_queryset(exclude_warehouses=False).filter(cross_sell_count__gt=0), 'day',
+                total_tickets=Count('id'),
+                cross_sell_tickets=Count('id', filter=Q(cross_sell_count__gte=3)),
+                single_item_tickets=Count('id', filter=Q(cross_sell_count=1))
+            )
         else:
-            date_filter = date_filter_previous
-        
-        q = (Sales.objects
-            .filter(**date_filter, prodt='selling item')
-            .exclude(tanxa=0)
-            .exclude(prodg='POP')
-            .exclude(idprod__in=['M9157', 'M9121', 'M9850']))
-        
-        q = apply_filters(q)
-        
-        # Single query to get ticket-level counts
-        tickets_with_counts = q.values('zedd').annotate(
-            item_count=Count('idreal1')
-        )
-        
-        # Convert to list once
-        ticket_list = list(tickets_with_counts)
-        
-        total_tickets = len(ticket_list)
-        if total_tickets == 0:
-            return {
-                'cross_sell_tickets': 0,
-                'cross_sell_percentage': 0,
-                'single_item_tickets': 0,
-                'single_item_percentage': 0,
-                'total_tickets': 0
+            q = get_period_selling_lines('POP', excluded_products=['M9157', 'M9121', 'M9850'])
+            
+            counts = {
+                period: {'total_tickets': 0, 'cross_sell_tickets': 0, 'single_item_tickets': 0}
+                for period in PERIODS
+            }
+            for ticket in q.values('period', 'zedd').annotate(item_count=Count('idreal1')).order_by():
+                period_counts = counts[ticket['period']]
+                period_counts['total_tickets'] += 1
+                if ticket['item_count'] >= 3:
+                    period_counts['cross_sell_tickets'] += 1
+                elif ticket['item_count'] == 1:
+                    period_counts['single_item_tickets'] += 1
+        
+        stats = {}
+        for period in PERIODS:
+            total_tickets = counts[period]['total_tickets']
+            cross_sell_tickets = counts[period]['cross_sell_tickets']
+            single_item_tickets = counts[period]['single_item_tickets']
+            
+            if total_tickets == 0:
+                stats[period] = {
+                    'cross_sell_tickets': 0,
+                    'cross_sell_percentage': 0,
+                    'single_item_tickets': 0,
+                    'single_item_percentage': 0,
+                    'total_tickets': 0
+                }
+                continue
+            
+            stats[period] = {
+                'cross_sell_tickets': cross_sell_tickets,
+                'cross_sell_percentage': (cross_sell_tickets / total_tickets * 100),
+                'single_item_tickets': single_item_tickets,
+                'single_item_percentage': (single_item_tickets / total_tickets * 100),
+                'total_tickets': total_tickets
             }
         
-        cross_sell_tickets = sum(1 for t in ticket_list if t['item_count'] >= 3)
-        single_item_tickets = sum(1 for t in ticket_list if t['item_count'] == 1)
-        
-        return {
-            'cross_sell_tickets': cross_sell_tickets,
-            'cross_sell_percentage': (cross_sell_tickets / total_tickets * 100),
-            'single_item_tickets': single_item_tickets,
-            'single_item_percentage': (single_item_tickets / total_tickets * 100),
-            'total_tickets': total_tickets
-        }
+        return stats
     
-    def get_daily_cross_selling_stats(is_current=True):
+    def get_daily_cross_selling_stats():
         """
-        OPTIMIZED: Get daily cross-selling percentages
+        OPTIMIZED: Get daily cross-selling percentages for both periods
         """
-        if is_current:
-            date_filter = date_filter_current
+        date_stats = {period: {} for period in PERIODS}
+        
+        if use_ticket_summary:
+            daily_counts = get_period_ticket_queryset(exclude_warehouses=False).filter(non_pop_count__gt=0).annotate(
+                month=ExtractMonth('day'),
+                day_of_month=ExtractDay('day')
+            ).values('period', 'month', 'day_of_month').annotate(
+                total=Count('id'),
+                single_item=Count('id', filter=Q(non_pop_count=1)),
+                cross_sell=Count('id', filter=Q(non_pop_count__gte=3))
+            ).order_by()
+            
+            for record in daily_counts:
+                date_stats[record['period']][f"{record['month']}/{record['day_of_month']}"] = {
+                    'total': record['total'],
+                    'single_item': record['single_item'],
+                    'cross_sell': record['cross_sell']
+                }
         else:
-            date_filter = date_filter_previous
-        
-        q = Sales.objects.filter(**date_filter, prodt='selling item').exclude(tanxa=0).exclude(prodg='POP')
-        q = apply_filters(q)
-        
-        # Get all data in one query
-        daily_data = q.annotate(
-            month=ExtractMonth('cd'),
-            day=ExtractDay('cd')
-        ).values('month', 'day', 'zedd').annotate(
-            item_count=Count('idreal1')
-        )
-        
-        # Process in Python (faster than multiple DB queries)
-        date_stats = {}
-        for record in daily_data:
-            date_key = f"{record['month']}/{record['day']}"
-            if date_key not in date_stats:
-                date_stats[date_key] = {'total': 0, 'single_item': 0, 'cross_sell': 0}
+            q = get_period_selling_lines('POP')
+            
+            # Get all data in one query
+            daily_data = q.annotate(
+                month=ExtractMonth('cd'),
+                day=ExtractDay('cd')
+            ).values('period', 'month', 'day', 'zedd').annotate(
+                item_count=Count('idreal1')
+            ).order_by()
             
-            date_stats[date_key]['total'] += 1
-            if record['item_count'] == 1:
-                date_stats[date_key]['single_item'] += 1
-            elif record['item_count'] >= 3:
-                date_stats[date_key]['cross_sell'] += 1
+            # Process in Python (faster than multiple DB queries)
+            for record in daily_data:
+                period_stats = date_stats[record['period']]
+                date_key = f"{record['month']}/{record['day']}"
+                if date_key not in period_stats:
+                    period_stats[date_key] = {'total': 0, 'single_item': 0, 'cross_sell': 0}
+                
+                period_stats[date_key]['total'] += 1
+                if record['item_count'] == 1:
+                    period_stats[date_key]['single_item'] += 1
+                elif record['item_count'] >= 3:
+                    period_stats[date_key]['cross_sell'] += 1
         
         # Convert to percentages
-        result = {}
-        for date_key, stats in date_stats.items():
-            total = stats['total']
-            result[date_key] = {
-                'single_item_pct': (stats['single_item'] / total * 100) if total > 0 else 0,
-                'cross_sell_pct': (stats['cross_sell'] / total * 100) if total > 0 else 0,
-                'total_tickets': total
-            }
+        result = {period: {} for period in PERIODS}
+        for period in PERIODS:
+            for date_key, stats in date_stats[period].items():
+                total = stats['total']
+                result[period][date_key] = {
+                    'single_item_pct': (stats['single_item'] / total * 100) if total > 0 else 0,
+                    'cross_sell_pct': (stats['cross_sell'] / total * 100) if total > 0 else 0,
+                    'total_tickets': total
+                }
         
         return result
     
-    def get_ticket_distribution(is_current=True):
+    def get_ticket_distribution():
         """
-        OPTIMIZED: Get ticket amount distribution
+        OPTIMIZED: Histogram, average and quartiles of ticket amounts, both periods in one query
         """
-        if is_current:
-            date_filter = date_filter_current
+        if use_ticket_summary:
+            ticket_totals = (
+                get_period_ticket_queryset(exclude_warehouses=False)
+                .filter(selling_item_count__gt=0)
+                .values_list('period', 'selling_total')
+            )
+            amount_field = 'selling_total'
         else:
-            date_filter = date_filter_previous
+            ticket_totals = get_period_selling_lines().values('period', 'zedd').annotate(
+                ticket_total=Sum('tanxa')
+            ).values_list('period', 'ticket_total')
+            amount_field = 'ticket_total'
         
-        q = Sales.objects.filter(**date_filter, prodt='selling item').exclude(tanxa=0)
-        q = apply_filters(q)
-        
-        # Single query to get ticket totals
-        ticket_totals = list(q.values('zedd').annotate(
-            ticket_total=Sum('tanxa')
-        ).values_list('ticket_total', flat=True))
-        
-        if not ticket_totals:
-            return {
-                'distribution': {},
-                'distribution_pct': {},
-                'total_tickets': 0,
-                'avg_ticket': 0,
-                'median_ticket': 0,
-                'p25': 0,
-                'p75': 0
-            }
-        
-        # Define ranges
-        ranges = [
-            (0, 50, '0-50'), (50, 100, '50-100'), (100, 150, '100-150'),
-            (150, 200, '150-200'), (200, 300, '200-300'), (300, 500, '300-500'),
-            (500, 1000, '500-1K'), (1000, float('inf'), '1K+')
-        ]
-        
-        distribution = {label: 0 for _, _, label in ranges}
-        total_tickets = len(ticket_totals)
-        
-        # Categorize tickets
-        for amount in ticket_totals:
-            amount = float(amount)
-            for min_val, max_val, label in ranges:
-                if min_val <= amount < max_val:
-                    distribution[label] += 1
-                    break
-        
-        # Calculate percentages
-        distribution_pct = {
-            label: (count / total_tickets * 100) if total_tickets > 0 else 0
-            for label, count in distribution.items()
-        }
-        
-        # Statistics
-        ticket_list = [float(t) for t in ticket_totals]
-        sorted_tickets = sorted(ticket_list)
-        
-        return {
-            'distribution': distribution,
-            'distribution_pct': distribution_pct,
-            'total_tickets': total_tickets,
-            'avg_ticket': sum(ticket_list) / len(ticket_list),
-            'median_ticket': sorted_tickets[len(sorted_tickets) // 2],
-            'p25': sorted_tickets[len(sorted_tickets) // 4],
-            'p75': sorted_tickets[3 * len(sorted_tickets) // 4]
-        }
+        return ticket_distributions(ticket_totals.order_by(), 'period', amount_field, PERIODS)
     
     def get_product_analysis(is_current=True):
         """
@@ -619,26 +563,135 @@ def dashboard(request):
     
     # Rest of your code continues exactly as before...
         
-    # ==================== EXECUTE DATA FETCHING ====================
+    def get_active_locations():
+        return per_period_aggregate(
+            get_period_rollup_queryset(), 'day',
+            locations=Count('un', distinct=True)
+        )
     
-    # Get comprehensive stats for both years (2 queries instead of many)
-    stats_current = get_comprehensive_stats(is_current=True)
-    stats_previous = get_comprehensive_stats(is_current=False)
+    def get_monthly_tickets():
+        """Monthly ticket counts, both periods in one query"""
+        if use_ticket_summary:
+            monthly_ticket_rows = (
+                get_period_ticket_queryset()
+                .annotate(month=ExtractMonth('day'))
+                .values('period', 'month')
+                .annotate(tickets=Count('id'))
+                .order_by('month')
+            )
+        else:
+            monthly_ticket_rows = (
+                get_period_base_queryset()
+                .annotate(month=ExtractMonth('cd'))
+                .values('period', 'month')
+                .annotate(tickets=Count('zedd', distinct=True))
+                .order_by('month')
+            )
+        
+        monthly_tickets = {period: [] for period in PERIODS}
+        for row in monthly_ticket_rows:
+            monthly_tickets[row.pop('period')].append(row)
+        return monthly_tickets
     
-    # Cross-selling stats (2 queries)
-    cross_sell_current = get_cross_selling_stats(is_current=True)
-    cross_sell_previous = get_cross_selling_stats(is_current=False)
+    def get_monthly_revenue():
+        """Current-period revenue per month from the rollup (for the monthly basket)"""
+        return {
+            item['month']: float(item['total_revenue'] or 0)
+            for item in get_rollup_queryset(is_current=True)
+            .annotate(month=ExtractMonth('day'))
+            .values('month')
+            .annotate(total_revenue=Sum('revenue'))
+            .order_by('month')
+        }
     
-    # Daily cross-selling (2 queries)
-    cross_sell_daily_current = get_daily_cross_selling_stats(is_current=True)
-    cross_sell_daily_previous = get_daily_cross_selling_stats(is_current=False)
+    def get_category_comparison():
+        """
+        Top 10 categories of the current period and the previous-period revenue
+        of those same categories. The category chart uses the first 8.
+        """
+        category_data_current_comp = list(
+            get_rollup_queryset(is_current=True)
+            .values('prodg')
+            .annotate(total=Sum('revenue'))
+            .order_by('-total')[:10]
+        )
+        
+        top_categories = [item['prodg'] for item in category_data_current_comp]
+        category_data_previous_comp = list(
+            get_rollup_queryset(is_current=False)
+            .filter(prodg__in=top_categories)
+            .values('prodg')
+            .annotate(total=Sum('revenue'))
+        )
+        
+        cat_previous_dict = {item['prodg']: float(item['total'] or 0) for item in category_data_previous_comp}
+        return category_data_current_comp, cat_previous_dict
     
-    # Ticket distribution (2 queries)
-    dist_current = get_ticket_distribution(is_current=True)
-    dist_previous = get_ticket_distribution(is_current=False)
+    def get_top_campaigns():
+        """
+        Top 10 Campaigns by value - totals from the rollup, distinct tickets
+        from raw rows for just those 10 campaigns
+        """
+        top_10_campaigns = list(
+            get_rollup_queryset(is_current=True)
+            .values('actions')
+            .annotate(
+                total=Sum('revenue'),
+                quantity=Sum('items')
+            )
+            .order_by('-total')[:10]
+        )
+        
+        top_actions = [item['actions'] for item in top_10_campaigns]
+        campaign_filter = Q(actions__in=[a for a in top_actions if a is not None])
+        if None in top_actions:
+            campaign_filter |= Q(actions__isnull=True)
+        campaign_tickets = {
+            item['actions']: item['zedd_unique']
+            for item in get_base_queryset(is_current=True)
+            .filter(campaign_filter)
+            .values('actions')
+            .annotate(zedd_unique=Count('zedd', distinct=True))
+            .order_by()
+        } if top_actions else {}
+        
+        for item in top_10_campaigns:
+            item['zedd_unique'] = campaign_tickets.get(item['actions'], 0)
+            item['avg_basket'] = float(item['total'] or 0) / item['zedd_unique'] if item['zedd_unique'] else None
+        
+        return top_10_campaigns
     
-    # Product analysis (2 queries)
-    product_analysis_current = get_product_analysis(is_current=True)
+    # ==================== EXECUTE DATA FETCHING ====================
+    
+    # Heavy blocks are cached per canonical filter key (shared between
+    # users with the same locations) and invalidated per month by uploads
+    fragment_ranges = [(start_date, end_date), (previous_start, previous_end)]
+    
+    def cached(name, compute):
+        return lambda: cached_fragment(name, sales_filter.key, fragment_ranges, compute)
+    
+    # The helpers are independent of each other, so they run side by side
+    # (each on its own connection, capped by DASHBOARD_QUERY_WORKERS).
+    # Period-aware helpers return {'current', 'previous'}.
+    results = run_parallel({
+        'stats': cached('comprehensive_stats', get_comprehensive_stats),
+        'cross_sell': cached('cross_selling', get_cross_selling_stats),
+        'cross_sell_daily': cached('daily_cross_selling', get_daily_cross_selling_stats),
+        'dist': cached('ticket_distribution', get_ticket_distribution),
+        'product_analysis': cached('product_analysis', lambda: get_product_analysis(is_current=True)),
+        'active_locations': get_active_locations,
+        'monthly_tickets': get_monthly_tickets,
+        'monthly_revenue': get_monthly_revenue,
+        'category_comparison': cached('category_comparison', get_category_comparison),
+        'campaigns': get_top_campaigns,
+        'filter_options': lambda: calculate_filter_options(sales_filter, user_profile),
+    })
+    
+    stats_current, stats_previous = results['stats']['current'], results['stats']['previous']
+    cross_sell_current, cross_sell_previous = results['cross_sell']['current'], results['cross_sell']['previous']
+    cross_sell_daily_current, cross_sell_daily_previous = results['cross_sell_daily']['current'], results['cross_sell_daily']['previous']
+    dist_current, dist_previous = results['dist']['current'], results['dist']['previous']
+    product_analysis_current = results['product_analysis']
     
     # ==================== PREPARE CHART DATA ====================
     
@@ -727,7 +780,7 @@ def dashboard(request):
     dist_median_change = calc_change(dist_current['median_ticket'], dist_previous['median_ticket'])
     
     # Distribution data for charts
-    distribution_labels = ['0-50', '50-100', '100-150', '150-200', '200-300', '300-500', '500-1K', '1K+']
+    distribution_labels = [label for _, _, label in TICKET_RANGES]
     distribution_counts_current = [dist_current['distribution'].get(label, 0) for label in distribution_labels]
     distribution_counts_previous = [dist_previous['distribution'].get(label, 0) for label in distribution_labels]
     distribution_pct_current = [dist_current['distribution_pct'].get(label, 0) for label in distribution_labels]
@@ -739,28 +792,15 @@ def dashboard(request):
     conversion_change = calc_change(conversion_rate_current, conversion_rate_previous)
     
     # Active locations
-    active_locations_current = get_base_queryset(is_current=True).values('un').distinct().count()
-    active_locations_previous = get_base_queryset(is_current=False).values('un').distinct().count()
+    active_locations_current = results['active_locations']['current']['locations']
+    active_locations_previous = results['active_locations']['previous']['locations']
     locations_change = calc_change(active_locations_current, active_locations_previous)
     
     # ==================== ADDITIONAL DATA (OPTIMIZED) ====================
     
-    # Monthly tickets (2 queries)
-    monthly_tickets_current = list(
-        get_base_queryset(is_current=True)
-        .annotate(month=ExtractMonth('cd'))
-        .values('month')
-        .annotate(tickets=Count('zedd', distinct=True))
-        .order_by('month')
-    )
-    
-    monthly_tickets_previous = list(
-        get_base_queryset(is_current=False)
-        .annotate(month=ExtractMonth('cd'))
-        .values('month')
-        .annotate(tickets=Count('zedd', distinct=True))
-        .order_by('month')
-    )
+    # Monthly tickets
+    monthly_tickets_current = results['monthly_tickets']['current']
+    monthly_tickets_previous = results['monthly_tickets']['previous']
     
     month_labels = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
     tickets_data_current = [0] * 12
@@ -772,55 +812,21 @@ def dashboard(request):
     for item in monthly_tickets_previous:
         tickets_data_previous[item['month'] - 1] = item['tickets']
     
-    # Monthly basket
-    monthly_basket_current = list(
-        get_base_queryset(is_current=True)
-        .annotate(month=ExtractMonth('cd'))
-        .values('month')
-        .annotate(
-            total_revenue=Sum('tanxa'),
-            total_tickets=Count('zedd', distinct=True)
-        )
-        .order_by('month')
-    )
+    # Monthly basket - revenue from the rollup, tickets reused from above
+    monthly_revenue_current = results['monthly_revenue']
     
     basket_data_current = [0] * 12
-    for item in monthly_basket_current:
-        if item['total_tickets'] and item['total_tickets'] > 0:
-            basket_data_current[item['month'] - 1] = float(item['total_revenue'] or 0) / item['total_tickets']
-    
-    # Category data (1 query)
-    category_data = list(
-        get_base_queryset(is_current=True)
-        .values('prodg')
-        .annotate(total=Sum('tanxa'))
-        .order_by('-total')[:8]
-    )
+    for item in monthly_tickets_current:
+        if item['tickets'] and item['tickets'] > 0:
+            basket_data_current[item['month'] - 1] = monthly_revenue_current.get(item['month'], 0) / item['tickets']
+    
+    # Category data and comparison
+    category_data_current_comp, cat_previous_dict = results['category_comparison']
+    category_data = category_data_current_comp[:8]
     
     category_labels = [item['prodg'] or 'Unknown' for item in category_data]
     category_values = [float(item['total'] or 0) for item in category_data]
     
-    # Category comparison (2 queries)
-    category_query_current_comp = get_base_queryset(is_current=True)
-    category_query_previous_comp = get_base_queryset(is_current=False)
-    
-    category_data_current_comp = list(
-        category_query_current_comp
-        .values('prodg')
-        .annotate(total=Sum('tanxa'))
-        .order_by('-total')[:10]
-    )
-    
-    top_categories = [item['prodg'] for item in category_data_current_comp]
-    category_data_previous_comp = list(
-        category_query_previous_comp
-        .filter(prodg__in=top_categories)
-        .values('prodg')
-        .annotate(total=Sum('tanxa'))
-    )
-    
-    cat_previous_dict = {item['prodg']: float(item['total'] or 0) for item in category_data_previous_comp}
-    
     category_comparison = []
     for item in category_data_current_comp:
         cat_name = item['prodg'] or 'Unknown'
@@ -838,21 +844,8 @@ def dashboard(request):
             'pct_change': pct_change
         })
     
-    # Top 10 Campaigns by value (1 query)
-    top_10_campaigns = list(
-        get_base_queryset(is_current=True)
-        .values('actions')
-        .annotate(
-            total=Sum('tanxa'),
-            quantity=Count('idreal1'),
-            zedd_unique=Count('zedd', distinct=True),
-            avg_basket=ExpressionWrapper(
-                Sum('tanxa') / Count('zedd', distinct=True),
-                output_field=FloatField()
-            )
-        )
-        .order_by('-total')[:10]
-    )
+    # Top 10 Campaigns by value
+    top_10_campaigns = results['campaigns']
 
     # ==================== FORMATTING HELPERS ====================
     
@@ -875,10 +868,7 @@ def dashboard(request):
     # ==================== GET FILTER OPTIONS (LIVE UPDATING) ====================
 
     # ==================== GET FILTER OPTIONS ====================
-    filter_options = calculate_filter_options(
-        current_year, selected_locations, selected_category, 
-        selected_product, selected_campaign, user_profile
-    )
+    filter_options = results['filter_options']
 
     all_locations = filter_options['locations']
     all_categories = filter_options['categories']
@@ -889,7 +879,7 @@ def dashboard(request):
     # ==================== BUILD CONTEXT ====================
     
     context = {
-        'comparison_mode': comparison_mode,
+        'comparison_mode': sales_filter.comparison,
         'current_year': current_year,
         'previous_year': previous_year,
         'max_date': max_date,
@@ -956,10 +946,10 @@ def dashboard(request):
         'all_locations': all_locations,
         'all_categories': all_categories,
         'all_campaigns': all_campaigns,
-        'selected_un': selected_un,
-        'selected_locations': selected_locations,
-        'selected_category': selected_category,
-        'selected_product': selected_product,
+        'selected_un': sales_filter.location_label(user_profile.is_admin),
+        'selected_locations': list(sales_filter.locations),
+        'selected_category': sales_filter.category,
+        'selected_product': sales_filter.product,
         'products': all_products,
         # 'high_zedd': top_10_zedd,
         
@@ -1042,52 +1032,19 @@ def plan_workflow(request):
     _, last_day_py = calendar.monthrange(prev_year, end_month)
     end_date_py = date(prev_year, end_month, last_day_py)
     
-    # Read Excel file
-    path = os.path.join(settings.BASE_DIR, 'sales_app', 'data', 'Full Plan workflow.xlsx')
+    # Active uploaded plan version, or the plan workbook until the first upload (see sales_app/plans.py)
+    path = plan_workbook_path()
     
     try:
-        df = pd.read_excel(path, engine='openpyxl', sheet_name='Main')
-        
-        print("Excel Columns:", df.columns.tolist())
-        print("Sample data:")
-        print(df[['location', 'geo', 'Year', 'Month', 'Plan_turnover', 'Plan_tickets', 'Plan_basket']].head(5))
-        print(f"\nYear range in Excel: {df['Year'].min()} - {df['Year'].max()}")
-        print(f"Month range in Excel: {df['Month'].min()} - {df['Month'].max()}")
-        
-        # Convert Year and Month columns to integers
-        df['Year'] = df['Year'].astype(int)
-        df['Month'] = df['Month'].astype(int)
-        
-        # Create datetime for each month
-        df['plan_date'] = pd.to_datetime(df[['Year', 'Month']].assign(day=1))
-        
-        # ===== PROCESS CURRENT YEAR DATA =====
-        df_current = df.copy()
-        start_month_date = pd.Timestamp(start_date.replace(day=1))
-        end_month_date = pd.Timestamp(end_date.replace(day=1))
-        df_current = df_current[(df_current['plan_date'] >= start_month_date) & (df_current['plan_date'] <= end_month_date)]
-        
-        if selected_geo != 'all':
-            df_current = df_current[df_current['geo'] == selected_geo]
-        
-        print(f"\nFiltered current year to {len(df_current)} plan records between {start_month_date.strftime('%Y-%m')} and {end_month_date.strftime('%Y-%m')}")
-        
-        # ===== PROCESS PREVIOUS YEAR DATA =====
-        df_prev = df.copy()
-        start_month_date_py = pd.Timestamp(start_date_py.replace(day=1))
-        end_month_date_py = pd.Timestamp(end_date_py.replace(day=1))
-        df_prev = df_prev[(df_prev['plan_date'] >= start_month_date_py) & (df_prev['plan_date'] <= end_month_date_py)]
-        
-        if selected_geo != 'all':
-            df_prev = df_prev[df_prev['geo'] == selected_geo]
-        
-        print(f"Filtered previous year to {len(df_prev)} plan records between {start_month_date_py.strftime('%Y-%m')} and {end_month_date_py.strftime('%Y-%m')}")
+        # ===== CURRENT / PREVIOUS YEAR PLAN ROWS =====
+        df_current = plan_slice(start_date, end_date, selected_geo, path)
+        df_prev = plan_slice(start_date_py, end_date_py, selected_geo, path)
         
         # ===== GET ACTUAL SALES DATA - CURRENT YEAR =====
         actual_query = Sales.objects.filter(
             cd__gte=start_date,
             cd__lte=end_date
-        ).exclude(un__in=["მთავარი საწყობი 2", "სატესტო"])
+        ).exclude(un__in=EXCLUDED_LOCATIONS)
         
         if selected_geo != 'all':
             actual_query = actual_query.filter(un=selected_geo)
@@ -1097,13 +1054,13 @@ def plan_workflow(request):
             tickets=Count('zedd', distinct=True)
         ).order_by('cd'))
         
-        print(f"\nRetrieved {len(daily_actual)} daily actual records from DB (current year)")
+        logger.debug("Retrieved %d daily actual records (current year)", len(daily_actual))
         
         # ===== GET ACTUAL SALES DATA - PREVIOUS YEAR =====
         actual_query_py = Sales.objects.filter(
             cd__gte=start_date_py,
             cd__lte=end_date_py
-        ).exclude(un__in=["მთავარი საწყობი 2", "სატესტო"])
+        ).exclude(un__in=EXCLUDED_LOCATIONS)
         
         if selected_geo != 'all':
             actual_query_py = actual_query_py.filter(un=selected_geo)
@@ -1113,229 +1070,19 @@ def plan_workflow(request):
             tickets=Count('zedd', distinct=True)
         ).order_by('cd'))
         
-        print(f"Retrieved {len(daily_actual_py)} daily actual records from DB (previous year)")
+        logger.debug("Retrieved %d daily actual records (previous year)", len(daily_actual_py))
         
-        # ===== EXPAND PLANS TO DAILY - CURRENT YEAR =====
-        def expand_to_daily(df_source, target_start, target_end):
-            """Expand monthly plan data to daily records"""
-            daily_records = []
-            
-            for _, row in df_source.iterrows():
-                geo = row['geo']
-                year_row = int(row['Year'])
-                month_row = int(row['Month'])
-                monthly_plan = float(row['Plan_turnover'])
-                monthly_tickets = float(row['Plan_tickets'])
-                avg_basket = float(row['Plan_basket'])  # This stays constant
-                
-                days_in_month = calendar.monthrange(year_row, month_row)[1]
-                daily_plan_value = monthly_plan / days_in_month
-                daily_tickets_value = monthly_tickets / days_in_month
-                
-                for day in range(1, days_in_month + 1):
-                    current_date = date(year_row, month_row, day)
-                    
-                    if target_start <= current_date <= target_end:
-                        daily_records.append({
-                            'geo': geo,
-                            'date': current_date,
-                            'daily_plan': daily_plan_value,
-                            'daily_tickets': daily_tickets_value,
-                            'avg_basket': avg_basket,
-                            'year': year_row,
-                            'month': month_row,
-                            'day': day
-                        })
-            
-            return daily_records
-        
-        plan_daily_records = expand_to_daily(df_current, start_date, end_date)
-        plan_daily_records_py = expand_to_daily(df_prev, start_date_py, end_date_py)
-        
-        print(f"\nExpanded to {len(plan_daily_records)} daily plan records (current year)")
-        print(f"Expanded to {len(plan_daily_records_py)} daily plan records (previous year)")
-        
-        # ===== AGGREGATION HELPER FUNCTION =====
-        def aggregate_data(plan_records, actual_records, agg_type, date_range_start, date_range_end):
-            """Aggregate plan and actual data based on aggregation type"""
-            labels = []
-            plan_values = []
-            plan_85_values = []
-            actual_values = []
-            tickets_plan_values = []
-            tickets_actual_values = []
-            basket_plan_values = []
-            basket_actual_values = []
-            
-            if agg_type == 'monthly':
-                month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                              'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-                
-                # Aggregate plan data by month
-                plan_monthly = {}
-                tickets_monthly = {}
-                basket_monthly = {}
-                basket_count = {}
-                
-                for record in plan_records:
-                    month_key = f"{record['year']}-{record['month']:02d}"
-                    plan_monthly[month_key] = plan_monthly.get(month_key, 0) + record['daily_plan']
-                    tickets_monthly[month_key] = tickets_monthly.get(month_key, 0) + record['daily_tickets']
-                    basket_monthly[month_key] = basket_monthly.get(month_key, 0) + record['avg_basket']
-                    basket_count[month_key] = basket_count.get(month_key, 0) + 1
-                
-                # Aggregate actual data by month
-                actual_monthly = {}
-                tickets_actual_monthly = {}
-                
-                for record in actual_records:
-                    month_key = f"{record['cd'].year}-{record['cd'].month:02d}"
-                    actual_monthly[month_key] = actual_monthly.get(month_key, 0) + float(record['actual_turnover'] or 0)
-                    tickets_actual_monthly[month_key] = tickets_actual_monthly.get(month_key, 0) + int(record['tickets'] or 0)
-                
-                # Generate labels for all months in range
-                current = date_range_start.replace(day=1)
-                while current <= date_range_end:
-                    month_key = f"{current.year}-{current.month:02d}"
-                    labels.append(f"{month_names[current.month-1]} '{str(current.year)[-2:]}")
-                    
-                    plan_val = plan_monthly.get(month_key, 0)
-                    plan_values.append(plan_val)
-                    plan_85_values.append(plan_val * 0.85)
-                    actual_values.append(actual_monthly.get(month_key, 0))
-                    tickets_plan_values.append(tickets_monthly.get(month_key, 0))
-                    tickets_actual_values.append(tickets_actual_monthly.get(month_key, 0))
-                    
-                    # Average basket for the month
-                    if basket_count.get(month_key, 0) > 0:
-                        basket_plan_values.append(basket_monthly.get(month_key, 0) / basket_count[month_key])
-                    else:
-                        basket_plan_values.append(0)
-                    
-                    actual_rev = actual_monthly.get(month_key, 0)
-                    actual_tick = tickets_actual_monthly.get(month_key, 0)
-                    basket_actual_values.append(actual_rev / actual_tick if actual_tick > 0 else 0)
-                    
-                    if current.month == 12:
-                        current = current.replace(year=current.year + 1, month=1)
-                    else:
-                        current = current.replace(month=current.month + 1)
-            
-            elif agg_type == 'weekly':
-                # Aggregate by ISO week
-                plan_weekly = {}
-                tickets_weekly = {}
-                basket_weekly = {}
-                basket_count = {}
-                
-                for record in plan_records:
-                    iso_cal = record['date'].isocalendar()
-                    week_key = f"{iso_cal[0]}-W{iso_cal[1]:02d}"
-                    plan_weekly[week_key] = plan_weekly.get(week_key, 0) + record['daily_plan']
-                    tickets_weekly[week_key] = tickets_weekly.get(week_key, 0) + record['daily_tickets']
-                    basket_weekly[week_key] = basket_weekly.get(week_key, 0) + record['avg_basket']
-                    basket_count[week_key] = basket_count.get(week_key, 0) + 1
-                
-                actual_weekly = {}
-                tickets_actual_weekly = {}
-                
-                for record in actual_records:
-                    iso_cal = record['cd'].isocalendar()
-                    week_key = f"{iso_cal[0]}-W{iso_cal[1]:02d}"
-                    actual_weekly[week_key] = actual_weekly.get(week_key, 0) + float(record['actual_turnover'] or 0)
-                    tickets_actual_weekly[week_key] = tickets_actual_weekly.get(week_key, 0) + int(record['tickets'] or 0)
-                
-                # Generate all weeks in range
-                current = date_range_start
-                seen_weeks = set()
-                while current <= date_range_end:
-                    iso_cal = current.isocalendar()
-                    week_key = f"{iso_cal[0]}-W{iso_cal[1]:02d}"
-                    
-                    if week_key not in seen_weeks:
-                        seen_weeks.add(week_key)
-                        labels.append(f"W{iso_cal[1]} '{str(iso_cal[0])[-2:]}")
-                        
-                        plan_val = plan_weekly.get(week_key, 0)
-                        plan_values.append(plan_val)
-                        plan_85_values.append(plan_val * 0.85)
-                        actual_values.append(actual_weekly.get(week_key, 0))
-                        tickets_plan_values.append(tickets_weekly.get(week_key, 0))
-                        tickets_actual_values.append(tickets_actual_weekly.get(week_key, 0))
-                        
-                        if basket_count.get(week_key, 0) > 0:
-                            basket_plan_values.append(basket_weekly.get(week_key, 0) / basket_count[week_key])
-                        else:
-                            basket_plan_values.append(0)
-                        
-                        actual_rev = actual_weekly.get(week_key, 0)
-                        actual_tick = tickets_actual_weekly.get(week_key, 0)
-                        basket_actual_values.append(actual_rev / actual_tick if actual_tick > 0 else 0)
-                    
-                    current += timedelta(days=1)
-            
-            else:  # Daily aggregation (default)
-                # Create maps by date
-                plan_map = {}
-                tickets_map = {}
-                basket_map = {}
-                basket_count = {}
-                
-                for record in plan_records:
-                    date_key = record['date'].strftime('%Y-%m-%d')
-                    plan_map[date_key] = plan_map.get(date_key, 0) + record['daily_plan']
-                    tickets_map[date_key] = tickets_map.get(date_key, 0) + record['daily_tickets']
-                    basket_map[date_key] = basket_map.get(date_key, 0) + record['avg_basket']
-                    basket_count[date_key] = basket_count.get(date_key, 0) + 1
-                
-                actual_map = {}
-                tickets_actual_map = {}
-                
-                for record in actual_records:
-                    date_key = record['cd'].strftime('%Y-%m-%d')
-                    actual_map[date_key] = actual_map.get(date_key, 0) + float(record['actual_turnover'] or 0)
-                    tickets_actual_map[date_key] = tickets_actual_map.get(date_key, 0) + int(record['tickets'] or 0)
-                
-                # Generate all dates in range
-                current = date_range_start
-                while current <= date_range_end:
-                    date_key = current.strftime('%Y-%m-%d')
-                    labels.append(current.strftime('%b %d'))
-                    
-                    plan_val = plan_map.get(date_key, 0)
-                    plan_values.append(plan_val)
-                    plan_85_values.append(plan_val * 0.85)
-                    actual_values.append(actual_map.get(date_key, 0))
-                    tickets_plan_values.append(tickets_map.get(date_key, 0))
-                    tickets_actual_values.append(tickets_actual_map.get(date_key, 0))
-                    
-                    if basket_count.get(date_key, 0) > 0:
-                        basket_plan_values.append(basket_map.get(date_key, 0) / basket_count[date_key])
-                    else:
-                        basket_plan_values.append(0)
-                    
-                    actual_rev = actual_map.get(date_key, 0)
-                    actual_tick = tickets_actual_map.get(date_key, 0)
-                    basket_actual_values.append(actual_rev / actual_tick if actual_tick > 0 else 0)
-                    
-                    current += timedelta(days=1)
-            
-            return {
-                'labels': labels,
-                'plan_values': plan_values,
-                'plan_85_values': plan_85_values,
-                'actual_values': actual_values,
-                'tickets_plan_values': tickets_plan_values,
-                'tickets_actual_values': tickets_actual_values,
-                'basket_plan_values': basket_plan_values,
-                'basket_actual_values': basket_actual_values
-            }
+        # ===== EXPAND PLANS TO DAILY =====
+        plan_daily = expand_plan_daily(df_current, start_date, end_date)
+        plan_daily_py = expand_plan_daily(df_prev, start_date_py, end_date_py)
+        
+        logger.debug("Expanded to %d daily plan records (current year), %d (previous year)", len(plan_daily), len(plan_daily_py))
         
         # Aggregate current year data
-        current_data = aggregate_data(plan_daily_records, daily_actual, aggregation, start_date, end_date)
+        current_data = aggregate_plan_actual(plan_daily, daily_actual, start_date, end_date, aggregation)
 
         # Aggregate previous year data
-        prev_data = aggregate_data(plan_daily_records_py, daily_actual_py, aggregation, start_date_py, end_date_py)
+        prev_data = aggregate_plan_actual(plan_daily_py, daily_actual_py, start_date_py, end_date_py, aggregation)
 
         # ===== CALCULATE KPIs - REVENUE =====
         total_plan = sum(current_data['plan_values'])
@@ -1362,32 +1109,43 @@ def plan_workflow(request):
         basket_variance = avg_basket_actual - avg_basket_plan
         basket_variance_pct = ((basket_variance / avg_basket_plan) * 100) if avg_basket_plan > 0 else 0
         
-        # ===== LOCATION PERFORMANCE TABLE - REVENUE =====
+        # ===== LOCATION PERFORMANCE TABLES =====
         location_performance = []
+        tickets_location_performance = []
+        basket_location_performance = []
         
         if selected_geo == 'all':
             unique_geos = df_current['geo'].unique()
             
+            # Plan totals from one pass over the daily rows, actuals from one query per year
+            plan_by_geo = plan_totals_by_geo(plan_daily)
+            plan_by_geo_py = plan_totals_by_geo(plan_daily_py)
+            
+            def actual_totals(query):
+                return {
+                    row['un']: row
+                    for row in query.values('un').annotate(
+                        total_rev=Sum('tanxa'),
+                        total_tickets=Count('zedd', distinct=True)
+                    ).order_by()
+                }
+            
+            actual_by_geo = actual_totals(actual_query)
+            actual_by_geo_py = actual_totals(actual_query_py)
+            no_plan = {'plan': 0, 'tickets': 0, 'basket': 0}
+            no_actual = {'total_rev': None, 'total_tickets': 0}
+            
             for geo in unique_geos:
-                # Current Year
-                loc_plan_records = [p for p in plan_daily_records if p['geo'] == geo]
-                loc_plan = sum([p['daily_plan'] for p in loc_plan_records])
-                
-                loc_actual_data = actual_query.filter(un=geo).aggregate(total=Sum('tanxa'))
-                loc_actual = float(loc_actual_data['total'] or 0)
-                
-                # Previous Year
-                loc_plan_records_py = [p for p in plan_daily_records_py if p['geo'] == geo]
-                loc_plan_py = sum([p['daily_plan'] for p in loc_plan_records_py])
-                
-                loc_actual_data_py = actual_query_py.filter(un=geo).aggregate(total=Sum('tanxa'))
-                loc_actual_py = float(loc_actual_data_py['total'] or 0)
+                plan_row = plan_by_geo.loc[geo] if geo in plan_by_geo.index else no_plan
+                plan_row_py = plan_by_geo_py.loc[geo] if geo in plan_by_geo_py.index else no_plan
+                loc_data = actual_by_geo.get(geo, no_actual)
+                loc_data_py = actual_by_geo_py.get(geo, no_actual)
                 
-                # Metrics
-                loc_variance = loc_actual - loc_plan
-                loc_achievement = (loc_actual / loc_plan * 100) if loc_plan > 0 else 0
-                yoy_growth = ((loc_actual - loc_actual_py) / loc_actual_py * 100) if loc_actual_py > 0 else 0
-                yoy_growth_plan = ((loc_plan - loc_plan_py) / loc_plan_py * 100) if loc_plan_py > 0 else 0
+                # Revenue
+                loc_plan = float(plan_row['plan'])
+                loc_plan_py = float(plan_row_py['plan'])
+                loc_actual = float(loc_data['total_rev'] or 0)
+                loc_actual_py = float(loc_data_py['total_rev'] or 0)
                 
                 location_performance.append({
                     'geo': geo,
@@ -1395,37 +1153,17 @@ def plan_workflow(request):
                     'actual': loc_actual,
                     'plan_py': loc_plan_py,
                     'actual_py': loc_actual_py,
-                    'variance': loc_variance,
-                    'achievement': loc_achievement,
-                    'yoy_growth': yoy_growth,
-                    'yoy_growth_plan':yoy_growth_plan
+                    'variance': loc_actual - loc_plan,
+                    'achievement': (loc_actual / loc_plan * 100) if loc_plan > 0 else 0,
+                    'yoy_growth': ((loc_actual - loc_actual_py) / loc_actual_py * 100) if loc_actual_py > 0 else 0,
+                    'yoy_growth_plan': ((loc_plan - loc_plan_py) / loc_plan_py * 100) if loc_plan_py > 0 else 0
                 })
-            
-            location_performance.sort(key=lambda x: x['achievement'], reverse=True)
-        
-        # ===== LOCATION PERFORMANCE TABLE - TICKETS =====
-        tickets_location_performance = []
-        
-        if selected_geo == 'all':
-            for geo in unique_geos:
-                # Current Year
-                loc_tickets_records = [p for p in plan_daily_records if p['geo'] == geo]
-                loc_tickets_plan = sum([p['daily_tickets'] for p in loc_tickets_records])
-                
-                loc_tickets_data = actual_query.filter(un=geo).aggregate(total=Count('zedd', distinct=True))
-                loc_tickets_actual = int(loc_tickets_data['total'] or 0)
                 
-                # Previous Year
-                loc_tickets_records_py = [p for p in plan_daily_records_py if p['geo'] == geo]
-                loc_tickets_plan_py = sum([p['daily_tickets'] for p in loc_tickets_records_py])
-                
-                loc_tickets_data_py = actual_query_py.filter(un=geo).aggregate(total=Count('zedd', distinct=True))
-                loc_tickets_actual_py = int(loc_tickets_data_py['total'] or 0)
-                
-                # Metrics
-                loc_variance = loc_tickets_actual - loc_tickets_plan
-                loc_achievement = (loc_tickets_actual / loc_tickets_plan * 100) if loc_tickets_plan > 0 else 0
-                yoy_growth = ((loc_tickets_actual - loc_tickets_actual_py) / loc_tickets_actual_py * 100) if loc_tickets_actual_py > 0 else 0
+                # Tickets
+                loc_tickets_plan = float(plan_row['tickets'])
+                loc_tickets_plan_py = float(plan_row_py['tickets'])
+                loc_tickets_actual = int(loc_data['total_tickets'] or 0)
+                loc_tickets_actual_py = int(loc_data_py['total_tickets'] or 0)
                 
                 tickets_location_performance.append({
                     'geo': geo,
@@ -1433,42 +1171,16 @@ def plan_workflow(request):
                     'actual': loc_tickets_actual,
                     'plan_py': loc_tickets_plan_py,
                     'actual_py': loc_tickets_actual_py,
-                    'variance': loc_variance,
-                    'achievement': loc_achievement,
-                    'yoy_growth': yoy_growth
+                    'variance': loc_tickets_actual - loc_tickets_plan,
+                    'achievement': (loc_tickets_actual / loc_tickets_plan * 100) if loc_tickets_plan > 0 else 0,
+                    'yoy_growth': ((loc_tickets_actual - loc_tickets_actual_py) / loc_tickets_actual_py * 100) if loc_tickets_actual_py > 0 else 0
                 })
-            
-            tickets_location_performance.sort(key=lambda x: x['achievement'], reverse=True)
-        
-        # ===== LOCATION PERFORMANCE TABLE - BASKET =====
-        basket_location_performance = []
-        
-        if selected_geo == 'all':
-            for geo in unique_geos:
-                # Current Year
-                loc_basket_records = [p for p in plan_daily_records if p['geo'] == geo]
-                loc_basket_plan = sum([p['avg_basket'] for p in loc_basket_records]) / len(loc_basket_records) if len(loc_basket_records) > 0 else 0
-                
-                loc_data = actual_query.filter(un=geo).aggregate(
-                    total_rev=Sum('tanxa'),
-                    total_tickets=Count('zedd', distinct=True)
-                )
-                loc_basket_actual = (float(loc_data['total_rev'] or 0) / int(loc_data['total_tickets'] or 1)) if loc_data['total_tickets'] else 0
                 
-                # Previous Year
-                loc_basket_records_py = [p for p in plan_daily_records_py if p['geo'] == geo]
-                loc_basket_plan_py = sum([p['avg_basket'] for p in loc_basket_records_py]) / len(loc_basket_records_py) if len(loc_basket_records_py) > 0 else 0
-                
-                loc_data_py = actual_query_py.filter(un=geo).aggregate(
-                    total_rev=Sum('tanxa'),
-                    total_tickets=Count('zedd', distinct=True)
-                )
-                loc_basket_actual_py = (float(loc_data_py['total_rev'] or 0) / int(loc_data_py['total_tickets'] or 1)) if loc_data_py['total_tickets'] else 0
-                
-                # Metrics
-                loc_variance = loc_basket_actual - loc_basket_plan
-                loc_achievement = (loc_basket_actual / loc_basket_plan * 100) if loc_basket_plan > 0 else 0
-                yoy_change = loc_basket_actual - loc_basket_actual_py
+                # Basket
+                loc_basket_plan = float(plan_row['basket'])
+                loc_basket_plan_py = float(plan_row_py['basket'])
+                loc_basket_actual = (loc_actual / loc_tickets_actual) if loc_tickets_actual else 0
+                loc_basket_actual_py = (loc_actual_py / loc_tickets_actual_py) if loc_tickets_actual_py else 0
                 
                 basket_location_performance.append({
                     'geo': geo,
@@ -1476,11 +1188,13 @@ def plan_workflow(request):
                     'actual': loc_basket_actual,
                     'plan_py': loc_basket_plan_py,
                     'actual_py': loc_basket_actual_py,
-                    'variance': loc_variance,
-                    'achievement': loc_achievement,
-                    'yoy_change': yoy_change
+                    'variance': loc_basket_actual - loc_basket_plan,
+                    'achievement': (loc_basket_actual / loc_basket_plan * 100) if loc_basket_plan > 0 else 0,
+                    'yoy_change': loc_basket_actual - loc_basket_actual_py
                 })
             
+            location_performance.sort(key=lambda x: x['achievement'], reverse=True)
+            tickets_location_performance.sort(key=lambda x: x['achievement'], reverse=True)
             basket_location_performance.sort(key=lambda x: x['achievement'], reverse=True)
         
         # ===== GET LOCATIONS FOR DROPDOWN =====
@@ -1538,7 +1252,7 @@ def plan_workflow(request):
         total_plan = total_plan_85 = total_actual = plan_achievement = variance = variance_pct = variance_85 = variance_pct_85 = 0
         total_tickets_plan = total_tickets_actual = tickets_achievement = tickets_variance = tickets_variance_pct = 0
         avg_basket_plan = avg_basket_actual = basket_achievement = basket_variance = basket_variance_pct = 0
-        file_status = f"✗ Excel file not found at: {path}"
+        file_status = f"✗ No plan uploaded and Excel file not found at: {path}"
         
     except Exception as e:
         # Initialize empty data
@@ -1659,397 +1373,68 @@ def export_location_csv(request):
     except:
         return HttpResponseForbidden("Access denied. Contact administrator.")
     
-    allowed_locations_user = user_profile.get_allowed_locations()
-    
-    comparison_mode = request.GET.get('comparison', '2025-2024')
-    if comparison_mode == '2026-2025':
-        current_year = 2026
-        previous_year = 2025
-    elif comparison_mode == '2026-2024':
-        current_year = 2026
-        previous_year = 2024
-    else:
-        current_year = 2025
-        previous_year = 2024
-    
-    # Date filters
-    start_date_str = request.GET.get('start_date', f'{current_year}-01-01')
-    end_date_str = request.GET.get('end_date', f'{current_year}-12-31')
-    
-    try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-    except:
-        start_date = date(current_year, 1, 1)
-    
-    try:
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-    except:
-        end_date = date(current_year, 12, 31)
-    
-    # Location filter - handle multiple selections with SECURITY CHECK
-    selected_locations = request.GET.getlist('un_filter')
-    
-    if not user_profile.is_admin:
-        if not selected_locations or 'all' in selected_locations:
-            # Non-admin can't export all - restrict to their locations
-            selected_locations = allowed_locations_user
-        else:
-            # Filter out unauthorized locations
-            unauthorized = set(selected_locations) - set(allowed_locations_user)
-            if unauthorized:
-                messages.warning(request, f"Export access denied to: {', '.join(unauthorized)}")
-                selected_locations = [loc for loc in selected_locations if loc in allowed_locations_user]
-            
-            if not selected_locations:
-                selected_locations = allowed_locations_user
+    # Years, dates, location security check and line filters
+    sales_filter = SalesFilter.from_request(
+        request, user_profile, default_comparison='2025-2024',
+        denied_message='Export access denied to'
+    )
     
-    if not selected_locations and not user_profile.is_admin:
+    if not sales_filter.locations and not user_profile.is_admin:
         return HttpResponseForbidden("You don't have access to export any locations.")
     
-    # If admin selected 'all', reset to empty list
-    if user_profile.is_admin and (not selected_locations or 'all' in request.GET.getlist('un_filter')):
-        selected_locations = []
-    
-    selected_category = request.GET.get('category', 'all')
-    selected_product = request.GET.get('prod_filter', 'all')
-    selected_campaign = request.GET.get('campaign_filter', 'all')
-    
-    def get_location_data(year, start_dt, end_dt):
-        """Helper function to get data for a specific year"""
-        # Create timezone-aware datetimes
-        start_datetime = timezone.make_aware(datetime.combine(start_dt, datetime.min.time()))
-        end_datetime = timezone.make_aware(datetime.combine(end_dt, datetime.max.time()))
-        
-        # Build the base query
-        query = Sales.objects.filter(
-            prodt='selling item',
-            cd__year=year,
-            cd__gte=start_datetime,
-            cd__lte=end_datetime
-        ).exclude(un__in=["მთავარი საწყობი 2", "სატესტო"]).exclude(tanxa=0)
-        
-        # Debug: Print what filters are being applied
-        print(f"Year: {year}")
-        print(f"Locations filter: {selected_locations}")
-        print(f"Category filter: {selected_category}")
-        print(f"Product filter: {selected_product}")
-        print(f"Campaign filter: {selected_campaign}")
-        
-        # Apply filters one by one
-        if selected_locations and len(selected_locations) > 0:
-            print(f"Applying location filter: {selected_locations}")
-            query = query.filter(un__in=selected_locations)
-        
-        if selected_category and selected_category != 'all':
-            print(f"Applying category filter: {selected_category}")
-            query = query.filter(prodg=selected_category)
-        
-        if selected_product and selected_product != 'all':
-            print(f"Applying product filter: {selected_product}")
-            query = query.filter(prod=selected_product)
-        
-        if selected_campaign and selected_campaign != 'all':
-            print(f"Applying campaign filter: {selected_campaign}")
-            query = query.filter(actions=selected_campaign)
-        
-        # Debug: Print query count
-        print(f"Query count after filters: {query.count()}")
-        
-        # Create filtered subquery for cross-selling calculations with same filters
-        filtered_tickets = Sales.objects.filter(
-            prodt='selling item',
-            cd__year=year,
-            cd__gte=start_datetime,
-            cd__lte=end_datetime
-        ).exclude(un__in=["მთავარი საწყობი 2", "სატესტო"]).exclude(tanxa=0).exclude(prodg='POP')
-        
-        if selected_locations and len(selected_locations) > 0:
-            filtered_tickets = filtered_tickets.filter(un__in=selected_locations)
-        
-        if selected_category and selected_category != 'all':
-            filtered_tickets = filtered_tickets.filter(prodg=selected_category)
-        
-        if selected_product and selected_product != 'all':
-            filtered_tickets = filtered_tickets.filter(prod=selected_product)
-        
-        if selected_campaign and selected_campaign != 'all':
-            filtered_tickets = filtered_tickets.filter(actions=selected_campaign)
-        
-        # Get location aggregations
-        location_data = query.values('un').annotate(
-            total=Sum('tanxa'),
-            tickets=Count('zedd', distinct=True),
-            quantity=Count('idreal1'),
-            three_plus=Count(
-                'zedd',
-                distinct=True,
-                filter=Q(
-                    zedd__in=filtered_tickets
-                        .values('zedd')
-                        .annotate(c=Count('idreal1'))
-                        .filter(c__gte=3)
-                        .values('zedd')
-                )
-            ),
-            one_count=Count(
-                'zedd',
-                distinct=True,
-                filter=Q(
-                    zedd__in=filtered_tickets
-                        .values('zedd')
-                        .annotate(c=Count('idreal1'))
-                        .filter(c=1)
-                        .values('zedd')
-                )
-            )
-        ).annotate(
-            avg_basket=ExpressionWrapper(
-                F('total') * 1.0 / F('tickets'),
-                output_field=FloatField()
-            ),
-            three_plus_ratio=ExpressionWrapper(
-                (F('three_plus') * 100.0) / F('tickets'),
-                output_field=FloatField()
-            ),
-            one_ratio=ExpressionWrapper(
-                (F('one_count') * 100.0) / F('tickets'),
-                output_field=FloatField()
-            )
-        ).order_by('-total')
-        
-        return location_data
-    
-    # Get data for both years
-    previous_start = start_date.replace(year=previous_year)
-    previous_end = end_date.replace(year=previous_year)
-    
-    current_data = list(get_location_data(current_year, start_date, end_date))
-    previous_data = list(get_location_data(previous_year, previous_start, previous_end))
-    
-    # Create Excel workbook
-    wb = Workbook()
-    
-    # Define styles
-    header_fill = PatternFill(start_color="667EEA", end_color="667EEA", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    total_fill = PatternFill(start_color="E0E7FF", end_color="E0E7FF", fill_type="solid")
-    total_font = Font(bold=True, size=11)
-    info_font = Font(bold=True, size=10)
-    border = Border(
-        left=Side(style='thin', color='CCCCCC'),
-        right=Side(style='thin', color='CCCCCC'),
-        top=Side(style='thin', color='CCCCCC'),
-        bottom=Side(style='thin', color='CCCCCC')
-    )
+    # Big ranges can run into the worker timeout: ?background=1 hands the
+    # report to the job queue (manage.py run_jobs) and returns the job id
+    if request.GET.get('background') == '1':
+        job = enqueue_job(LOCATION_REPORT_JOB, sales_filter.as_params(), request.user)
+        return JsonResponse({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': reverse('job_status', args=[job.id]),
+        }, status=202)
+    
+    filename, content = build_location_report(sales_filter)
     
-    def create_sheet(ws, data, year, sheet_name):
-        """Create a formatted sheet with location data"""
-        ws.title = sheet_name
-        
-        # Add header information
-        ws['A1'] = 'Location Performance Report'
-        ws['A1'].font = Font(bold=True, size=14)
-        
-        ws['A2'] = 'Year:'
-        ws['B2'] = year
-        ws['A2'].font = info_font
-        
-        ws['A3'] = 'Period:'
-        if year == current_year:
-            ws['B3'] = f'{start_date} to {end_date}'
-        else:
-            ws['B3'] = f'{previous_start} to {previous_end}'
-        ws['A3'].font = info_font
-        
-        ws['A4'] = 'Category:'
-        ws['B4'] = selected_category
-        ws['A4'].font = info_font
-        
-        ws['A5'] = 'Product:'
-        ws['B5'] = selected_product if selected_product != 'all' else 'All'
-        ws['A5'].font = info_font
-        
-        ws['A6'] = 'Campaign:'
-        ws['B6'] = selected_campaign if selected_campaign != 'all' else 'All'
-        ws['A6'].font = info_font
-        
-        # Column headers (row 8)
-        headers = [
-            'Location', 'Total Amount', 'Tickets', 'Quantity', 
-            'Avg Basket', '3+ Items', '1 Item', '3+ Ratio (%)', '1 Item Ratio (%)'
-        ]
-        
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=8, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
-        
-        # Data rows
-        row_num = 9
-        total_revenue = 0
-        total_tickets = 0
-        total_quantity = 0
-        total_3plus = 0
-        total_1item = 0
-        
-        for row_data in data:
-            ws.cell(row=row_num, column=1, value=row_data['un'])
-            ws.cell(row=row_num, column=2, value=round(row_data['total'], 2) if row_data['total'] else 0)
-            ws.cell(row=row_num, column=3, value=row_data['tickets'])
-            ws.cell(row=row_num, column=4, value=row_data['quantity'])
-            ws.cell(row=row_num, column=5, value=round(row_data['avg_basket'], 2) if row_data['avg_basket'] else 0)
-            ws.cell(row=row_num, column=6, value=row_data['three_plus'])
-            ws.cell(row=row_num, column=7, value=row_data['one_count'])
-            ws.cell(row=row_num, column=8, value=round(row_data['three_plus_ratio'], 2) if row_data['three_plus_ratio'] else 0)
-            ws.cell(row=row_num, column=9, value=round(row_data['one_ratio'], 2) if row_data['one_ratio'] else 0)
-            
-            # Apply borders
-            for col in range(1, 10):
-                ws.cell(row=row_num, column=col).border = border
-            
-            # Number formatting
-            ws.cell(row=row_num, column=2).number_format = '#,##0.00'
-            ws.cell(row=row_num, column=5).number_format = '#,##0.00'
-            ws.cell(row=row_num, column=8).number_format = '0.00'
-            ws.cell(row=row_num, column=9).number_format = '0.00'
-            
-            # Accumulate totals
-            total_revenue += row_data['total'] or 0
-            total_tickets += row_data['tickets'] or 0
-            total_quantity += row_data['quantity'] or 0
-            total_3plus += row_data['three_plus'] or 0
-            total_1item += row_data['one_count'] or 0
-            
-            row_num += 1
-        
-        # Add totals row
-        row_num += 1
-        avg_basket_total = total_revenue / total_tickets if total_tickets > 0 else 0
-        ratio_3plus = (total_3plus / total_tickets * 100) if total_tickets > 0 else 0
-        ratio_1item = (total_1item / total_tickets * 100) if total_tickets > 0 else 0
-        
-        ws.cell(row=row_num, column=1, value='TOTAL')
-        ws.cell(row=row_num, column=2, value=round(total_revenue, 2))
-        ws.cell(row=row_num, column=3, value=total_tickets)
-        ws.cell(row=row_num, column=4, value=total_quantity)
-        ws.cell(row=row_num, column=5, value=round(avg_basket_total, 2))
-        ws.cell(row=row_num, column=6, value=total_3plus)
-        ws.cell(row=row_num, column=7, value=total_1item)
-        ws.cell(row=row_num, column=8, value=round(ratio_3plus, 2))
-        ws.cell(row=row_num, column=9, value=round(ratio_1item, 2))
-        
-        # Style totals row
-        for col in range(1, 10):
-            cell = ws.cell(row=row_num, column=col)
-            cell.fill = total_fill
-            cell.font = total_font
-            cell.border = border
-        
-        ws.cell(row=row_num, column=2).number_format = '#,##0.00'
-        ws.cell(row=row_num, column=5).number_format = '#,##0.00'
-        ws.cell(row=row_num, column=8).number_format = '0.00'
-        ws.cell(row=row_num, column=9).number_format = '0.00'
-        
-        # Adjust column widths
-        ws.column_dimensions['A'].width = 25
-        for col in range(2, 10):
-            ws.column_dimensions[get_column_letter(col)].width = 15
-    
-    # Create sheets for current and previous year
-    ws_current = wb.active
-    create_sheet(ws_current, current_data, current_year, f'{current_year}')
-    
-    ws_previous = wb.create_sheet(title=f'{previous_year}')
-    create_sheet(ws_previous, previous_data, previous_year, f'{previous_year}')
-    
-    # Create comparison sheet
-    ws_comparison = wb.create_sheet(title='Comparison')
-    ws_comparison['A1'] = f'{previous_year} vs {current_year} Comparison'
-    ws_comparison['A1'].font = Font(bold=True, size=14)
-    
-    # Comparison headers
-    comp_headers = [
-        'Location', 
-        f'{previous_year} Revenue', f'{current_year} Revenue', 'Revenue Change', 'Revenue Change %',
-        f'{previous_year} Tickets', f'{current_year} Tickets', 'Tickets Change', 'Tickets Change %'
-    ]
-    
-    for col, header in enumerate(comp_headers, 1):
-        cell = ws_comparison.cell(row=3, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = border
-    
-    # Create comparison data
-    prev_dict = {row['un']: row for row in previous_data}
-    curr_dict = {row['un']: row for row in current_data}
-    all_locations = sorted(set(list(prev_dict.keys()) + list(curr_dict.keys())))
-    
-    row_num = 4
-    for location in all_locations:
-        prev = prev_dict.get(location, {})
-        curr = curr_dict.get(location, {})
-        
-        prev_revenue = prev.get('total', 0) or 0
-        curr_revenue = curr.get('total', 0) or 0
-        revenue_change = curr_revenue - prev_revenue
-        revenue_change_pct = ((revenue_change / prev_revenue) * 100) if prev_revenue > 0 else 0
-        
-        prev_tickets = prev.get('tickets', 0) or 0
-        curr_tickets = curr.get('tickets', 0) or 0
-        tickets_change = curr_tickets - prev_tickets
-        tickets_change_pct = ((tickets_change / prev_tickets) * 100) if prev_tickets > 0 else 0
-        
-        ws_comparison.cell(row=row_num, column=1, value=location)
-        ws_comparison.cell(row=row_num, column=2, value=round(prev_revenue, 2))
-        ws_comparison.cell(row=row_num, column=3, value=round(curr_revenue, 2))
-        ws_comparison.cell(row=row_num, column=4, value=round(revenue_change, 2))
-        ws_comparison.cell(row=row_num, column=5, value=round(revenue_change_pct, 2))
-        ws_comparison.cell(row=row_num, column=6, value=prev_tickets)
-        ws_comparison.cell(row=row_num, column=7, value=curr_tickets)
-        ws_comparison.cell(row=row_num, column=8, value=tickets_change)
-        ws_comparison.cell(row=row_num, column=9, value=round(tickets_change_pct, 2))
-        
-        # Apply conditional formatting colors
-        for col in [4, 5, 8, 9]:
-            cell = ws_comparison.cell(row=row_num, column=col)
-            value = cell.value
-            if value > 0:
-                cell.font = Font(color="10B981")
-            elif value < 0:
-                cell.font = Font(color="EF4444")
-        
-        # Apply borders
-        for col in range(1, 10):
-            ws_comparison.cell(row=row_num, column=col).border = border
-        
-        row_num += 1
-    
-    # Adjust comparison sheet column widths
-    ws_comparison.column_dimensions['A'].width = 25
-    for col in range(2, 10):
-        ws_comparison.column_dimensions[get_column_letter(col)].width = 16
-    
-    # Create filename
-    filename_parts = [f'location_report_{current_year}_vs_{previous_year}']
-    if selected_locations:
-        filename_parts.append(f'{len(selected_locations)}locations')
-    if selected_category != 'all':
-        filename_parts.append(selected_category.replace(' ', '_'))
-    filename_parts.append(f'{start_date.strftime("%Y%m%d")}-{end_date.strftime("%Y%m%d")}')
-    
-    filename = '_'.join(filename_parts) + '.xlsx'
-    
-    # Create response
     response = HttpResponse(
+        content,
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    wb.save(response)
+    return response
+
+def _get_user_job(request, job_id):
+    """The job if it belongs to the user (admins see every job), else 404"""
+    jobs = BackgroundJob.objects.defer('result')
+    if not getattr(getattr(request.user, 'profile', None), 'is_admin', False):
+        jobs = jobs.filter(created_by=request.user)
+    return get_object_or_404(jobs, id=job_id)
+
+@login_required
+def job_status(request, job_id):
+    """AJAX endpoint polled while a background export runs"""
+    job = _get_user_job(request, job_id)
+    data = {
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.status == BackgroundJob.DONE:
+        data['download_url'] = reverse('job_download', args=[job.id])
+        data['filename'] = job.result_name
+    elif job.status == BackgroundJob.FAILED:
+        data['error'] = job.error.split('\n', 1)[0]
+    return JsonResponse(data)
+
+@login_required
+def job_download(request, job_id):
+    job = _get_user_job(request, job_id)
+    if job.status != BackgroundJob.DONE:
+        return JsonResponse({'error': f'Job is {job.status}'}, status=409)
+    
+    content = BackgroundJob.objects.values_list('result', flat=True).get(id=job.id)
+    response = HttpResponse(bytes(content), content_type=job.result_content_type)
+    response['Content-Disposition'] = f'attachment; filename="{job.result_name}"'
     return response
 
 @login_required
@@ -2067,6 +1452,19 @@ def query(request):
     columns = None
     query_text = ""
     error_message = None
+    has_more = False
+    
+    # Preview page and size - never more than one page of rows leaves the database
+    try:
+        page = max(1, int(request.POST.get('page', 1)))
+    except ValueError:
+        page = 1
+    try:
+        page_size = int(request.POST.get('page_size', default_page_size()))
+    except ValueError:
+        page_size = default_page_size()
+    if page_size not in PAGE_SIZES:
+        page_size = default_page_size()
     
     # Handle Excel export
     if request.method == 'POST' and 'export_excel' in request.POST:
@@ -2074,24 +1472,19 @@ def query(request):
         
         if query_text:
             # Basic SQL injection prevention - allow SELECT and WITH (CTE) statements
-            query_upper = query_text.upper().strip()
-            if not (query_upper.startswith('SELECT') or query_upper.startswith('WITH')):
-                error_message = "Only SELECT queries (including CTEs with WITH) are allowed for security reasons."
-            # Check for dangerous keywords
-            elif any(keyword in query_upper for keyword in ['DROP', 'DELETE', 'INSERT', 'UPDATE', 'ALTER', 'CREATE', 'TRUNCATE', 'EXEC', 'EXECUTE']):
-                error_message = "Detected prohibited SQL keywords. Only SELECT queries are allowed."
-            else:
+            error_message = validate_query(query_text)
+            if not error_message:
                 try:
-                    with connection.cursor() as cursor:
-                        cursor.execute(query_text)
-                        results = cursor.fetchall()
-                        columns = [col[0] for col in cursor.description]
-                    
-                    # Create Excel file
-                    return export_to_excel(results, columns)
+                    # Streamed from a server-side cursor - starts downloading with the first batch
+                    export_format = request.POST.get('export_format', 'xlsx')
+                    if export_format not in EXPORT_FORMATS:
+                        export_format = 'xlsx'
+                    return stream_query_export(
+                        strip_query(query_text), export_format, timeout_ms=export_timeout_ms()
+                    )
                     
                 except Exception as e:
-                    error_message = f"Query Error: {str(e)}"
+                    error_message = describe_error(e, export_timeout_ms())
     
     # Handle regular query execution
     elif request.method == 'POST':
@@ -2099,26 +1492,23 @@ def query(request):
         
         if query_text:
             # Security validation
-            query_upper = query_text.upper().strip()
-            if not (query_upper.startswith('SELECT') or query_upper.startswith('WITH')):
-                error_message = "Only SELECT queries (including CTEs with WITH) are allowed for security reasons."
-            elif any(keyword in query_upper for keyword in ['DROP', 'DELETE', 'INSERT', 'UPDATE', 'ALTER', 'CREATE', 'TRUNCATE', 'EXEC', 'EXECUTE']):
-                error_message = "Detected prohibited SQL keywords. Only SELECT queries are allowed."
-            else:
+            error_message = validate_query(query_text)
+            if not error_message:
                 try:
-                    with connection.cursor() as cursor:
-                        cursor.execute(query_text)
-                        results = cursor.fetchall()
-                        columns = [col[0] for col in cursor.description]
+                    columns, results, has_more = fetch_page(
+                        query_text, page=page, page_size=page_size,
+                        token=request.POST.get('query_token'), user_id=request.user.id
+                    )
                     
                     if not results:
                         messages.info(request, "Query executed successfully but returned no results.")
                     else:
-                        messages.success(request, f"Query executed successfully! {len(results)} rows returned.")
+                        messages.success(request, f"Query executed successfully! {len(results)} rows shown.")
                         
                 except Exception as e:
-                    error_message = f"Query Error: {str(e)}"
+                    error_message = describe_error(e, preview_timeout_ms())
     
+    first_row = (page - 1) * page_size + 1
     context = {
         'results': results,
         'columns': columns,
@@ -2126,79 +1516,29 @@ def query(request):
         'error_message': error_message,
         'user_profile': user_profile,
         'is_admin': user_profile.is_admin,
+        'page': page,
+        'page_size': page_size,
+        'page_sizes': PAGE_SIZES,
+        'has_more': has_more,
+        'first_row': first_row,
+        'last_row': first_row + len(results) - 1 if results else 0,
     }
     
     return render(request, 'query.html', context)
 
-def export_to_excel(results, columns):
-    # Create workbook and worksheet
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Query Results"
-    
-    # Define styles
-    header_font = Font(name='Arial', size=11, bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center')
-    
-    cell_alignment = Alignment(horizontal='left', vertical='center')
-    border = Border(
-        left=Side(style='thin', color='D0D0D0'),
-        right=Side(style='thin', color='D0D0D0'),
-        top=Side(style='thin', color='D0D0D0'),
-        bottom=Side(style='thin', color='D0D0D0')
-    )
-    
-    # Write headers
-    for col_num, column_name in enumerate(columns, 1):
-        cell = ws.cell(row=1, column=col_num, value=column_name)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    # Write data
-    for row_num, row_data in enumerate(results, 2):
-        for col_num, cell_value in enumerate(row_data, 1):
-            cell = ws.cell(row=row_num, column=col_num, value=cell_value)
-            cell.alignment = cell_alignment
-            cell.border = border
-            
-            # Alternate row colors for better readability
-            if row_num % 2 == 0:
-                cell.fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')
-    
-    # Auto-adjust column widths
-    for col_num in range(1, len(columns) + 1):
-        column_letter = get_column_letter(col_num)
-        
-        # Calculate max length in column
-        max_length = len(str(columns[col_num - 1]))
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=col_num, max_col=col_num):
-            for cell in row:
-                try:
-                    if cell.value:
-                        max_length = max(max_length, len(str(cell.value)))
-                except:
-                    pass
-        
-        # Set column width (with some padding)
-        adjusted_width = min(max_length + 2, 50)  # Max width of 50
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Freeze the header row
-    ws.freeze_panes = 'A2'
-    
-    # Create HTTP response
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename=query_results.xlsx'
+@login_required
+def query_cancel(request):
+    """AJAX endpoint: cancel the console query started with ?query_token= (PostgreSQL)"""
+    try:
+        user_profile = request.user.profile
+    except UserProfile.DoesNotExist:
+        return JsonResponse({'error': 'Access denied'}, status=403)
     
-    # Save workbook to response
-    wb.save(response)
+    if not user_profile.is_admin or request.method != 'POST':
+        return JsonResponse({'error': 'Access denied'}, status=403)
     
-    return response
+    cancelled = cancel_query(request.POST.get('query_token', ''), request.user.id)
+    return JsonResponse({'cancelled': cancelled})
 
 @login_required
 def employee_analytics(request):
@@ -2212,185 +1552,46 @@ def employee_analytics(request):
     
     allowed_locations = user_profile.get_allowed_locations()
     
-    # Year selection
-    comparison_mode = request.GET.get('comparison', '2026-2025')
-    if comparison_mode == '2026-2025':
-        current_year, previous_year = 2026, 2025
-    elif comparison_mode == '2026-2024':
-        current_year, previous_year = 2026, 2024
-    else:
-        current_year, previous_year = 2025, 2024
-    
-    # Date parsing
-    start_date_str = request.GET.get('start_date', f'{current_year}-01-01')
-    end_date_str = request.GET.get('end_date', f'{current_year}-12-31')
-    
-    try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-    except:
-        start_date = date(current_year, 1, 1)
-    
-    try:
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-    except:
-        end_date = date(current_year, 12, 31)
-    
-    # Location security check
-    selected_locations = request.GET.getlist('un_filter')
+    # Years, dates, location security check and line filters (no campaigns here)
+    sales_filter = SalesFilter.from_request(
+        request, user_profile, default_comparison='2026-2025',
+        fields=('category', 'employee', 'product')
+    )
+    current_year, previous_year = sales_filter.current_year, sales_filter.previous_year
     
-    if not user_profile.is_admin:
-        if not selected_locations or 'all' in selected_locations:
-            selected_locations = allowed_locations
-        else:
-            unauthorized = set(selected_locations) - set(allowed_locations)
-            if unauthorized:
-                messages.warning(request, f"Access denied to: {', '.join(unauthorized)}")
-                selected_locations = [loc for loc in selected_locations if loc in allowed_locations]
-            if not selected_locations:
-                selected_locations = allowed_locations
-    
-    if not selected_locations and not user_profile.is_admin:
+    if not sales_filter.locations and not user_profile.is_admin:
         return HttpResponseForbidden("You don't have access to any locations.")
     
-    # Display selected location
-    if user_profile.is_admin and (not selected_locations or 'all' in request.GET.getlist('un_filter')):
-        selected_un = 'all'
-        selected_locations = []
-    else:
-        selected_un = selected_locations[0] if len(selected_locations) == 1 else 'multiple'
-    
-    # Other filters
-    selected_category = request.GET.get('category', 'all')
-    selected_employee = request.GET.get('employee_filter', 'all')
-    selected_product = request.GET.get('prod_filter', 'all')
-    
-    # Adjust dates to current year
-    start_date = start_date.replace(year=current_year)
-    end_date = end_date.replace(year=current_year)
-    
-    # Previous year dates
-    previous_start = start_date.replace(year=previous_year)
-    previous_end = end_date.replace(year=previous_year)
-    
-    # Timezone-aware datetimes
-    start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
-    end_datetime = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
-    previous_start_datetime = timezone.make_aware(datetime.combine(previous_start, datetime.min.time()))
-    previous_end_datetime = timezone.make_aware(datetime.combine(previous_end, datetime.max.time()))
-    
-    date_filter_current = {
-        'cd__year': current_year,
-        'cd__gte': start_datetime,
-        'cd__lte': end_datetime
-    }
+    start_date, end_date = sales_filter.start_date, sales_filter.end_date
+    selected_locations = list(sales_filter.locations)
     
-    date_filter_previous = {
-        'cd__year': previous_year,
-        'cd__gte': previous_start_datetime,
-        'cd__lte': previous_end_datetime
-    }
+    # Leaderboards and cross-sell lookups only narrow by location (and category)
+    location_filter = replace(sales_filter, category='all', product='all', employee='all')
+    category_filter = replace(location_filter, category=sales_filter.category)
     
     # ==================== HELPER FUNCTIONS ====================
     
-    def apply_filters(q):
-        if selected_employee != "all" and not selected_locations:
-            return q.none()   # force no cross-location results
-
-        if selected_locations:
-            q = q.filter(un__in=selected_locations)
-
-        if selected_category != "all":
-            q = q.filter(prodg=selected_category)
-
-        if selected_employee != "all":
-            q = q.filter(tanam=selected_employee)
-        
-        if selected_product != "all":
-            q = q.filter(prod=selected_product)
-
-        return q
+    def year_of(is_current):
+        return current_year if is_current else previous_year
     
     def get_base_queryset(is_current=True):
-        """Get base queryset with filters applied"""
-        if is_current:
-            q = Sales.objects.filter(**date_filter_current)
-        else:
-            q = Sales.objects.filter(**date_filter_previous)
-        return apply_filters(q)
+        """Get base queryset with filters applied (test warehouses included)"""
+        return sales_filter.sales(year_of(is_current), exclude_warehouses=False)
     
     # ==================== OPTIMIZED DATA FETCHING ====================
     
     def get_employee_performance_optimized(is_current=True):
         """
-        MASSIVELY OPTIMIZED: Get all employee metrics in minimal queries
-        Uses subqueries and conditional aggregation to avoid N+1 problems
+        Top 20 employees with all metrics, summed from the daily employee
+        snapshots (raw lines in SQL for product filters, see sales_app/employee_stats.py)
         """
-        q = get_base_queryset(is_current)
-        
-        # First, get base employee stats with all standard metrics
-        # This is ONE query that gets all the basic aggregations
-        employee_base_stats = q.values('tanam', 'un').annotate(
-            total_revenue=Sum('tanxa'),
-            total_revenue_skincare_eligible=Sum('tanxa', filter=Q(~Q(prodg='POP'))),
-            skincare_turnover=Sum('tanxa', filter=Q(prodg='SKIN CARE')),
-            total_tickets=Count('zedd', distinct=True),
-            total_items=Count('zedd', filter=Q(~Q(prodg='POP'))),
-            discount_given=Sum('discount_price'),
-            std_price_total=Sum('std_price')
-        ).order_by('-total_revenue')[:20]
-        
-        # Convert to list to avoid re-querying
-        employee_list = list(employee_base_stats)
-        
-        if not employee_list:
-            return []
-        
-        # Get all employee names for batch processing
-        employee_names = [emp['tanam'] for emp in employee_list]
-        
-        # OPTIMIZED: Get cross-selling data for ALL employees in ONE query
-        # Instead of querying each employee separately
-        cross_sell_query = (Sales.objects
-            .filter(**date_filter_current if is_current else date_filter_previous)
-            .filter(prodt='selling item', tanam__in=employee_names)
-            .exclude(tanxa=0)
-            .exclude(prodg='POP'))
-        
-        if selected_locations:
-            cross_sell_query = cross_sell_query.filter(un__in=selected_locations)
-        if selected_category != 'all':
-            cross_sell_query = cross_sell_query.filter(prodg=selected_category)
-        
-        # Get ticket-level item counts for ALL employees at once
-        cross_sell_data = cross_sell_query.values('tanam', 'zedd').annotate(
-            item_count=Count('zedd')
-        )
+        if snapshots_cover(sales_filter):
+            leaderboard = snapshot_employee_leaderboard(sales_filter, category_filter, year_of(is_current))
+        else:
+            leaderboard = employee_leaderboard(sales_filter, category_filter, year_of(is_current))
         
-        # Process cross-selling data by employee
-        employee_cross_sell = {}
-        for record in cross_sell_data:
-            emp_name = record['tanam']
-            if emp_name not in employee_cross_sell:
-                employee_cross_sell[emp_name] = {
-                    'total': 0,
-                    'one_item': 0,
-                    'two_item': 0,
-                    'three_plus': 0
-                }
-            
-            employee_cross_sell[emp_name]['total'] += 1
-            item_count = record['item_count']
-            
-            if item_count == 1:
-                employee_cross_sell[emp_name]['one_item'] += 1
-            elif item_count == 2:
-                employee_cross_sell[emp_name]['two_item'] += 1
-            elif item_count >= 3:
-                employee_cross_sell[emp_name]['three_plus'] += 1
-        
-        # Build final results by combining base stats with cross-sell data
         results = []
-        for emp in employee_list:
+        for emp in leaderboard:
             emp_name = emp['tanam'] or 'Unknown'
             
             # Calculate basic metrics
@@ -2406,20 +1607,13 @@ def employee_analytics(request):
             items_per_ticket = emp['total_items'] / emp['total_tickets'] if emp['total_tickets'] > 0 else 0
             discount_rate = (1 - (emp['discount_given'] / emp['std_price_total'])) * 100 if emp['std_price_total'] and emp['std_price_total'] > 0 else 0
             
-            # Get cross-selling metrics from pre-calculated data
-            cs_data = employee_cross_sell.get(emp_name, {
-                'total': 0,
-                'one_item': 0,
-                'two_item': 0,
-                'three_plus': 0
-            })
-            
-            total_cs_tickets = cs_data['total']
+            # Cross-selling buckets (tickets with 1 / 2 / 3+ selling lines)
+            total_cs_tickets = emp['cs_total']
             
             if total_cs_tickets > 0:
-                cross_sell_pct = (cs_data['three_plus'] / total_cs_tickets) * 100
-                one_item_pct = (cs_data['one_item'] / total_cs_tickets) * 100
-                two_item_pct = (cs_data['two_item'] / total_cs_tickets) * 100
+                cross_sell_pct = (emp['cs_three_plus'] / total_cs_tickets) * 100
+                one_item_pct = (emp['cs_one_item'] / total_cs_tickets) * 100
+                two_item_pct = (emp['cs_two_item'] / total_cs_tickets) * 100
                 three_plus_pct = cross_sell_pct
                 avg_items_per_ticket = items_per_ticket  # Already calculated above
             else:
@@ -2444,197 +1638,52 @@ def employee_analytics(request):
                 'two_item_pct': two_item_pct,
                 'three_plus_pct': three_plus_pct,
                 'avg_items_per_ticket': avg_items_per_ticket,
-                'cross_sell_tickets': cs_data['three_plus'],
-                'one_item_tickets': cs_data['one_item'],
-                'two_item_tickets': cs_data['two_item'],
-                'three_plus_tickets': cs_data['three_plus']
+                'cross_sell_tickets': emp['cs_three_plus'],
+                'one_item_tickets': emp['cs_one_item'],
+                'two_item_tickets': emp['cs_two_item'],
+                'three_plus_tickets': emp['cs_three_plus']
             })
         
         return results
     
-    def get_category_top_performers_optimized(category, is_current=True):
-        """
-        OPTIMIZED: Get top performers for a category with cross-sell data
-        Uses single query instead of one per employee
-        """
-        if is_current:
-            q = Sales.objects.filter(**date_filter_current, prodg=category)
-        else:
-            q = Sales.objects.filter(**date_filter_previous, prodg=category)
-        
-        # Apply location filter only
-        if selected_locations:
-            q = q.filter(un__in=selected_locations)
-        
-        # Get top 10 employees by revenue for this category
-        employee_data = list(
-            q.values('tanam')
-            .annotate(
-                total_revenue=Sum('tanxa'),
-                total_tickets=Count('zedd', distinct=True),
-                total_items=Count('zedd')
-            )
-            .order_by('-total_revenue')[:10]
-        )
-        
-        if not employee_data:
-            return []
-        
-        # Get employee names
-        employee_names = [emp['tanam'] for emp in employee_data]
-        
-        # Get cross-selling data for these specific employees in this category
-        cross_sell_query = (Sales.objects
-            .filter(**date_filter_current if is_current else date_filter_previous)
-            .filter(prodt='selling item', prodg=category, tanam__in=employee_names)
-            .exclude(tanxa=0)
-            .exclude(prodg='POP'))
-        
-        if selected_locations:
-            cross_sell_query = cross_sell_query.filter(un__in=selected_locations)
-        
-        cross_sell_data = cross_sell_query.values('tanam', 'zedd').annotate(
-            item_count=Count('zedd')
-        )
-        
-        # Process cross-selling data
-        employee_cross_sell = {}
-        for record in cross_sell_data:
-            emp_name = record['tanam']
-            if emp_name not in employee_cross_sell:
-                employee_cross_sell[emp_name] = {'total': 0, 'three_plus': 0}
-            
-            employee_cross_sell[emp_name]['total'] += 1
-            if record['item_count'] >= 3:
-                employee_cross_sell[emp_name]['three_plus'] += 1
-        
-        # Build results
-        results = []
-        for emp in employee_data:
-            emp_name = emp['tanam'] or 'Unknown'
-            cs_data = employee_cross_sell.get(emp_name, {'total': 0, 'three_plus': 0})
-            
-            cross_sell_pct = (cs_data['three_plus'] / cs_data['total'] * 100) if cs_data['total'] > 0 else 0
-            
-            results.append({
-                'name': emp_name,
+    def performers_of(rows):
+        """Leaderboard entries of one category from its SQL rows"""
+        return [
+            {
+                'name': emp['tanam'] or 'Unknown',
                 'revenue': float(emp['total_revenue'] or 0),
                 'tickets': emp['total_tickets'],
                 'items': emp['total_items'],
-                'cross_sell_pct': cross_sell_pct
-            })
-        
-        return results
+                'cross_sell_pct': (emp['cs_three_plus'] / emp['cs_total'] * 100) if emp['cs_total'] > 0 else 0
+            }
+            for emp in rows
+        ]
+    
+    def get_category_top_performers_optimized(category, is_current=True):
+        """Top 10 employees of one category with cross-sell data (one query)"""
+        leaders = snapshot_category_leaderboard(replace(location_filter, category=category), year_of(is_current), categories=1)
+        return performers_of(leaders[0]['rows']) if leaders else []
     
     def get_all_category_leaders_optimized(is_current=True):
         """
-        ULTRA-OPTIMIZED: Get top performers for ALL categories in minimal queries
-        Instead of N queries (one per category), uses smart batching
+        Top 10 employees of each of the top 10 categories in ONE query over
+        the daily employee snapshots (ROW_NUMBER per category in SQL)
         """
-        # First, get top categories
-        top_categories_query = Sales.objects.filter(**date_filter_current if is_current else date_filter_previous)
-        if selected_locations:
-            top_categories_query = top_categories_query.filter(un__in=selected_locations)
-        
-        top_categories = list(
-            top_categories_query
-            .values('prodg')
-            .annotate(total=Sum('tanxa'))
-            .order_by('-total')[:10]
-            .values_list('prodg', flat=True)
-        )
-        
-        if not top_categories:
-            return []
-        
-        # Get ALL employee performance across ALL top categories in ONE query
-        q = Sales.objects.filter(**date_filter_current if is_current else date_filter_previous)
-        if selected_locations:
-            q = q.filter(un__in=selected_locations)
-        
-        # Filter to only top categories
-        q = q.filter(prodg__in=top_categories)
-        
-        # Get employee stats per category
-        all_category_stats = list(
-            q.values('prodg', 'tanam')
-            .annotate(
-                total_revenue=Sum('tanxa'),
-                total_tickets=Count('zedd', distinct=True),
-                total_items=Count('zedd')
-            )
-            .order_by('prodg', '-total_revenue')
-        )
-        
-        # Get cross-selling data for all these employees across all categories
-        cross_sell_query = (Sales.objects
-            .filter(**date_filter_current if is_current else date_filter_previous)
-            .filter(prodt='selling item', prodg__in=top_categories)
-            .exclude(tanxa=0)
-            .exclude(prodg='POP'))
-        
-        if selected_locations:
-            cross_sell_query = cross_sell_query.filter(un__in=selected_locations)
-        
-        cross_sell_data = cross_sell_query.values('prodg', 'tanam', 'zedd').annotate(
-            item_count=Count('zedd')
-        )
-        
-        # Process cross-selling data by category and employee
-        category_employee_cs = {}
-        for record in cross_sell_data:
-            cat = record['prodg']
-            emp = record['tanam']
-            key = (cat, emp)
-            
-            if key not in category_employee_cs:
-                category_employee_cs[key] = {'total': 0, 'three_plus': 0}
-            
-            category_employee_cs[key]['total'] += 1
-            if record['item_count'] >= 3:
-                category_employee_cs[key]['three_plus'] += 1
-        
-        # Organize by category and get top 10 per category
-        category_leaders = []
-        for category in top_categories:
-            # Filter stats for this category
-            cat_stats = [s for s in all_category_stats if s['prodg'] == category]
-            
-            # Sort by revenue and take top 10
-            cat_stats.sort(key=lambda x: x['total_revenue'], reverse=True)
-            top_10 = cat_stats[:10]
-            
-            # Build performer list
-            performers = []
-            for emp in top_10:
-                emp_name = emp['tanam'] or 'Unknown'
-                key = (category, emp['tanam'])
-                cs_data = category_employee_cs.get(key, {'total': 0, 'three_plus': 0})
-                
-                cross_sell_pct = (cs_data['three_plus'] / cs_data['total'] * 100) if cs_data['total'] > 0 else 0
-                
-                performers.append({
-                    'name': emp_name,
-                    'revenue': float(emp['total_revenue'] or 0),
-                    'tickets': emp['total_tickets'],
-                    'items': emp['total_items'],
-                    'cross_sell_pct': cross_sell_pct
-                })
-            
-            category_leaders.append({
-                'category': category,
-                'performers_current': performers if is_current else [],
-                'performers_previous': [] if is_current else performers
-            })
-        
-        return category_leaders
+        return [
+            {
+                'category': leader['category'],
+                'performers_current': performers_of(leader['rows']) if is_current else [],
+                'performers_previous': [] if is_current else performers_of(leader['rows'])
+            }
+            for leader in snapshot_category_leaderboard(location_filter, year_of(is_current))
+        ]
     
     # ==================== EXECUTE DATA FETCHING ====================
     
     print("Starting employee analytics data fetch...")
     start_time = timezone.now()
     
-    # Get overall employee performance (2 optimized queries)
+    # Get overall employee performance (1 query per year)
     employees_current = get_employee_performance_optimized(is_current=True)
     employees_previous = get_employee_performance_optimized(is_current=False)
     
@@ -2651,7 +1700,7 @@ def employee_analytics(request):
         emp['revenue_change'] = ((emp['revenue'] - emp['revenue_previous']) / emp['revenue_previous'] * 100) if emp['revenue_previous'] > 0 else 0
         emp['tickets_change'] = ((emp['tickets'] - emp['tickets_previous']) / emp['tickets_previous'] * 100) if emp['tickets_previous'] > 0 else 0
     
-    # Get category leaders (MASSIVELY optimized - was N queries, now ~4 queries total)
+    # Get category leaders (1 query per year)
     category_leaders_current = get_all_category_leaders_optimized(is_current=True)
     category_leaders_previous = get_all_category_leaders_optimized(is_current=False)
     
@@ -2684,7 +1733,7 @@ def employee_analytics(request):
     if user_profile.is_admin:
         all_locations = list(
             Sales.objects
-            .filter(cd__year=current_year)
+            .filter(DateWindow.for_year(current_year).q())
             .values_list('un', flat=True)
             .distinct()
             .order_by('un')
@@ -2693,11 +1742,10 @@ def employee_analytics(request):
         all_locations = allowed_locations
     
     # Base query for filter options - respects location selection
-    filter_base_query = Sales.objects.filter(cd__year=current_year)
-    
-    # Apply location filter to categories and employees
-    if selected_locations:
-        filter_base_query = filter_base_query.filter(un__in=selected_locations)
+    filter_base_query = location_filter.apply(
+        Sales.objects.filter(DateWindow.for_year(current_year).q()),
+        exclude_warehouses=False
+    )
     
     all_categories = list(
         filter_base_query
@@ -2728,7 +1776,7 @@ def employee_analytics(request):
     # ==================== BUILD CONTEXT ====================
     
     context = {
-        'comparison_mode': comparison_mode,
+        'comparison_mode': sales_filter.comparison,
         'current_year': current_year,
         'previous_year': previous_year,
         'date_range_text': date_range_text,
@@ -2743,11 +1791,11 @@ def employee_analytics(request):
         'all_categories': all_categories,
         'all_employees': all_employees,
         'all_products': all_products,
-        'selected_un': selected_un,
+        'selected_un': sales_filter.location_label(user_profile.is_admin),
         'selected_locations': selected_locations,
-        'selected_category': selected_category,
-        'selected_employee': selected_employee,
-        'selected_product': selected_product,
+        'selected_category': sales_filter.category,
+        'selected_employee': sales_filter.employee,
+        'selected_product': sales_filter.product,
         
         'user_profile': user_profile,
         'is_admin': user_profile.is_admin,
@@ -2771,520 +1819,17 @@ def insights(request):
     except:
         return HttpResponseForbidden("Access denied. Contact administrator.")
     
-    # Get allowed locations for this user
-    allowed_locations = user_profile.get_allowed_locations()
-    
-    # Get filter parameters - same as dashboard
-    comparison_mode = request.GET.get('comparison', '2025-2024')
-    if comparison_mode == '2026-2025':
-        current_year = 2026
-        previous_year = 2025
-        two_years_ago = 2024
-    elif comparison_mode == '2026-2024':
-        current_year = 2026
-        previous_year = 2024
-        two_years_ago = None  # Not enough data
-    else:
-        current_year = 2025
-        previous_year = 2024
-        two_years_ago = 2023
-
-    # Get date range
-    start_date_str = request.GET.get('start_date', f'{current_year}-01-01')
-    end_date_str = request.GET.get('end_date', f'{current_year}-12-31')
-    
-    try:
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-    except:
-        start_date = date(current_year, 1, 1)
-    
-    try:
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-    except:
-        end_date = date(current_year, 12, 31)
+    # Years, dates, location security check and line filters
+    sales_filter = SalesFilter.from_request(request, user_profile, default_comparison='2025-2024')
     
-    # Handle location filtering with SECURITY CHECK
-    selected_locations = request.GET.getlist('un_filter')
-    
-    if not user_profile.is_admin:
-        if not selected_locations or 'all' in selected_locations:
-            selected_locations = allowed_locations
-        else:
-            unauthorized = set(selected_locations) - set(allowed_locations)
-            if unauthorized:
-                messages.warning(request, f"Access denied to: {', '.join(unauthorized)}")
-                selected_locations = [loc for loc in selected_locations if loc in allowed_locations]
-            
-            if not selected_locations:
-                selected_locations = allowed_locations
-    
-    if not selected_locations and not user_profile.is_admin:
+    if not sales_filter.locations and not user_profile.is_admin:
         return HttpResponseForbidden("You don't have access to any locations.")
     
-    # If admin selected 'all', reset to empty list
-    if user_profile.is_admin and (not selected_locations or 'all' in request.GET.getlist('un_filter')):
-        selected_locations = []
-    
-    selected_category = request.GET.get('category', 'all')
-    selected_product = request.GET.get('prod_filter', 'all')
-    selected_campaign = request.GET.get('campaign_filter', 'all')
-    
-    # Adjust dates to current year
-    start_date = start_date.replace(year=current_year)
-    end_date = end_date.replace(year=current_year)
-    
-    # Create timezone-aware datetimes
-    start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
-    end_datetime = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
-    
-    def apply_filters(queryset):
-        """Apply consistent filters across all queries"""
-        if selected_locations:
-            queryset = queryset.filter(un__in=selected_locations)
-        if selected_category != 'all':
-            queryset = queryset.filter(prodg=selected_category)
-        if selected_product != 'all':
-            queryset = queryset.filter(prod=selected_product)
-        if selected_campaign != 'all':
-            queryset = queryset.filter(actions=selected_campaign)
-        return queryset.exclude(un__in=["მთავარი საწყობი 2", "სატესტო"])
-    
-    def get_year_stats(year):
-        """Get comprehensive stats for a given year"""
-        year_start = start_date.replace(year=year)
-        year_end = end_date.replace(year=year)
-        year_start_dt = timezone.make_aware(datetime.combine(year_start, datetime.min.time()))
-        year_end_dt = timezone.make_aware(datetime.combine(year_end, datetime.max.time()))
-        
-        q = Sales.objects.filter(
-            cd__year=year,
-            cd__gte=year_start_dt,
-            cd__lte=year_end_dt
-        )
-        q = apply_filters(q)
-        
-        # Basic stats
-        basic_stats = q.aggregate(
-            total_revenue=Sum('tanxa'),
-            total_tickets=Count('zedd', distinct=True),
-            total_items=Count('zedd'),
-            discount_total=Sum('discount_price'),
-            std_price_total=Sum('std_price')
-        )
-        
-        # Calculate derived metrics
-        total_tickets = basic_stats['total_tickets'] or 0
-        total_revenue = float(basic_stats['total_revenue'] or 0)
-        total_items = basic_stats['total_items'] or 0
-        
-        avg_basket = total_revenue / total_tickets if total_tickets > 0 else 0
-        items_per_ticket = total_items / total_tickets if total_tickets > 0 else 0
-        discount_share = (1 - (basic_stats['discount_total'] / basic_stats['std_price_total'])) * 100 if basic_stats['std_price_total'] and basic_stats['std_price_total'] > 0 else 0
-        
-        # Cross-selling stats
-        ticket_items = q.filter(prodt='selling item').exclude(tanxa=0).exclude(prodg='POP').values('zedd').annotate(
-            item_count=Count('idreal1')
-        )
-        
-        total_analyzed_tickets = ticket_items.count()
-        cross_sell_tickets = sum(1 for t in ticket_items if t['item_count'] >= 3)
-        single_item_tickets = sum(1 for t in ticket_items if t['item_count'] == 1)
-        
-        cross_sell_rate = (cross_sell_tickets / total_analyzed_tickets * 100) if total_analyzed_tickets > 0 else 0
-        single_item_rate = (single_item_tickets / total_analyzed_tickets * 100) if total_analyzed_tickets > 0 else 0
-        
-        # Category performance
-        category_data = q.values('prodg').annotate(
-            revenue=Sum('tanxa')
-        ).order_by('-revenue')[:5]
-        
-        # Top products
-        product_data = q.values('prod').annotate(
-            revenue=Sum('tanxa'),
-            quantity=Count('idreal1')
-        ).order_by('-revenue')[:5]
-        
-        # Location performance
-        location_data = q.values('un').annotate(
-            revenue=Sum('tanxa'),
-            tickets=Count('zedd', distinct=True)
-        ).order_by('-revenue')[:5]
-        
-        return {
-            'year': year,
-            'total_revenue': total_revenue,
-            'total_tickets': total_tickets,
-            'total_items': total_items,
-            'avg_basket': avg_basket,
-            'items_per_ticket': items_per_ticket,
-            'discount_share': discount_share,
-            'cross_sell_rate': cross_sell_rate,
-            'single_item_rate': single_item_rate,
-            'top_categories': list(category_data),
-            'top_products': list(product_data),
-            'top_locations': list(location_data)
-        }
-    
-    # Get stats for all available years
-    stats_current = get_year_stats(current_year)
-    stats_previous = get_year_stats(previous_year)
-    stats_two_years = get_year_stats(two_years_ago) if two_years_ago else None
-    
-    # Helper functions
-    def calc_change(current, previous):
-        if previous and previous > 0:
-            return ((current - previous) / previous) * 100
-        return 0
-    
-    def format_currency(value):
-        if value >= 1000000:
-            return f"${value/1000000:.1f}M"
-        elif value >= 1000:
-            return f"${value/1000:.1f}K"
-        return f"${value:.2f}"
-    
-    def format_number(value):
-        if value >= 1000000:
-            return f"{value/1000000:.1f}M"
-        elif value >= 1000:
-            return f"{value/1000:.1f}K"
-        return f"{int(value)}"
-    
-    def get_trend_class(change_pct):
-        if change_pct > 0:
-            return 'positive'
-        elif change_pct < 0:
-            return 'negative'
-        return 'neutral'
-    
-    def get_trend_icon(change_pct):
-        if change_pct > 0:
-            return 'up'
-        elif change_pct < 0:
-            return 'down'
-        return 'right'
-    
-    # Generate insights
-    insights_list = []
-    recommendations = []
-    
-    # Calculate changes
-    revenue_change = calc_change(stats_current['total_revenue'], stats_previous['total_revenue'])
-    tickets_change = calc_change(stats_current['total_tickets'], stats_previous['total_tickets'])
-    basket_change = calc_change(stats_current['avg_basket'], stats_previous['avg_basket'])
-    cross_sell_change = calc_change(stats_current['cross_sell_rate'], stats_previous['cross_sell_rate'])
-    single_item_change = calc_change(stats_current['single_item_rate'], stats_previous['single_item_rate'])
-    
-    # INSIGHT 1: Overall Revenue Performance
-    if abs(revenue_change) > 1:  # Only show if meaningful change
-        revenue_insight = {
-            'category': 'Revenue Analysis',
-            'title': f"Revenue {'Growth' if revenue_change > 0 else 'Decline'} of {abs(revenue_change):.1f}%",
-            'icon': 'fa-chart-line',
-            'icon_class': 'icon-positive' if revenue_change > 0 else 'icon-negative',
-            'description': '',
-            'metrics': [
-                {
-                    'label': f'{current_year} Revenue',
-                    'value': format_currency(stats_current['total_revenue']),
-                    'change': f"{revenue_change:+.1f}%",
-                    'change_class': get_trend_class(revenue_change),
-                    'change_icon': get_trend_icon(revenue_change)
-                },
-                {
-                    'label': f'{previous_year} Revenue',
-                    'value': format_currency(stats_previous['total_revenue']),
-                    'change': None
-                }
-            ],
-            'year_comparison': None
-        }
-        
-        # Generate description based on revenue components
-        if revenue_change > 0:
-            if tickets_change > basket_change:
-                revenue_insight['description'] = f"<p>Your revenue increased by <span class='highlight-positive'>{revenue_change:.1f}%</span> compared to {previous_year}, primarily driven by a <strong>{tickets_change:.1f}% increase in transaction volume</strong>. This indicates strong customer acquisition or increased purchase frequency.</p>"
-            else:
-                revenue_insight['description'] = f"<p>Your revenue grew by <span class='highlight-positive'>{revenue_change:.1f}%</span> year-over-year, with the average basket size increasing by <strong>{basket_change:.1f}%</strong>. Customers are spending more per transaction, suggesting effective upselling or premium product adoption.</p>"
-        else:
-            revenue_insight['description'] = f"<p>Revenue declined by <span class='highlight-negative'>{abs(revenue_change):.1f}%</span> compared to {previous_year}. "
-            if tickets_change < 0 and basket_change < 0:
-                revenue_insight['description'] += f"Both transaction volume (down {abs(tickets_change):.1f}%) and average basket size (down {abs(basket_change):.1f}%) decreased, indicating challenges in both customer retention and purchase value.</p>"
-            elif tickets_change < 0:
-                revenue_insight['description'] += f"This is primarily due to a <strong>{abs(tickets_change):.1f}% decrease in transaction volume</strong>, despite average basket size remaining stable.</p>"
-            else:
-                revenue_insight['description'] += f"While transaction volume increased by {tickets_change:.1f}%, the average basket size decreased by {abs(basket_change):.1f}%, suggesting customers are purchasing less per visit.</p>"
-        
-        insights_list.append(revenue_insight)
-        
-        # Add recommendations based on revenue performance
-        if revenue_change < 0:
-            if tickets_change < -5:
-                recommendations.append("Focus on customer retention and acquisition strategies to reverse the declining transaction volume. Consider loyalty programs or targeted marketing campaigns.")
-            if basket_change < -5:
-                recommendations.append("Implement bundle offers or cross-selling strategies to increase average basket size and maximize value per customer visit.")
-    
-    # INSIGHT 2: Cross-Selling Performance
-    if stats_current['cross_sell_rate'] > 0:
-        cross_sell_insight = {
-            'category': 'Customer Behavior',
-            'title': f"Cross-Selling Rate: {stats_current['cross_sell_rate']:.1f}%",
-            'icon': 'fa-layer-group',
-            'icon_class': 'icon-positive' if cross_sell_change > 0 else 'icon-warning',
-            'description': '',
-            'metrics': [
-                {
-                    'label': 'Cross-Sell Rate',
-                    'value': f"{stats_current['cross_sell_rate']:.1f}%",
-                    'change': f"{cross_sell_change:+.1f}%" if cross_sell_change != 0 else "No change",
-                    'change_class': get_trend_class(cross_sell_change),
-                    'change_icon': get_trend_icon(cross_sell_change)
-                },
-                {
-                    'label': 'Single Item Rate',
-                    'value': f"{stats_current['single_item_rate']:.1f}%",
-                    'change': f"{single_item_change:+.1f}%" if single_item_change != 0 else "No change",
-                    'change_class': 'negative' if single_item_change > 0 else 'positive',
-                    'change_icon': get_trend_icon(single_item_change)
-                }
-            ],
-            'year_comparison': None
-        }
-        
-        if cross_sell_change > 5:
-            cross_sell_insight['description'] = f"<p><strong>Excellent progress!</strong> Your cross-selling rate improved by <span class='highlight-positive'>{cross_sell_change:.1f}%</span>, with <strong>{stats_current['cross_sell_rate']:.1f}% of transactions</strong> containing 3+ items. This indicates effective merchandising and sales techniques.</p>"
-            recommendations.append(f"Continue strengthening cross-selling initiatives. Consider training staff on successful bundling techniques and optimizing product placement.")
-        elif cross_sell_change < -5:
-            cross_sell_insight['description'] = f"<p>Cross-selling performance declined by <span class='highlight-negative'>{abs(cross_sell_change):.1f}%</span>. Only <strong>{stats_current['cross_sell_rate']:.1f}% of customers</strong> are purchasing 3+ items per transaction, down from {stats_previous['cross_sell_rate']:.1f}% last year.</p>"
-            recommendations.append("Develop strategic product bundles and train staff on cross-selling techniques. Consider implementing 'frequently bought together' displays.")
-        else:
-            cross_sell_insight['description'] = f"<p>Your cross-selling rate is stable at <strong>{stats_current['cross_sell_rate']:.1f}%</strong>, with {format_number(stats_current['total_tickets'] * stats_current['cross_sell_rate'] / 100)} multi-item transactions. There's opportunity to further improve customer basket composition.</p>"
-            
-            if stats_current['single_item_rate'] > 30:
-                cross_sell_insight['description'] += f"<p>However, <span class='highlight-warning'>{stats_current['single_item_rate']:.1f}% of transactions</span> are single-item purchases, representing a significant opportunity for improvement.</p>"
-                recommendations.append(f"With {stats_current['single_item_rate']:.1f}% single-item purchases, focus on bundling strategies and point-of-sale suggestions to increase items per basket.")
-        
-        insights_list.append(cross_sell_insight)
-    
-    # INSIGHT 3: Basket Size Trends
-    if abs(basket_change) > 3:
-        basket_insight = {
-            'category': 'Transaction Value',
-            'title': f"Average Basket {'Increased' if basket_change > 0 else 'Decreased'} to ${stats_current['avg_basket']:.2f}",
-            'icon': 'fa-shopping-basket',
-            'icon_class': 'icon-positive' if basket_change > 0 else 'icon-negative',
-            'description': '',
-            'metrics': [
-                {
-                    'label': f'{current_year} Avg Basket',
-                    'value': f"${stats_current['avg_basket']:.2f}",
-                    'change': f"{basket_change:+.1f}%",
-                    'change_class': get_trend_class(basket_change),
-                    'change_icon': get_trend_icon(basket_change)
-                },
-                {
-                    'label': 'Items per Ticket',
-                    'value': f"{stats_current['items_per_ticket']:.1f}",
-                    'change': None
-                }
-            ],
-            'year_comparison': None
-        }
-        
-        items_change = calc_change(stats_current['items_per_ticket'], stats_previous['items_per_ticket'])
-        
-        if basket_change > 0:
-            if items_change > basket_change:
-                basket_insight['description'] = f"<p>The average basket value increased by <span class='highlight-positive'>{basket_change:.1f}%</span> to <strong>${stats_current['avg_basket']:.2f}</strong>, primarily driven by customers purchasing more items per transaction (up {items_change:.1f}%).</p>"
-            else:
-                basket_insight['description'] = f"<p>Average basket size grew by <span class='highlight-positive'>{basket_change:.1f}%</span> to <strong>${stats_current['avg_basket']:.2f}</strong>, indicating customers are trading up to higher-value products or responding well to premium offerings.</p>"
-                recommendations.append("Capitalize on the premium trend by highlighting high-margin products and creating exclusive bundles.")
-        else:
-            basket_insight['description'] = f"<p>The average basket decreased by <span class='highlight-negative'>{abs(basket_change):.1f}%</span> to <strong>${stats_current['avg_basket']:.2f}</strong>. "
-            if items_change < 0:
-                basket_insight['description'] += "Customers are purchasing fewer items per visit, suggesting potential issues with product availability, pricing, or shopping experience.</p>"
-                recommendations.append("Investigate causes of smaller baskets - consider customer feedback surveys and analyze product availability during peak periods.")
-            else:
-                basket_insight['description'] += "While customers are buying similar quantities, they're choosing lower-priced options, possibly due to economic factors or competitive pricing pressure.</p>"
-        
-        insights_list.append(basket_insight)
-    
-    # INSIGHT 4: Category Performance (if available)
-    if stats_current['top_categories']:
-        top_cat = stats_current['top_categories'][0]
-        top_cat_revenue = float(top_cat['revenue'] or 0)
-        top_cat_share = (top_cat_revenue / stats_current['total_revenue'] * 100) if stats_current['total_revenue'] > 0 else 0
-        
-        # Find previous year data for same category
-        prev_cat_data = next((c for c in stats_previous['top_categories'] if c['prodg'] == top_cat['prodg']), None)
-        
-        if prev_cat_data:
-            prev_cat_revenue = float(prev_cat_data['revenue'] or 0)
-            cat_change = calc_change(top_cat_revenue, prev_cat_revenue)
-            
-            category_insight = {
-                'category': 'Category Performance',
-                'title': f"{top_cat['prodg']} Leads with {top_cat_share:.1f}% Share",
-                'icon': 'fa-tags',
-                'icon_class': 'icon-positive' if cat_change > 0 else 'icon-warning',
-                'description': f"<p><strong>{top_cat['prodg']}</strong> is your top-performing category, generating <span class='highlight'>{format_currency(top_cat_revenue)}</span> ({top_cat_share:.1f}% of total revenue). ",
-                'metrics': [
-                    {
-                        'label': 'Category Revenue',
-                        'value': format_currency(top_cat_revenue),
-                        'change': f"{cat_change:+.1f}%",
-                        'change_class': get_trend_class(cat_change),
-                        'change_icon': get_trend_icon(cat_change)
-                    },
-                    {
-                        'label': 'Revenue Share',
-                        'value': f"{top_cat_share:.1f}%",
-                        'change': None
-                    }
-                ],
-                'year_comparison': None
-            }
-            
-            if cat_change > 10:
-                category_insight['description'] += f"This category grew by <span class='highlight-positive'>{cat_change:.1f}%</span> year-over-year, significantly outpacing overall business growth.</p>"
-                recommendations.append(f"Invest in expanding the {top_cat['prodg']} category - increase inventory depth, add complementary products, and feature prominently in marketing.")
-            elif cat_change < -10:
-                category_insight['description'] += f"However, this category declined by <span class='highlight-negative'>{abs(cat_change):.1f}%</span> compared to last year, which is concerning given its importance to your business.</p>"
-                recommendations.append(f"Investigate the decline in {top_cat['prodg']} - analyze pricing, competition, and product freshness. Consider category refresh or promotional support.")
-            else:
-                category_insight['description'] += f"Performance changed by {cat_change:+.1f}% versus last year.</p>"
-            
-            insights_list.append(category_insight)
-    
-    # INSIGHT 5: Location Performance (if filtered or if there's variance)
-    if stats_current['top_locations'] and len(stats_current['top_locations']) > 1:
-        top_loc = stats_current['top_locations'][0]
-        bottom_loc = stats_current['top_locations'][-1]
-        
-        top_loc_revenue = float(top_loc['revenue'] or 0)
-        bottom_loc_revenue = float(bottom_loc['revenue'] or 0)
-        
-        if top_loc_revenue > 0 and bottom_loc_revenue > 0:
-            variance_ratio = top_loc_revenue / bottom_loc_revenue
-            
-            if variance_ratio > 2:  # Significant variance
-                location_insight = {
-                    'category': 'Location Analysis',
-                    'title': 'Significant Performance Variance Across Locations',
-                    'icon': 'fa-map-marker-alt',
-                    'icon_class': 'icon-warning',
-                    'description': f"<p>There's significant performance variance across locations. <strong>{top_loc['un']}</strong> generates {format_currency(top_loc_revenue)}, while <strong>{bottom_loc['un']}</strong> generates {format_currency(bottom_loc_revenue)} - a {variance_ratio:.1f}x difference.</p>",
-                    'metrics': [
-                        {
-                            'label': 'Top Location',
-                            'value': format_currency(top_loc_revenue),
-                            'change': None
-                        },
-                        {
-                            'label': 'Performance Spread',
-                            'value': f"{variance_ratio:.1f}x",
-                            'change': None
-                        }
-                    ],
-                    'year_comparison': None
-                }
-                
-                recommendations.append(f"Analyze best practices from {top_loc['un']} and apply learnings to underperforming locations. Consider staffing, inventory, and local marketing differences.")
-                insights_list.append(location_insight)
-    
-    # INSIGHT 6: Multi-year trend (if we have 3 years of data)
-    if stats_two_years:
-        revenue_3yr_growth = calc_change(stats_current['total_revenue'], stats_two_years['total_revenue'])
-        cagr = (((stats_current['total_revenue'] / stats_two_years['total_revenue']) ** (1/2)) - 1) * 100 if stats_two_years['total_revenue'] > 0 else 0
-        
-        if abs(revenue_3yr_growth) > 10:
-            trend_insight = {
-                'category': 'Long-term Trends',
-                'title': f"{current_year - two_years_ago}-Year Performance Trajectory",
-                'icon': 'fa-chart-area',
-                'icon_class': 'icon-positive' if revenue_3yr_growth > 0 else 'icon-negative',
-                'description': f"<p>Over the past {current_year - two_years_ago} years, revenue {'grew' if revenue_3yr_growth > 0 else 'declined'} by <span class='{'highlight-positive' if revenue_3yr_growth > 0 else 'highlight-negative'}'>{abs(revenue_3yr_growth):.1f}%</span> (CAGR: {cagr:+.1f}%). ",
-                'metrics': [],
-                'year_comparison': [
-                    {
-                        'year': str(current_year),
-                        'stats': [
-                            {'label': 'Revenue', 'value': format_currency(stats_current['total_revenue'])},
-                            {'label': 'Tickets', 'value': format_number(stats_current['total_tickets'])},
-                            {'label': 'Avg Basket', 'value': f"${stats_current['avg_basket']:.2f}"}
-                        ]
-                    },
-                    {
-                        'year': str(previous_year),
-                        'stats': [
-                            {'label': 'Revenue', 'value': format_currency(stats_previous['total_revenue'])},
-                            {'label': 'Tickets', 'value': format_number(stats_previous['total_tickets'])},
-                            {'label': 'Avg Basket', 'value': f"${stats_previous['avg_basket']:.2f}"}
-                        ]
-                    },
-                    {
-                        'year': str(two_years_ago),
-                        'stats': [
-                            {'label': 'Revenue', 'value': format_currency(stats_two_years['total_revenue'])},
-                            {'label': 'Tickets', 'value': format_number(stats_two_years['total_tickets'])},
-                            {'label': 'Avg Basket', 'value': f"${stats_two_years['avg_basket']:.2f}"}
-                        ]
-                    }
-                ]
-            }
-            
-            # Analyze the trend trajectory
-            recent_growth = calc_change(stats_current['total_revenue'], stats_previous['total_revenue'])
-            older_growth = calc_change(stats_previous['total_revenue'], stats_two_years['total_revenue'])
-            
-            if recent_growth > older_growth:
-                trend_insight['description'] += f"Growth is <strong>accelerating</strong> - {current_year} saw {recent_growth:.1f}% growth compared to {older_growth:.1f}% in the prior year.</p>"
-            elif recent_growth < older_growth:
-                trend_insight['description'] += f"Growth is <strong>decelerating</strong> - {current_year} saw {recent_growth:.1f}% growth compared to {older_growth:.1f}% in the prior year.</p>"
-            else:
-                trend_insight['description'] += f"Growth is <strong>consistent</strong> at approximately {recent_growth:.1f}% year-over-year.</p>"
-            
-            insights_list.append(trend_insight)
-    
-    # Prepare summary for the overview section
-    summary = {
-        'total_revenue': format_currency(stats_current['total_revenue']),
-        'revenue_change': f"{abs(revenue_change):.1f}%",
-        'revenue_trend': get_trend_class(revenue_change),
-        'revenue_trend_icon': get_trend_icon(revenue_change),
-        
-        'total_tickets': format_number(stats_current['total_tickets']),
-        'tickets_change': f"{abs(tickets_change):.1f}%",
-        'tickets_trend': get_trend_class(tickets_change),
-        'tickets_trend_icon': get_trend_icon(tickets_change),
-        
-        'avg_basket': f"${stats_current['avg_basket']:.2f}",
-        'basket_change': f"{abs(basket_change):.1f}%",
-        'basket_trend': get_trend_class(basket_change),
-        'basket_trend_icon': get_trend_icon(basket_change),
-        
-        'cross_sell_rate': f"{stats_current['cross_sell_rate']:.1f}",
-        'cross_sell_change': f"{abs(cross_sell_change):.1f}%",
-        'cross_sell_trend': get_trend_class(cross_sell_change),
-        'cross_sell_trend_icon': get_trend_icon(cross_sell_change)
-    }
-    
-    # Date range text
-    date_range_text = f"{start_date.strftime('%b %d')} - {end_date.strftime('%b %d')}, {current_year}"
-    if selected_locations:
-        location_text = ', '.join(selected_locations[:3])
-        if len(selected_locations) > 3:
-            location_text += f" +{len(selected_locations) - 3} more"
-        date_range_text += f" • {location_text}"
+    # Stored payload for the common filters, live computation for the rest
+    payload = stored_insight_payload(sales_filter) or build_insight_payload(sales_filter)
     
     context = {
-        'insights': insights_list,
-        'recommendations': recommendations,
-        'summary': summary,
-        'date_range_text': date_range_text,
-        'current_year': current_year,
-        'previous_year': previous_year,
-        'two_years_ago': two_years_ago,
+        **payload,
 
         'user_profile': user_profile,
         'is_admin': user_profile.is_admin
@@ -3297,17 +1842,8 @@ def health(request):
 
 @login_required
 def stat_main(request):
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            WITH base AS (
-                SELECT "UN", SUM("Tanxa") AS total
-                FROM sales_main_web
-                WHERE extract(year from "CD") = 2026
-                GROUP BY "UN"
-            )
-            SELECT * FROM base ORDER BY total DESC LIMIT 20;
-        """)
-        rows = cursor.fetchall()
+    # Top 20 locations of the year from the cached rollup ranking
+    rows = location_ranking(2026)[:20]
     
     context = {
         'location': rows
@@ -3322,60 +1858,7 @@ def get_filter_options(request):
     except UserProfile.DoesNotExist:
         return JsonResponse({'error': 'Access denied'}, status=403)
     
-    allowed_locations = user_profile.get_allowed_locations()
-    current_year = int(request.GET.get('year', 2026))
-    selected_locations = request.GET.getlist('un_filter')
-    selected_category = request.GET.get('category', 'all')
-    selected_product = request.GET.get('prod_filter', 'all')
-    selected_campaign = request.GET.get('campaign_filter', 'all')
-    
-    base_query = Sales.objects.filter(cd__year=current_year).exclude(
-        un__in=["მთავარი საწყობი 2", "სატესტო"]
+    sales_filter = SalesFilter.from_request(
+        request, user_profile, year=int(request.GET.get('year', 2026)), notify=False
     )
-    
-    # LOCATIONS
-    q_locations = base_query
-    if selected_category != 'all':
-        q_locations = q_locations.filter(prodg=selected_category)
-    if selected_product != 'all':
-        q_locations = q_locations.filter(prod=selected_product)
-    if selected_campaign != 'all':
-        q_locations = q_locations.filter(actions=selected_campaign)
-    available_locations = list(q_locations.values_list('un', flat=True).distinct().order_by('un'))
-    
-    # CATEGORIES
-    q_categories = base_query
-    if selected_locations:
-        q_categories = q_categories.filter(un__in=selected_locations)
-    if selected_product != 'all':
-        q_categories = q_categories.filter(prod=selected_product)
-    if selected_campaign != 'all':
-        q_categories = q_categories.filter(actions=selected_campaign)
-    available_categories = list(q_categories.values_list('prodg', flat=True).distinct().order_by('prodg'))
-    
-    # PRODUCTS
-    q_products = base_query
-    if selected_locations:
-        q_products = q_products.filter(un__in=selected_locations)
-    if selected_category != 'all':
-        q_products = q_products.filter(prodg=selected_category)
-    if selected_campaign != 'all':
-        q_products = q_products.filter(actions=selected_campaign)
-    available_products = list(q_products.values_list('prod', flat=True).distinct().order_by('prod'))
-    
-    # CAMPAIGNS
-    q_campaigns = base_query
-    if selected_locations:
-        q_campaigns = q_campaigns.filter(un__in=selected_locations)
-    if selected_category != 'all':
-        q_campaigns = q_campaigns.filter(prodg=selected_category)
-    if selected_product != 'all':
-        q_campaigns = q_campaigns.filter(prod=selected_product)
-    available_campaigns = list(q_campaigns.values_list('actions', flat=True).distinct().order_by('actions'))
-    
-    return JsonResponse({
-        'locations': available_locations if user_profile.is_admin else allowed_locations,
-        'categories': available_categories,
-        'products': available_products,
-        'campaigns': available_campaigns
-    })
\ No newline at end of file
+    return JsonResponse(calculate_filter_options(sales_filter, user_profile))
\ No newline at end of file